@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+binarize.py
+
+Tesseract に渡す前の適応的二値化（1bit画像）
+- Sauvola / Niblack: 積分画像で局所平均・標準偏差を全画素一括計算（窓サイズに依存しないコスト）
+- 背景正規化: ブロック最大値の縮小マップを拡大した背景で割り、グラデーション・色付き背景を平坦化
+- 出力は np.packbits で詰めた PIL "1" 画像（PNG転送量が小さく、エンジン側の Otsu 二値化も不要）
+- ベンチマーク: python binarize.py bench <コーパス> [lang]
+  （<画像名>.gt.txt があれば文字誤り率 CER も計算）
+"""
+
+import io
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+# ======== 設定 ========
+METHODS = ("none", "otsu", "niblack", "sauvola")
+WINDOW = 41              # 局所窓（3倍拡大後の画素数。文字高さの1〜2倍程度）
+NIBLACK_K = -0.2
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+BG_BLOCK = 32            # 背景正規化のブロックサイズ
+
+
+# ======== 積分画像 ========
+def _box_sum(a: np.ndarray, r: int, axis: int) -> np.ndarray:
+    """累積和の差で axis 方向の窓和（半径 r、端はクリップ）"""
+    n = a.shape[axis]
+    c = np.concatenate([np.zeros_like(a.take([0], axis=axis)), a.cumsum(axis=axis, dtype=a.dtype)], axis=axis)
+    idx = np.arange(n)
+    hi = np.minimum(idx + r + 1, n)
+    lo = np.maximum(idx - r, 0)
+    return c.take(hi, axis=axis) - c.take(lo, axis=axis)
+
+
+def _window_sums(a: np.ndarray, r: int) -> np.ndarray:
+    """積分画像と同じ窓和を縦・横の2パスで（4隅参照より中間配列が少ない）"""
+    return _box_sum(_box_sum(a, r, 0), r, 1)
+
+
+def local_stats(gray: np.ndarray, window: int = WINDOW):
+    """局所平均・局所標準偏差（積分画像で O(画素数)、窓サイズに依存しない）
+
+    窓和は uint32 の整数で計算（3倍拡大後の大きな画像でも float64 より軽い）。累積和は桁あふれで一周するが、
+    窓和そのもの（最大 窓画素数 x 255^2）が 2^32 未満なら差は正確。分散も整数のまま
+    n*Σx² - (Σx)² で求めてから float32 にする（平坦な背景で桁落ちの誤差が出ない）
+    """
+    h, w = gray.shape
+    r = window // 2
+    g = gray.astype(np.uint32)
+    ys = np.arange(h)
+    xs = np.arange(w)
+    count = ((np.minimum(ys + r + 1, h) - np.maximum(ys - r, 0))[:, None] *
+             (np.minimum(xs + r + 1, w) - np.maximum(xs - r, 0))[None, :])
+    sums = _window_sums(g, r)
+    spread = count * _window_sums(g * g, r).astype(np.int64) - sums.astype(np.int64) ** 2
+    n = count.astype(np.float32)
+    mean = sums.astype(np.float32) / n
+    return mean, np.sqrt(spread.astype(np.float32)) / n
+
+
+# ======== 閾値 ========
+def otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    cum = np.cumsum(hist)
+    cum_mean = np.cumsum(hist * np.arange(256))
+    total = cum[-1]
+    w0 = cum / total
+    mu0 = cum_mean / np.maximum(cum, 1)
+    mu1 = (cum_mean[-1] - cum_mean) / np.maximum(total - cum, 1)
+    return int(np.argmax(w0 * (1 - w0) * (mu0 - mu1) ** 2))
+
+
+def niblack(gray: np.ndarray, window: int = WINDOW, k: float = NIBLACK_K) -> np.ndarray:
+    mean, std = local_stats(gray, window)
+    return gray > mean + k * std
+
+
+def sauvola(gray: np.ndarray, window: int = WINDOW, k: float = SAUVOLA_K, r: float = SAUVOLA_R) -> np.ndarray:
+    mean, std = local_stats(gray, window)
+    return gray > mean * (1 + k * (std / r - 1))
+
+
+def normalize_background(gray: np.ndarray, block: int = BG_BLOCK) -> np.ndarray:
+    """背景（ブロック最大値）で割って明るさムラ・色付き背景を除去（暗い文字・明るい背景前提）"""
+    h, w = gray.shape
+    ph, pw = -h % block, -w % block
+    padded = np.pad(gray, ((0, ph), (0, pw)), mode="edge")
+    bmax = padded.reshape(padded.shape[0] // block, block, padded.shape[1] // block, block).max(axis=(1, 3))
+    bg = np.array(Image.fromarray(bmax).resize((w, h), Image.BILINEAR), dtype=np.float64)
+    out = gray.astype(np.float64) / np.maximum(bg, 1.0) * 255.0
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+
+# ======== 適用 ========
+def binarize_array(gray: np.ndarray, method: str = "sauvola", normalize: bool = False,
+                   window: int = WINDOW) -> np.ndarray:
+    """True=背景（白）/ False=文字（黒）の bool 配列（暗背景は反転して明背景に揃える）"""
+    if gray.mean() < 128:
+        gray = 255 - gray
+    if normalize:
+        gray = normalize_background(gray)
+    if method == "otsu":
+        return gray > otsu_threshold(gray)
+    if method == "niblack":
+        return niblack(gray, window)
+    if method == "sauvola":
+        return sauvola(gray, window)
+    raise ValueError(f"未対応の二値化方式: {method} (対応: {', '.join(METHODS)})")
+
+
+def to_1bit_image(binary: np.ndarray) -> Image.Image:
+    """bool 配列 → 行ごとに packbits した PIL "1" 画像（1画素1bit）"""
+    h, w = binary.shape
+    return Image.frombytes("1", (w, h), np.packbits(binary, axis=1).tobytes())
+
+
+def binarize_image(gray, method: str = "sauvola", normalize: bool = False,
+                   window: int = WINDOW) -> Image.Image:
+    """グレースケール（配列 or PIL）→ 1bit PIL 画像。method="none" ならグレースケールのまま"""
+    if isinstance(gray, Image.Image):
+        gray = np.array(gray.convert("L"))
+    if method == "none":
+        return Image.fromarray(normalize_background(gray) if normalize else gray)
+    return to_1bit_image(binarize_array(gray, method, normalize, window))
+
+
+# ======== ベンチマーク ========
+def cer(ref: str, hyp: str) -> float:
+    """文字誤り率（空白除去後のレーベンシュタイン距離 / 正解文字数）"""
+    ref = "".join(ref.split())
+    hyp = "".join(hyp.split())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, rc in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, hc in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rc != hc))
+        prev = cur
+    return prev[-1] / len(ref)
+
+
+def _png_bytes(img: Image.Image) -> int:
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.tell()
+
+
+def benchmark(corpus: Path, lang: str = "jpn+eng", psm: int = 6, upscale: int = 3,
+              tesseract_cmd: Optional[str] = None):
+    """方式ごとの前処理時間・エンジン時間・PNGサイズ・conf・CER"""
+    from ocr_backends import BackendManager, create_default_backends
+
+    tesseract_cmd = (tesseract_cmd or os.environ.get("TESSERACT")
+                     or shutil.which("tesseract") or r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+    backends = BackendManager(create_default_backends(tesseract_cmd), state_file=None, log=lambda _m: None)
+    variants = [(m, False) for m in METHODS] + [("sauvola", True), ("otsu", True)]
+    paths = sorted(p for p in Path(corpus).iterdir()
+                   if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".bmp"))
+
+    stats: Dict[str, Dict[str, List[float]]] = {}
+    for path in paths:
+        gt_path = path.with_suffix(".gt.txt")
+        gt = gt_path.read_text(encoding="utf-8") if gt_path.exists() else None
+        g = np.array(Image.open(path).convert("L"))
+        g = np.array(Image.fromarray(g).resize((g.shape[1] * upscale, g.shape[0] * upscale), Image.BICUBIC))
+        if g.mean() < 128:
+            g = 255 - g
+        for method, norm in variants:
+            name = method + ("+bg" if norm else "")
+            start = time.perf_counter()
+            img = binarize_image(g, method, norm)
+            t_pre = time.perf_counter() - start
+            result = backends.recognize(img, lang, psm, variables={"user_defined_dpi": "300"})
+            s = stats.setdefault(name, {"pre": [], "ocr": [], "bytes": [], "conf": [], "cer": []})
+            s["pre"].append(t_pre)
+            s["ocr"].append(result.elapsed)
+            s["bytes"].append(_png_bytes(img))
+            s["conf"].append(result.mean_conf)
+            if gt is not None:
+                s["cer"].append(cer(gt, result.text))
+
+    print(f"images={len(paths)}, lang={lang}, psm={psm}, backend={backends.names[0] if backends.names else '-'}")
+    print(f"{'method':>12} {'pre ms':>7} {'ocr ms':>7} {'PNG KB':>7} {'conf':>6} {'CER':>6}")
+    for name, s in stats.items():
+        mean = lambda v: sum(v) / len(v) if v else float("nan")
+        print(f"{name:>12} {mean(s['pre']) * 1000:7.1f} {mean(s['ocr']) * 1000:7.0f} "
+              f"{mean(s['bytes']) / 1024:7.1f} {mean(s['conf']):6.1f} {mean(s['cer']):6.3f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "bench":
+        benchmark(Path(sys.argv[2]), *(sys.argv[3:4] or []))
+    else:
+        print("使用方法: python binarize.py bench <コーパス> [lang]")
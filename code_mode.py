@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+code_mode.py
+
+コード・数値向けの高速モード（端末出力・ファイルパス・16進ID・数値）
+- 判定1（画像、OCR前・数ms）: 等幅フォントの字送り
+  行ごとの字形（空白列で区切った塊）の中心間隔が一定ピッチの整数倍に乗っていて、
+  ピッチが行高さの半分程度（半角英数字。和文の全角はほぼ行高さ）なら「コード」
+- 判定2（テキスト、1回目の認識結果）: ASCII率が高く、パス・16進・プロンプト・演算子を含むか
+  （括弧・セミコロンなど文章にも出る記号は2種類以上か2行以上にあるときだけ）
+- コードモード: eng のみ・psm 6（行とインデントを保つ）・紛らわしい活版記号を除外して1回
+  結果が数値/16進だけで conf が低ければ、数値用ホワイトリストでもう1回
+  インデント・桁揃えは単語の位置から復元
+- クリーニングはコードを壊さない最小限（行・インデントはそのまま、活版記号 → ASCII、末尾空白・余分な空行）
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from deskew import ink_mask
+from ocr_backends import OCRResult
+
+# ======== 設定 ========
+CODE_LANG = "eng"
+CODE_PSM = 6                  # 一様なテキストブロック（行・インデントを保ったまま）
+# ホワイトリストにすると " ' \ が pytesseract の config 文字列を通らないため、コード用は除外リストで制限
+TYPOGRAPHIC = "“”‘’„«»—–―…•·°§¶©®™¢£€¥ﬁﬂ"
+CODE_VARIABLES = {"preserve_interword_spaces": "1", "tessedit_char_blacklist": TYPOGRAPHIC}
+NUMERIC_WHITELIST = "0123456789abcdefABCDEFx.,:;+-/#%()_"
+NUMERIC_ACCEPT_CONF = 85.0    # コードモードの結果が数値だけでこれ未満なら数値用ホワイトリストでもう1回
+
+# 画像判定（元画像、拡大前）
+MAX_LINES = 20                # 判定に使う行数の上限（大きな画像でも数ms）
+MIN_LINE_HEIGHT = 6           # これより低い帯（罫線・ノイズ）は使わない
+MIN_ADVANCES = 12             # 字送りがこれ未満なら判定しない（短すぎる）
+PITCH_TOLERANCE = 0.2         # 字形の中心間隔がピッチの整数倍からこの割合以内なら「乗っている」
+MONO_REGULARITY = 0.85        # 乗っている割合がこれ以上なら等幅
+PITCH_RATIO = (0.35, 0.95)    # ピッチ / インクの行高さ（半角英数字。数字だけの行でも 0.9 前後、和文の全角は 1.0 超）
+
+# テキスト判定（1回目の結果）
+MIN_CODE_CHARS = 4
+CODE_ASCII_RATIO = 0.85
+# 1つでコードとみなす記号（文章にはまず出ない）: ドライブ・パス・16進・演算子・行頭プロンプト
+CODE_SIGNS = re.compile(
+    r"[A-Za-z]:\\|(?:^|\s)(?:\.{0,2}/|~/)[\w.-]|\b0x[0-9A-Fa-f]+\b|\b[0-9A-Fa-f]{8,}\b"
+    r"|=>|->|::|==|!=|&&|\|\||^\s*(?:\$|>>>|PS\s)\s", re.M)
+# 文章にも出る弱い記号（「so; yes」「file()」）: 種類が2つ以上そろうか、2行以上に出たらコード
+WEAK_CODE_SIGNS = [re.compile(p, re.M) for p in (
+    r"[{}]", r";\s*$", r"\w\(", r"\\\w", r"^\s*(?:#|>)\s",
+)]
+MIN_WEAK_SIGNS = 2
+NUMERIC_RE = re.compile(r"[0-9A-Fa-fx.,:;+\-/#%()_\s]+")
+
+# エンジン1回分の認識: (画像, lang, psm, variables) → OCRResult
+Recognizer = Callable[[Image.Image, str, int, Dict[str, str]], OCRResult]
+
+
+@dataclass
+class ContentInfo:
+    code: bool = False
+    pitch: float = 0.0         # 推定した等幅ピッチ（px）
+    pitch_ratio: float = 0.0   # ピッチ / 行高さ
+    regularity: float = 0.0    # 字送りがピッチの整数倍に乗っている割合
+    advances: int = 0          # 判定に使った字送りの数
+    elapsed: float = 0.0
+
+
+def _runs(flags: np.ndarray) -> List[Tuple[int, int]]:
+    edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+# ======== 判定 ========
+def detect_code(gray: np.ndarray) -> ContentInfo:
+    """等幅の半角字送りかどうか（投影だけ、OCR試行なし）"""
+    start = time.perf_counter()
+    info = ContentInfo()
+    mask = ink_mask(gray)
+    lines = [(s, e) for s, e in _runs(mask.any(axis=1)) if e - s >= MIN_LINE_HEIGHT][:MAX_LINES]
+    advances, heights = [], []
+    for s, e in lines:
+        glyphs = _runs(mask[s:e].any(axis=0))
+        if len(glyphs) < 3:
+            continue
+        centers = np.array([(gs + ge) / 2 for gs, ge in glyphs])
+        advances.append(np.diff(centers))
+        heights.append(e - s)
+    if advances:
+        d = np.concatenate(advances)
+        info.advances = len(d)
+    if info.advances >= MIN_ADVANCES:
+        # 字送りの大半は1文字分（空白を挟むと2倍以上）→ 下半分の中央値をピッチとする
+        small = d[d <= np.median(d)]
+        info.pitch = float(np.median(small))
+        steps = np.maximum(np.round(d / info.pitch), 1)
+        info.regularity = float(np.mean(np.abs(d / steps - info.pitch) <= info.pitch * PITCH_TOLERANCE))
+        info.pitch_ratio = info.pitch / float(np.median(heights))
+        info.code = (info.regularity >= MONO_REGULARITY
+                     and PITCH_RATIO[0] <= info.pitch_ratio <= PITCH_RATIO[1])
+    info.elapsed = time.perf_counter() - start
+    return info
+
+
+def looks_like_code(text: str) -> bool:
+    """1回目の認識結果がコード・パス・ID・数値らしいか"""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < MIN_CODE_CHARS:
+        return False
+    if sum(ord(c) < 128 for c in chars) / len(chars) < CODE_ASCII_RATIO:
+        return False
+    if CODE_SIGNS.search(text) or is_numeric(text):
+        return True
+    weak = [p for p in WEAK_CODE_SIGNS if p.search(text)]
+    if len(weak) >= MIN_WEAK_SIGNS:
+        return True
+    lines = sum(any(p.search(line) for p in weak) for line in text.splitlines())
+    return lines >= MIN_WEAK_SIGNS
+
+
+def is_numeric(text: str) -> bool:
+    return bool(text.strip()) and NUMERIC_RE.fullmatch(text.strip()) is not None
+
+
+def code_variables(base: Dict[str, str], numeric: bool = False) -> Dict[str, str]:
+    """エンジン変数（base に追加）。numeric なら数値用ホワイトリスト"""
+    v = dict(base)
+    if numeric:
+        v["tessedit_char_whitelist"] = NUMERIC_WHITELIST
+    else:
+        v.update(CODE_VARIABLES)
+    return v
+
+
+# ======== 認識 ========
+def layout_text(result: OCRResult) -> str:
+    """単語の位置からインデント・桁揃え・空行を復元（TSV の単語列は行頭の空白を持たない）"""
+    lines = [words for _, words in result.lines()]
+    if not lines:
+        return ""
+    lines.sort(key=lambda ws: min(w.top for w in ws))
+    pitch = max(float(np.median([w.width / len(w.text) for ws in lines for w in ws])), 1.0)
+    height = float(np.median([w.height for ws in lines for w in ws]))
+    x0 = min(ws[0].left for ws in lines)
+    out, prev_bottom = [], None
+    for words in lines:
+        if prev_bottom is not None and min(w.top for w in words) - prev_bottom > height:
+            out.append("")
+        parts = [" " * round((words[0].left - x0) / pitch), words[0].text]
+        for a, b in zip(words, words[1:]):
+            parts.append(" " * max(1, round((b.left - a.left - a.width) / pitch)))
+            parts.append(b.text)
+        out.append("".join(parts))
+        prev_bottom = max(w.top + w.height for w in words)
+    return "\n".join(out)
+
+
+def recognize_code(pil: Image.Image, engine: Recognizer, base_variables: Dict[str, str]) -> Tuple[str, OCRResult]:
+    """eng のみ・psm 6 で1回（数値だけで conf が低ければ数値用ホワイトリストでもう1回）→ (生テキスト, 結果)"""
+    result = engine(pil, CODE_LANG, CODE_PSM, code_variables(base_variables))
+    text = layout_text(result)
+    if is_numeric(text) and result.mean_conf < NUMERIC_ACCEPT_CONF:
+        alt = engine(pil, CODE_LANG, CODE_PSM, code_variables(base_variables, numeric=True))
+        if alt.mean_conf > result.mean_conf:
+            result, text = alt, layout_text(alt)
+    return text, result
+
+
+# ======== クリーニング ========
+TYPO_MAP = str.maketrans({"“": '"', "”": '"', "„": '"', "«": '"', "»": '"', "‘": "'", "’": "'",
+                          "—": "-", "–": "-", "―": "-", "•": "*", "·": ".", "\u00a0": " ", "\u3000": " "})
+RE_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def code_clean(text: str) -> str:
+    """コードを壊さない最小限の整形（行の結合・空白の除去・辞書補正はしない）"""
+    text = text.translate(TYPO_MAP).replace("…", "...").replace("ﬁ", "fi").replace("ﬂ", "fl")
+    text = "\n".join(line.rstrip() for line in text.splitlines())
+    return RE_BLANK_LINES.sub("\n\n", text).strip("\n")
@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+corpus.py
+
+実キャプチャの記録・再生（オフラインの性能回帰チェック）
+- 記録（任意、RECORD_CORPUS=True のとき）: 取得した元画像・その時の設定・結果（生テキスト/最終テキスト）を保存
+  * 画像は画素内容のハッシュで重複排除（同じ画面を何度読んでも1枚）、PNG で保存
+  * 画像＋設定が同じ記録は1件だけ（最初の結果がベースライン）
+  * PNG 圧縮・書き込みは書き込みスレッド1本（OCRのホットパスは待たない。終了時に close() で書き切る）
+- pack: ディレクトリを1つの zip にまとめる（共有・CI 用。replay は zip をそのまま読める）
+- replay: Linux でも headless で現在のツリーのパイプラインを段階ごとに再実行
+  * preprocess → ocr（tesseract があれば）→ clean。段階ごとの所要時間と出力を記録
+  * 比較対象: --baseline の前回レポート（別バージョンで replay したもの）、無ければ記録時の結果
+  * tesseract が無い・--stages clean のときは記録済みの生テキストでクリーニングだけを比較
+    （advanced_text_cleaning / heuristic_fix のルール変更の確認はこれで十分）
+
+使用方法:
+  python corpus.py list    --corpus D:\\Python\\OCR\\Hotkey_ocr\\corpus
+  python corpus.py pack    --corpus ./corpus --out corpus.zip
+  python corpus.py replay  --corpus corpus.zip --save base.json              # 変更前のツリーで
+  python corpus.py replay  --corpus corpus.zip --baseline base.json          # 変更後のツリーで
+  python corpus.py replay  --corpus corpus.zip --stages clean               # クリーニングだけ
+"""
+
+import argparse
+import atexit
+import difflib
+import hashlib
+import importlib
+import io
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from PIL import Image
+
+# ======== 設定 ========
+RECORDS_FILE = "records.jsonl"
+IMAGES_DIR = "images"
+STAGES = ("preprocess", "ocr", "clean")
+DIFF_LINES = 20              # 出力差分の表示行数（1記録あたり）
+LATENCY_NOISE = 0.10         # これ未満の相対変化は「変化なし」扱い（表示のみ）
+
+
+def image_key(img: Image.Image) -> str:
+    """画素内容のハッシュ（ファイル形式・メタデータの違いは無視）"""
+    h = hashlib.sha1(f"{img.mode}:{img.width}x{img.height}:".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()[:16]
+
+
+def record_id(image: str, source: str, config: Dict[str, Any]) -> str:
+    h = hashlib.sha1(f"{image}:{source}:".encode())
+    h.update(json.dumps(config, sort_keys=True, ensure_ascii=False, default=str).encode())
+    return h.hexdigest()[:16]
+
+
+# ======== 記録 ========
+class CorpusRecorder:
+    """フローの最後に record() を呼ぶだけ。重い処理（ハッシュ・PNG圧縮・追記）は書き込みスレッド1本
+
+    終了時は close()（atexit にも登録）でキューを書き切ってからスレッドを止める。
+    途中で落ちても PNG は一時ファイル → replace、records.jsonl は1記録1回の追記なので
+    壊れた画像や画像の無い記録は残らない。
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        (self.root / IMAGES_DIR).mkdir(parents=True, exist_ok=True)
+        self._ids = {r["id"] for r in iter_records(self.root)}
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._closed = False
+        self.write_errors = 0
+        self._thread = threading.Thread(target=self._run, name="corpus-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, img: Image.Image, source: str, config: Dict[str, Any], raw: str, text: str,
+               elapsed: Optional[float] = None):
+        """source: "hotkey" / "service"。config はその時の設定（replay 時の参考・プロファイル復元用）"""
+        if self._closed:
+            return
+        img = img.copy()     # 呼び出し側がこの後で画像を変更・破棄しても影響しない
+        self._queue.put((img, source, config, raw, text, elapsed))
+
+    def flush(self):
+        """キューに積まれた記録を書き終えるまで待つ"""
+        self._queue.join()
+
+    def close(self):
+        """残りを書き出して書き込みスレッドを止める"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"[corpus] 記録の書き込みに失敗: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, img, source, config, raw, text, elapsed):
+        key = image_key(img)
+        rid = record_id(key, source, config)
+        if rid in self._ids:
+            return
+        path = self.root / IMAGES_DIR / f"{key}.png"
+        if not path.exists():
+            tmp = path.with_suffix(".tmp")
+            img.save(tmp, "PNG", optimize=True)
+            os.replace(tmp, path)
+        entry = {"id": rid, "image": key, "ts": datetime.now().isoformat(timespec="seconds"),
+                 "source": source, "size": list(img.size), "config": config,
+                 "raw": raw, "text": text, "elapsed": round(elapsed, 4) if elapsed is not None else None}
+        with open(self.root / RECORDS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._ids.add(rid)
+
+
+# ======== 読み込み（ディレクトリ / zip） ========
+def _read_bytes(corpus: Path, name: str) -> Optional[bytes]:
+    if corpus.suffix.lower() == ".zip":
+        with zipfile.ZipFile(corpus) as z:
+            try:
+                return z.read(name)
+            except KeyError:
+                return None
+    path = corpus / name
+    return path.read_bytes() if path.exists() else None
+
+
+def iter_records(corpus: Path) -> Iterator[Dict[str, Any]]:
+    data = _read_bytes(Path(corpus), RECORDS_FILE)
+    if not data:
+        return
+    for line in data.decode("utf-8").splitlines():
+        if line.strip():
+            yield json.loads(line)
+
+
+def load_image(corpus: Path, key: str) -> Image.Image:
+    data = _read_bytes(Path(corpus), f"{IMAGES_DIR}/{key}.png")
+    if data is None:
+        raise FileNotFoundError(f"画像がありません: {key}")
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img
+
+
+def pack(corpus: Path, out: Path) -> Path:
+    """記録ディレクトリ → zip（PNG は無圧縮で格納、records.jsonl だけ deflate）"""
+    corpus, out = Path(corpus), Path(out)
+    with zipfile.ZipFile(out, "w") as z:
+        z.write(corpus / RECORDS_FILE, RECORDS_FILE, compress_type=zipfile.ZIP_DEFLATED)
+        for path in sorted((corpus / IMAGES_DIR).glob("*.png")):
+            z.write(path, f"{IMAGES_DIR}/{path.name}", compress_type=zipfile.ZIP_STORED)
+    return out
+
+
+# ======== 再生用パイプライン ========
+@dataclass
+class Pipeline:
+    """現在のツリーの各段階（記録時と同じ関数を使う）"""
+    preprocess: Callable[[Image.Image], Image.Image]
+    ocr: Optional[Callable[[Image.Image], str]]      # 前処理済み画像 → 生テキスト（エンジンが無ければ None）
+    clean: Callable[[str], str]
+
+
+@lru_cache(maxsize=None)
+def _backends(tesseract: str, tessdata_dir: str = ""):
+    from ocr_backends import BackendManager, create_default_backends
+    return BackendManager(create_default_backends(tesseract, tessdata_dir=tessdata_dir))
+
+
+def _hotkey_pipeline(tesseract: str) -> Pipeline:
+    hk = importlib.import_module("hotkey_ocr")
+    if tesseract:
+        from ocr_backends import list_languages
+        hk.TESSERACT = tesseract
+        hk.pytesseract.pytesseract.tesseract_cmd = tesseract
+        hk.BACKENDS = _backends(tesseract, hk.TESSDATA_DIR)
+        hk.VERTICAL_AVAILABLE = hk.VERTICAL_DETECT and all(
+            lang in list_languages(tesseract, hk.TESSDATA_DIR) for lang in hk.LANG_VERTICAL.split("+"))
+    return Pipeline(hk.light_preprocess, (lambda pil: hk.best_candidate(pil)[0]) if tesseract else None,
+                    hk.heuristic_fix)
+
+
+def _service_pipeline(tesseract: str) -> Pipeline:
+    svc = importlib.import_module("working_ocr_service")
+    svc.TESSERACT = tesseract or svc.TESSERACT
+    svc.LOG_FILE = None                 # ログはメモリ上だけ
+    svc.RECORD_CORPUS = False
+    service = svc.WorkingOCRService()
+    service.logger.echo = False
+
+    def ocr(pil):
+        lang, psm = (svc.LANG_VERTICAL, svc.PSM_VERTICAL) if service.is_vertical(pil) else (svc.LANG, svc.PSM)
+        return service.backends.recognize(pil, lang, psm, variables=svc.TESS_VARIABLES).text.strip()
+
+    return Pipeline(service.enhance_image, ocr if tesseract else None, service.advanced_text_cleaning)
+
+
+def _profile_pipeline(base: Pipeline, source: str, profile_dict: Dict[str, Any], tesseract: str) -> Pipeline:
+    """プロファイル一致で記録されたもの: 記録時のプロファイル設定＋現在の前処理・クリーニング実装"""
+    import profiles
+    profile = profiles.CaptureProfile.from_dict(profile_dict)
+    variables = importlib.import_module("hotkey_ocr" if source == "hotkey" else "working_ocr_service").TESS_VARIABLES
+    ocr = None
+    if tesseract:
+        def ocr(pil):
+            result = _backends(tesseract).recognize(pil, profile.lang, profile.psm,
+                                                    variables=profile.engine_variables(variables))
+            return profile.text_of(result)
+    return Pipeline(lambda img: profiles.preprocess(img, profile.preprocess), ocr,
+                    lambda text: profiles.clean(profile, text, base.clean))
+
+
+def _code_pipeline(base: Pipeline, source: str, tesseract: str) -> Pipeline:
+    """コードモードで記録されたもの: 前処理は同じ、eng のみ1回 → コード用の整形"""
+    import code_mode
+    variables = importlib.import_module("hotkey_ocr" if source == "hotkey" else "working_ocr_service").TESS_VARIABLES
+    ocr = None
+    if tesseract:
+        def engine(pil, lang, psm, v):
+            return _backends(tesseract).recognize(pil, lang, psm, variables=v)
+
+        def ocr(pil):
+            return code_mode.recognize_code(pil, engine, variables)[0]
+    return Pipeline(base.preprocess, ocr, code_mode.code_clean)
+
+
+PIPELINES = {"hotkey": _hotkey_pipeline, "service": _service_pipeline}
+
+
+# ======== 再生 ========
+def _timed(func, arg, repeat: int):
+    best, out = None, None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        out = func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+def replay(corpus: Path, stages=STAGES, tesseract: str = "", repeat: int = 1,
+           log: Callable[[str], None] = print) -> Dict[str, Any]:
+    """全記録を現在のツリーで再実行 → {"records": {id: {段階: {"ms", "out"}}}}"""
+    bases: Dict[str, Pipeline] = {}
+    results: Dict[str, Any] = {}
+    for rec in iter_records(corpus):
+        source = rec["source"]
+        if source not in bases:
+            bases[source] = PIPELINES[source](tesseract)
+            # 初回だけの import・辞書構築・正規表現コンパイルを最初の記録の計測に含めない
+            bases[source].preprocess(Image.new("RGB", (64, 32), "white"))
+            bases[source].clean("ウォームアップ warm up")
+        pipeline = bases[source]
+        if rec["config"].get("profile"):
+            pipeline = _profile_pipeline(pipeline, source, rec["config"]["profile"], tesseract)
+        elif rec["config"].get("code"):
+            pipeline = _code_pipeline(pipeline, source, tesseract)
+
+        row: Dict[str, Any] = {}
+        raw = rec.get("raw") or ""
+        if "preprocess" in stages or ("ocr" in stages and pipeline.ocr):
+            pil, elapsed = _timed(pipeline.preprocess, load_image(corpus, rec["image"]), repeat)
+            row["preprocess"] = {"ms": round(elapsed * 1000, 2), "out": image_key(pil)}
+            if "ocr" in stages and pipeline.ocr:
+                raw, elapsed = _timed(pipeline.ocr, pil, repeat)
+                row["ocr"] = {"ms": round(elapsed * 1000, 2), "out": raw}
+        if "clean" in stages and raw:
+            text, elapsed = _timed(pipeline.clean, raw, repeat)
+            row["clean"] = {"ms": round(elapsed * 1000, 2), "out": text}
+        results[rec["id"]] = row
+        log(f"  {rec['id']} {source:>7} {rec['size'][0]}x{rec['size'][1]} "
+            + " ".join(f"{s}={v['ms']:.1f}ms" for s, v in row.items()))
+    return {"created": datetime.now().isoformat(timespec="seconds"), "tree": _tree_version(),
+            "stages": list(stages), "ocr": bool(tesseract), "records": results}
+
+
+def recorded_baseline(corpus: Path) -> Dict[str, Any]:
+    """記録時の結果をレポート形式に（所要時間は無し。出力の比較だけ）"""
+    records = {rec["id"]: {"ocr": {"out": rec.get("raw") or ""}, "clean": {"out": rec.get("text") or ""}}
+               for rec in iter_records(corpus)}
+    return {"tree": "recorded", "records": records}
+
+
+def _tree_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=5).stdout.strip() or "-"
+    except (OSError, subprocess.SubprocessError):
+        return "-"
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], show_diff: bool = True) -> int:
+    """段階ごとの所要時間の差と出力の差分を表示。出力が変わった段階の数を返す"""
+    print(f"\n比較: {baseline.get('tree', '-')} → {current.get('tree', '-')}")
+    totals = {s: [0.0, 0.0, 0, 0] for s in STAGES}     # 前ms, 後ms, 比較件数, 出力変化
+    diffs = []
+    for rid, row in current["records"].items():
+        base_row = baseline["records"].get(rid)
+        if base_row is None:
+            continue
+        for stage, cur in row.items():
+            base = base_row.get(stage)
+            if base is None:
+                continue
+            t = totals[stage]
+            t[2] += 1
+            t[0] += base.get("ms", 0.0)
+            t[1] += cur["ms"]
+            if base["out"] != cur["out"]:
+                t[3] += 1
+                diffs.append((rid, stage, base["out"], cur["out"]))
+
+    changed = 0
+    print(f"{'stage':>10} {'records':>8} {'before':>10} {'after':>10} {'delta':>8} {'changed':>8}")
+    for stage, (before, after, n, n_changed) in totals.items():
+        if not n:
+            continue
+        if before:
+            rel = (after - before) / before
+            delta = f"{rel:+.0%}" if abs(rel) >= LATENCY_NOISE else "~"
+            print(f"{stage:>10} {n:>8} {before:>8.1f}ms {after:>8.1f}ms {delta:>8} {n_changed:>8}")
+        else:
+            print(f"{stage:>10} {n:>8} {'-':>10} {after:>8.1f}ms {'-':>8} {n_changed:>8}")
+        changed += n_changed
+
+    if show_diff:
+        for rid, stage, before, after in diffs:
+            print(f"\n--- {rid} [{stage}]")
+            if stage == "preprocess":
+                print(f"  前処理画像のハッシュ: {before} → {after}")
+                continue
+            lines = list(difflib.unified_diff(before.splitlines(), after.splitlines(), "before", "after", lineterm=""))
+            print("\n".join(lines[:DIFF_LINES]))
+            if len(lines) > DIFF_LINES:
+                print(f"  …ほか {len(lines) - DIFF_LINES} 行")
+    return changed
+
+
+# ======== CLI ========
+def cmd_list(args):
+    n = 0
+    for rec in iter_records(args.corpus):
+        n += 1
+        profile = (rec["config"].get("profile") or {}).get("name", "-")
+        print(f"{rec['id']} {rec['ts']} {rec['source']:>7} {rec['size'][0]}x{rec['size'][1]} "
+              f"profile={profile} chars={len(rec.get('text') or '')}")
+    print(f"{n}件 ({args.corpus})")
+
+
+def cmd_pack(args):
+    out = pack(args.corpus, args.out)
+    print(f"保存しました: {out} ({out.stat().st_size / 1024:.0f}KB)")
+
+
+def cmd_replay(args):
+    stages = tuple(s for s in args.stages.split(",") if s)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"未対応の段階: {', '.join(unknown)} (対応: {', '.join(STAGES)})")
+    tesseract = "" if args.no_ocr else (args.tesseract or shutil.which("tesseract") or "")
+    if "ocr" in stages and not tesseract:
+        print("tesseract が見つからないため ocr 段階は省略（記録済みの生テキストでクリーニング）")
+
+    print(f"再生: {args.corpus} stages={','.join(stages)} repeat={args.repeat}")
+    report = replay(args.corpus, stages, tesseract, args.repeat)
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"レポート: {args.save}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    else:
+        baseline = recorded_baseline(args.corpus)
+    changed = compare(baseline, report, show_diff=not args.quiet)
+    sys.exit(1 if changed and args.fail_on_diff else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="実キャプチャの記録・再生による回帰チェック")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ls = sub.add_parser("list", help="記録の一覧")
+    ls.add_argument("--corpus", type=Path, required=True, help="記録ディレクトリまたは zip")
+    ls.set_defaults(func=cmd_list)
+
+    pk = sub.add_parser("pack", help="記録ディレクトリを zip にまとめる")
+    pk.add_argument("--corpus", type=Path, required=True)
+    pk.add_argument("--out", type=Path, required=True)
+    pk.set_defaults(func=cmd_pack)
+
+    rp = sub.add_parser("replay", help="現在のツリーで再実行して比較")
+    rp.add_argument("--corpus", type=Path, required=True, help="記録ディレクトリまたは zip")
+    rp.add_argument("--stages", default=",".join(STAGES), help="preprocess,ocr,clean のうち実行する段階")
+    rp.add_argument("--baseline", help="比較する前回レポート（省略時は記録時の結果）")
+    rp.add_argument("--save", help="今回のレポートを JSON で保存")
+    rp.add_argument("--tesseract", default="", help="tesseract のパス（省略時は PATH から）")
+    rp.add_argument("--no-ocr", action="store_true", help="エンジンを使わない")
+    rp.add_argument("--repeat", type=int, default=1, help="各段階の繰り返し回数（最小値を採用）")
+    rp.add_argument("--quiet", action="store_true", help="出力の差分を表示しない")
+    rp.add_argument("--fail-on-diff", action="store_true", help="出力が変わったら終了コード1")
+    rp.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
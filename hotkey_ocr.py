@@ -9,8 +9,11 @@ hotkey_ocr_fast_tuned2.py
   * conf フィルタ(65)で短すぎたら 60 に緩めて再構成（OCRはやり直さない）
   * ヒューリスティック補正（“かなの間の1文字漢字”や連続記号など）
   * （任意）低 conf 行のみ再OCR（デフォルトOFF）
+  * 保存済みプロファイル（profiles.py）に一致する領域は候補探索なしでエンジン1回
+  * 端末出力・パス・16進ID・数値（等幅の字送り or 1回目の結果で判定）は eng のみのコードモードで1回
 
 Ctrl+Alt+S : Snipping → OCR
+プロファイルのホットキー : その領域を直接キャプチャ → OCR
 Ctrl+Alt+Q / Esc : Exit
 """
 
@@ -18,19 +21,34 @@ import os
 import time
 import re
 import subprocess
+from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Union, Tuple
+from typing import Iterator, List, Optional, Union, Tuple
 
-import keyboard
-import pyperclip
+try:
+    import keyboard          # corpus.py の replay など headless での import では不要
+    import pyperclip
+except ImportError:
+    keyboard = pyperclip = None
 from PIL import Image, ImageGrab
 import pytesseract
 
 import cv2
 import numpy as np
 import pandas as pd
-from pytesseract import Output
+
+from ocr_backends import BackendError, BackendManager, OCRResult, create_default_backends, list_languages
+from ocr_export import write_exports
+from lexicon import LEXICON_DIR, USER_LEXICON_DIR, load_corrector
+from deskew import DeskewInfo, deskew_array, detect_vertical
+from binarize import binarize_image
+from scheduler import OCRScheduler
+from streaming import StreamChunk, consolidate, iter_bands, partial_text
+from profiles import CaptureProfile, grab_region, load_profiles, match_profile
+from profiles import recognize as recognize_profile
+from corpus import CorpusRecorder
+from code_mode import CODE_LANG, code_clean, detect_code, looks_like_code, recognize_code
 
 # ======== 設定 ========
 TESSERACT = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
@@ -39,6 +57,13 @@ LANG_PRIMARY   = "jpn"        # まずこれ
 LANG_SECONDARY = "jpn+eng"    # 英字が多そうなら一回だけ試す
 
 PSMS = [6, 7]                 # 最大2回
+VERTICAL_DETECT = True        # 縦書き判定（投影プロファイル、数ms）→ 縦書きなら下の設定で1回だけ認識
+LANG_VERTICAL  = "jpn_vert"
+PSM_VERTICAL   = 5            # 縦書きの一様なテキストブロック
+STREAMING = True              # 大きなスニップは帯ごとに認識して途中結果を先に出す
+STREAM_MIN_HEIGHT = 400       # これ以上の高さ（元画像px）のときだけ帯分割
+CODE_MODE = True              # 等幅の半角字送り（数ms）or 1回目の結果がコードらしければ eng のみ・文字制限・psm 6 で1回
+PARALLEL_CANDIDATES = False   # PSMS の候補をワーカープロセスで同時実行（OMP_THREAD_LIMIT の配分は自動調整）
 CONF_TH_INIT  = 65
 CONF_TH_RELAX = 60
 EARLY_ACCEPT_CONF = 86.0      # これ以上なら即決
@@ -47,12 +72,24 @@ MIN_TEXT_LEN  = 10
 RE_OCR_LOWCONF = False        # 低conf行再OCR（必要時だけ True に）
 LINE_CONF_TH   = 70
 
+UPSCALE = 3                   # 前処理の拡大率（構造化出力の座標はこれで割り戻す）
+DESKEW = True                 # 傾き・90°/180°向き補正（縮小コピーで推定、数十ms）
+BINARIZE = "none"             # "none" / "otsu" / "niblack" / "sauvola"（1bit画像でエンジンへ渡す）
+BG_NORMALIZE = False          # 二値化前に背景ムラ・色付き背景を除去
+
 TESSDATA_DIR = ""             # 固定したい場合だけ指定
-EXTRA_FLAGS = f'--tessdata-dir "{TESSDATA_DIR}"' if TESSDATA_DIR else ""
+TESS_VARIABLES = {"user_defined_dpi": "300", "preserve_interword_spaces": "1"}
 
 OUT_DIR = Path(r"D:\Python\OCR\Hotkey_ocr")
 TRIGGER_SNIP = True
 
+EXPORT_FORMATS = ()           # 例: ("json", "hocr", "alto") をテキストと同じ場所に出力
+
+USE_PROFILES = True           # ~/.ocr_profiles.json のプロファイル（サイズ一致 or 専用ホットキー）で候補探索を省略
+
+RECORD_CORPUS = False         # 元画像・設定・結果を記録（python corpus.py replay でオフラインの回帰チェック）
+CORPUS_DIR = OUT_DIR / "corpus"
+
 OPEN_AFTER_SAVE   = True
 OPEN_WITH_NOTEPAD = False
 
@@ -60,7 +97,13 @@ DEBUG = False
 
 # ======== 初期化 ========
 pytesseract.pytesseract.tesseract_cmd = TESSERACT
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+BACKENDS = BackendManager(create_default_backends(TESSERACT, tessdata_dir=TESSDATA_DIR))
+LEXICON = load_corrector(LEXICON_DIR / "terms.txt", LEXICON_DIR / "ja_fixes.tsv", USER_LEXICON_DIR)
+VERTICAL_AVAILABLE = VERTICAL_DETECT and all(
+    lang in list_languages(TESSERACT, TESSDATA_DIR) for lang in LANG_VERTICAL.split("+"))
+SCHEDULER = OCRScheduler(TESSERACT, TESSDATA_DIR) if PARALLEL_CANDIDATES else None
+PROFILES = load_profiles() if USE_PROFILES else []
+RECORDER = CorpusRecorder(CORPUS_DIR) if RECORD_CORPUS else None
 
 # ======== ユーティリティ ========
 def launch_snipping_tool() -> None:
@@ -100,12 +143,24 @@ def unsharp(gray: np.ndarray) -> np.ndarray:
     sharp = cv2.addWeighted(gray, 1.5, blur, -0.5, 0)
     return np.clip(sharp, 0, 255).astype(np.uint8)
 
-def light_preprocess(pil_im: Image.Image) -> Image.Image:
+def preprocess_capture(pil_im: Image.Image) -> Tuple[Image.Image, Optional[DeskewInfo]]:
+    """前処理済み画像と傾き・向き補正の情報（構造化出力の座標を元に戻すため。補正なしなら None）"""
     g = np.array(pil_im.convert("L"))
-    g = cv2.resize(g, None, fx=3, fy=3, interpolation=cv2.INTER_CUBIC)
+    info = None
+    if DESKEW:
+        # 拡大前の元サイズで補正（傾いたままだと全フォールバックを回っても精度が出ない）
+        g, info = deskew_array(g)
+        if DEBUG and info.changed:
+            print(f"  deskew: angle={info.angle}, rotation={info.rotation}, {info.elapsed * 1000:.0f}ms")
+    g = cv2.resize(g, None, fx=UPSCALE, fy=UPSCALE, interpolation=cv2.INTER_CUBIC)
     g = auto_invert_if_needed(g)
     g = unsharp(g)
-    return Image.fromarray(g)
+    if BINARIZE != "none" or BG_NORMALIZE:
+        return binarize_image(g, BINARIZE, BG_NORMALIZE), info
+    return Image.fromarray(g), info
+
+def light_preprocess(pil_im: Image.Image) -> Image.Image:
+    return preprocess_capture(pil_im)[0]
 
 def df_to_text(df: pd.DataFrame, conf_th: Optional[int], jpn: bool) -> str:
     if df.empty:
@@ -131,12 +186,13 @@ KANA = r"ぁ-んァ-ヶー"
 def heuristic_fix(text: str) -> str:
     # かなの間に 1 文字だけ漢字が挟まった場合に削除
     text = re.sub(fr'(?<=[{KANA}])[一-龥々〆ヵヶ](?=[{KANA}])', '', text)
-    # 具体的に気になるパターンはここに追加
-    text = text.replace("で和複製", "で複製")
+    # 具体的に気になるパターンは lexicon/ja_fixes.tsv（または ~/.ocr_lexicon/）に追加
+    text = LEXICON.correct(text)
     # 重複記号の削減
     text = re.sub(r'([=、。．．…])\1+', r'\1', text)
     # 句読点/括弧まわりのスペース整理
-    text = re.sub(r'\s+([、。．，））])', r'\1', text)
+    # （空白の連続は1回で読み、後ろが句読点のときだけ消す。\s+X だと連続の長さの2乗）
+    text = re.sub(r'\s+([、。．，））])?', lambda m: m.group(1) or m.group(0), text)
     text = re.sub(r'（\s+', '（', text)
     return normalize_ws(text)
 
@@ -156,14 +212,26 @@ def score_text(text: str, conf: float) -> float:
     # conf を主、長さと日本語率で微調整
     return conf + min(len(text.strip()) / 500.0, 1.0) + jp_ratio(text) * 0.5
 
-def ocr_df(pil_im: Image.Image, lang: str, psm: int) -> Tuple[pd.DataFrame, float]:
-    config = fr"--psm {psm} --oem 3 -c user_defined_dpi=300 preserve_interword_spaces=1 {EXTRA_FLAGS}"
-    df = pytesseract.image_to_data(pil_im, lang=lang, config=config, output_type=Output.DATAFRAME)
-    if df.empty:
-        return df, 0.0
-    valid = df[df.conf.astype(float) >= 0]
-    mean_conf = valid.conf.mean() if not valid.empty else 0.0
-    return df, float(mean_conf)
+def ocr_result(pil_im: Image.Image, lang: str, psm: int) -> OCRResult:
+    result = BACKENDS.recognize(pil_im, lang, psm, variables=TESS_VARIABLES, tessdata_dir=TESSDATA_DIR)
+    if DEBUG:
+        print(f"  [{result.backend}] lang={lang} psm={psm} {result.elapsed * 1000:.0f}ms")
+    return result
+
+def ocr_candidates(pil_im: Image.Image, lang: str) -> List[OCRResult]:
+    """PSMS の各 psm で認識（PARALLEL_CANDIDATES なら同時実行、失敗時は逐次にフォールバック）"""
+    if SCHEDULER is not None:
+        try:
+            results = SCHEDULER.recognize_candidates(pil_im, [(lang, psm) for psm in PSMS],
+                                                     variables=TESS_VARIABLES)
+            if DEBUG:
+                shape = SCHEDULER.metrics()["shapes"]["candidates"]
+                print(f"  [scheduler] {shape['workers']}x{shape['omp_thread_limit']} ({shape['source']}) "
+                      + ", ".join(f"psm={r.psm} {r.elapsed * 1000:.0f}ms" for r in results))
+            return results
+        except Exception as e:
+            print(f"  並列実行に失敗（逐次で再実行）: {e}")
+    return [ocr_result(pil_im, lang, psm) for psm in PSMS]
 
 def reconstruct_text_from_df(df: pd.DataFrame, lang: str) -> str:
     text = df_to_text(df, CONF_TH_INIT, jpn=("jpn" in lang))
@@ -193,19 +261,38 @@ def reocr_low_conf_lines(pil_im: Image.Image, base_df: pd.DataFrame, lang: str)
         w = (line_df.left + line_df.width).max() - x
         h = (line_df.top + line_df.height).max() - y
         crop = Image.fromarray(rgb[y:y+h, x:x+w])
-        config = fr"--psm 7 --oem 3 -c user_defined_dpi=300 preserve_interword_spaces=1 {EXTRA_FLAGS}"
-        improved = pytesseract.image_to_string(crop, lang=lang, config=config)
+        improved = BACKENDS.recognize(crop, lang, 7, variables=TESS_VARIABLES,
+                                      tessdata_dir=TESSDATA_DIR).text
         out_lines.append(improved.strip() if improved.strip() else line_text)
     return "\n".join(out_lines)
 
-def fast_best_ocr(img: Image.Image) -> Tuple[str, float, int, str]:
-    pil = light_preprocess(img)
+def is_vertical(pil: Image.Image) -> bool:
+    if not VERTICAL_AVAILABLE:
+        return False
+    info = detect_vertical(np.array(pil.convert("L")))
+    if DEBUG:
+        print(f"  vertical={info.vertical} (row_gap={info.row_gap:.2f}, col_gap={info.col_gap:.2f}, "
+              f"columns={info.columns}, glyph_aspect={info.glyph_aspect:.2f}, {info.elapsed * 1000:.1f}ms)")
+    return info.vertical
+
+def best_candidate(pil: Image.Image, vertical: Optional[bool] = None) -> Tuple[str, float, int, str, Optional[OCRResult]]:
+    """前処理済み画像で候補（psm/lang）を探索し、最良の生テキストを返す"""
+    # 0) 縦書きなら jpn_vert で1回だけ（横書きの候補を総当たりしない）
+    if vertical is None:
+        vertical = is_vertical(pil)
+    if vertical:
+        result = ocr_result(pil, LANG_VERTICAL, PSM_VERTICAL)
+        txt = reconstruct_text_from_df(result.to_dataframe(), LANG_VERTICAL)
+        if len(txt.strip()) >= MIN_TEXT_LEN or result.mean_conf >= CONF_TH_RELAX:
+            return txt, result.mean_conf, PSM_VERTICAL, LANG_VERTICAL, result
+        # 判定違いの可能性 → 通常の候補探索へ
 
     # 1) psm6/7 @ jpn
     best_text, best_conf, best_psm, best_lang = "", -1.0, 6, LANG_PRIMARY
+    best_result: Optional[OCRResult] = None
 
-    for psm in PSMS:
-        df, conf = ocr_df(pil, LANG_PRIMARY, psm)
+    for psm, result in zip(PSMS, ocr_candidates(pil, LANG_PRIMARY)):
+        df, conf = result.to_dataframe(), result.mean_conf
         txt = reconstruct_text_from_df(df, LANG_PRIMARY)
 
         if RE_OCR_LOWCONF and not df.empty:
@@ -216,15 +303,22 @@ def fast_best_ocr(img: Image.Image) -> Tuple[str, float, int, str]:
         sc = score_text(txt, conf)
         if sc > score_text(best_text, best_conf):
             best_text, best_conf, best_psm, best_lang = txt, conf, psm, LANG_PRIMARY
+            best_result = result
 
     # 早期 accept
     if (best_conf >= EARLY_ACCEPT_CONF and len(best_text.strip()) >= MIN_TEXT_LEN and jp_ratio(best_text) > 0.6):
-        return heuristic_fix(best_text), best_conf, best_psm, best_lang
+        return best_text, best_conf, best_psm, best_lang, best_result
+
+    # 2) コード・パス・数値らしければコードモードで1回（1回目より良ければ jpn+eng は試さない）
+    if CODE_MODE and looks_like_code(best_text):
+        code = code_candidate(pil)
+        if score_text(code[0], code[1]) > score_text(best_text, best_conf):
+            return code
 
-    # 2) 英字が多そうなら jpn+eng を 1回だけ試す
+    # 3) 英字が多そうなら jpn+eng を 1回だけ試す
     if need_eng(best_text):
-        for psm in PSMS:
-            df, conf = ocr_df(pil, LANG_SECONDARY, psm)
+        for psm, result in zip(PSMS, ocr_candidates(pil, LANG_SECONDARY)):
+            df, conf = result.to_dataframe(), result.mean_conf
             txt = reconstruct_text_from_df(df, LANG_SECONDARY)
 
             if RE_OCR_LOWCONF and not df.empty:
@@ -235,8 +329,83 @@ def fast_best_ocr(img: Image.Image) -> Tuple[str, float, int, str]:
             sc = score_text(txt, conf)
             if sc > score_text(best_text, best_conf):
                 best_text, best_conf, best_psm, best_lang = txt, conf, psm, LANG_SECONDARY
+                best_result = result
 
-    return heuristic_fix(best_text), best_conf, best_psm, best_lang
+    return best_text, best_conf, best_psm, best_lang, best_result
+
+def is_code(img: Image.Image) -> bool:
+    if not CODE_MODE:
+        return False
+    info = detect_code(np.array(img.convert("L")))
+    if DEBUG:
+        print(f"  code={info.code} (pitch={info.pitch:.1f}, ratio={info.pitch_ratio:.2f}, "
+              f"regularity={info.regularity:.2f}, {info.elapsed * 1000:.1f}ms)")
+    return info.code
+
+def code_candidate(pil: Image.Image) -> Tuple[str, float, int, str, Optional[OCRResult]]:
+    """コード・数値モード: eng のみ・文字制限・psm 6 で1回（インデントは単語の位置から復元）"""
+    def engine(im: Image.Image, lang: str, psm: int, variables) -> OCRResult:
+        return BACKENDS.recognize(im, lang, psm, variables=variables, tessdata_dir=TESSDATA_DIR)
+
+    text, result = recognize_code(pil, engine, TESS_VARIABLES)
+    if DEBUG:
+        print(f"  [code] {result.backend} psm={result.psm} {result.elapsed * 1000:.0f}ms")
+    return text, result.mean_conf, result.psm, result.lang, result
+
+def finish_text(raw: str, lang: str) -> str:
+    # コードモード（eng のみはコードモードだけ）は日本語向けの補正を通さない
+    return code_clean(raw) if lang == CODE_LANG else heuristic_fix(raw)
+
+def recognize_capture(img: Image.Image, code: Optional[bool] = None
+                      ) -> Tuple[str, str, float, int, str, Optional[OCRResult], Optional[DeskewInfo]]:
+    """前処理 → 候補探索（コードなら1回）→ 補正。(生テキスト, 最終テキスト, conf, psm, lang, 結果, 傾き補正)"""
+    pil, deskew = preprocess_capture(img)
+    if code is None:
+        code = is_code(img)
+    raw, conf, psm, lang, result = code_candidate(pil) if code else best_candidate(pil)
+    return raw, finish_text(raw, lang), conf, psm, lang, result, deskew
+
+def fast_best_ocr(img: Image.Image) -> Tuple[str, float, int, str, Optional[OCRResult]]:
+    _, text, conf, psm, lang, result, _ = recognize_capture(img)
+    return text, conf, psm, lang, result
+
+def profile_ocr(img: Image.Image, profile: CaptureProfile) -> Tuple[str, float, int, str, Optional[OCRResult]]:
+    """プロファイル一致: 候補探索なしで固定の前処理・lang/psm・ホワイトリストでエンジン1回"""
+    def engine(pil: Image.Image, lang: str, psm: int, variables) -> OCRResult:
+        return BACKENDS.recognize(pil, lang, psm, variables=variables, tessdata_dir=TESSDATA_DIR)
+
+    text, result, t_pre = recognize_profile(profile, img, engine, TESS_VARIABLES, heuristic_fix)
+    if DEBUG:
+        print(f"  [profile {profile.name}] pre={t_pre * 1000:.0f}ms {result.backend} "
+              f"lang={result.lang} psm={result.psm} {result.elapsed * 1000:.0f}ms")
+    return text, result.mean_conf, result.psm, result.lang, result
+
+def stream_ocr(pil: Image.Image) -> Iterator[StreamChunk]:
+    """前処理済み画像（全体で1回）を帯ごとに認識。認識できた帯から順に返す
+
+    候補探索（psm/lang・コードモード）は最初の帯だけ。以降の帯は選ばれた psm/lang でエンジン1回
+    （帯ごとに探索すると帯数倍のエンジン呼び出しになり、全体の完了が非ストリーミングより遅れる）
+    """
+    vertical = is_vertical(pil)
+    chosen = {}
+
+    def recognize_band(band: Image.Image):
+        if not chosen:
+            text, conf, psm, lang, result = best_candidate(band, vertical)
+            if result is not None:
+                chosen.update(psm=psm, lang=lang)
+            return text, conf, result
+        if chosen["lang"] == CODE_LANG:
+            text, conf, _, _, result = code_candidate(band)
+            return text, conf, result
+        result = ocr_result(band, chosen["lang"], chosen["psm"])
+        return reconstruct_text_from_df(result.to_dataframe(), chosen["lang"]), result.mean_conf, result
+
+    if vertical:
+        # 縦書きは横帯に切ると列が分断されるので全体を1帯で
+        return iter_bands(pil, recognize_band, first_height=pil.height, clean_lang=finish_text)
+    # コードモードで読んだ帯（lang=eng）は finish_text で code_clean に回す
+    return iter_bands(pil, recognize_band, clean_lang=finish_text)
 
 def open_with_notepad(path: Path) -> None:
     if OPEN_WITH_NOTEPAD:
@@ -245,18 +414,69 @@ def open_with_notepad(path: Path) -> None:
     else:
         os.startfile(path)
 
-def ocr_and_output(img: Image.Image) -> Path:
-    text, conf, psm, lang = fast_best_ocr(img)
-
-    pyperclip.copy(text)
+def record_capture(img: Image.Image, profile: Optional[CaptureProfile], streamed: bool, code: bool,
+                   raw: str, text: str, result: Optional[OCRResult], elapsed: float) -> None:
+    config = {"lang": LANG_PRIMARY, "lang_secondary": LANG_SECONDARY, "psms": PSMS, "upscale": UPSCALE,
+              "deskew": DESKEW, "binarize": BINARIZE, "bg_normalize": BG_NORMALIZE, "variables": TESS_VARIABLES,
+              "streaming": streamed, "code": code, "profile": asdict(profile) if profile else None,
+              "backend": result.backend if result else None}
+    RECORDER.record(img, "hotkey", config, raw, text, elapsed)
 
+def ocr_and_output(img: Image.Image, profile: Optional[CaptureProfile] = None) -> Path:
     out = OUT_DIR / f"{datetime.now():%Y%m%d_%H%M%S}.txt"
+    start = time.perf_counter()
+
+    if profile is None:
+        profile = match_profile(PROFILES, img.size)
+    # コードは eng の1回で速いので帯分割しない
+    code = profile is None and is_code(img)
+    streamed = profile is None and not code and STREAMING and img.height >= STREAM_MIN_HEIGHT
+    deskew = None
+    if profile is not None:
+        print(f"  profile: {profile.name}")
+        text, conf, psm, lang, result = profile_ocr(img, profile)
+        raw = profile.text_of(result)
+    elif streamed:
+        # 帯ごとにクリップボード・ファイルを更新し、最後に全体をまとめてクリーニングし直す
+        pil, deskew = preprocess_capture(img)
+        chunks = []
+        try:
+            for chunk in stream_ocr(pil):
+                chunks.append(chunk)
+                partial = partial_text(chunks)
+                pyperclip.copy(partial)
+                out.write_text(partial, encoding="utf-8-sig")
+                print(f"  band {chunk.index + 1}/{chunk.total}: +{len(chunk.text)}文字 ({chunk.elapsed:.2f}s)")
+        except BackendError as e:
+            # 認識済みの帯までは結果として残す
+            total = chunks[-1].total if chunks else "?"
+            print(f"  band {len(chunks) + 1}/{total}: OCRに失敗（認識済みの{len(chunks)}帯分を保存）: {e}")
+        text, conf, result = consolidate(chunks, clean_lang=finish_text)
+        raw = "\n".join(c.raw for c in chunks if c.raw.strip())
+        psm = result.psm if result else PSMS[0]
+        lang = result.lang if result else LANG_PRIMARY
+    else:
+        raw, text, conf, psm, lang, result, deskew = recognize_capture(img, code)
+
+    pyperclip.copy(text)
     out.write_text(text, encoding="utf-8-sig")
 
+    if EXPORT_FORMATS and result is not None:
+        # 認識済みの結果から生成（エンジンは再実行しない）。傾き・向き補正したなら座標を元に戻す
+        if profile is not None and profile.deskews:
+            print("  構造化出力: プロファイルの前処理に deskew があるため座標を戻せず省略")
+        else:
+            unmap = deskew.unmap if deskew is not None and deskew.changed else None
+            write_exports(result, out, EXPORT_FORMATS, scale=profile.scale if profile else UPSCALE,
+                          page_size=img.size, joiner="" if "jpn" in lang else " ", unmap=unmap)
+
     if OPEN_AFTER_SAVE:
         open_with_notepad(out)
 
     print(f"  conf={conf:.1f}, psm={psm}, lang={lang}, len={len(text)}")
+    if RECORDER is not None:
+        code = profile is None and not streamed and lang == CODE_LANG     # 1回目の結果からの切り替えも含む
+        record_capture(img, profile, streamed, code, raw, text, result, time.perf_counter() - start)
     return out
 
 # ======== Hotkey ========
@@ -273,20 +493,44 @@ def do_flow():
     out = ocr_and_output(img)
     print(f"✔ OCR 完了 → クリップボードへコピー / {out}")
 
+def do_profile_flow(profile: CaptureProfile):
+    # スニップなしでプロファイルの領域を直接キャプチャ
+    img = grab_region(profile)
+    if img is None:
+        print(f"✖ プロファイル {profile.name} に領域がありません")
+        return
+    out = ocr_and_output(img, profile)
+    print(f"✔ OCR 完了 ({profile.name}) → クリップボードへコピー / {out}")
+
 def main():
     print("=== Hotkey OCR Launcher (fast tuned2) ===")
     print("Ctrl+Alt+S : Snipping → OCR")
     print("Ctrl+Alt+Q / Esc : Exit")
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
     print("OUT_DIR   :", OUT_DIR.resolve())
     print("Tesseract :", pytesseract.get_tesseract_version())
+    print("Backend   :", BACKENDS.select(lang=LANG_PRIMARY, psm=PSMS[0]))
     print("LANG_PRIMARY   :", LANG_PRIMARY)
     print("LANG_SECONDARY :", LANG_SECONDARY)
     print("PSMS      :", PSMS)
+    print("VERTICAL  :", f"{LANG_VERTICAL} psm={PSM_VERTICAL}" if VERTICAL_AVAILABLE
+          else ("❌ " + LANG_VERTICAL + " 未インストール" if VERTICAL_DETECT else False))
+    print("CODE_MODE :", f"{CODE_LANG} (等幅判定 / 1回目の結果)" if CODE_MODE else False)
+    print("PARALLEL_CANDIDATES:", PARALLEL_CANDIDATES,
+          f"(cores={SCHEDULER.cores})" if SCHEDULER is not None else "")
     print("CONF_TH   :", CONF_TH_INIT, " (relax ->", CONF_TH_RELAX, ")")
     print("EARLY_ACCEPT_CONF:", EARLY_ACCEPT_CONF)
     print("RE_OCR_LOWCONF   :", RE_OCR_LOWCONF, "(line_conf_th =", LINE_CONF_TH, ")")
+    print("EXPORT_FORMATS   :", EXPORT_FORMATS or "-")
+    print("DESKEW           :", DESKEW)
+    print("STREAMING        :", STREAMING, f"(height >= {STREAM_MIN_HEIGHT}px)" if STREAMING else "")
+    print("RECORD_CORPUS    :", CORPUS_DIR if RECORD_CORPUS else False)
+    print("PROFILES         :", ", ".join(f"{p.name}({p.hotkey or 'auto'})" for p in PROFILES) or "-")
 
     keyboard.add_hotkey("ctrl+alt+s", do_flow)
+    for profile in PROFILES:
+        if profile.hotkey:
+            keyboard.add_hotkey(profile.hotkey, do_profile_flow, args=(profile,))
     keyboard.add_hotkey("ctrl+alt+q", lambda: (_ for _ in ()).throw(SystemExit))
     keyboard.add_hotkey("esc",        lambda: (_ for _ in ()).throw(SystemExit))
 
@@ -295,6 +539,11 @@ def main():
             time.sleep(1.0)
     except SystemExit:
         print("Bye!")
+    finally:
+        if SCHEDULER is not None:
+            SCHEDULER.shutdown()
+        if RECORDER is not None:
+            RECORDER.close()
 
 if __name__ == "__main__":
     main()
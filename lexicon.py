@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+lexicon.py
+
+辞書（レキシコン）ベースのOCR後補正
+- 用語ファイル (*.txt: 1行1語) と置換ファイル (*.tsv: 誤り<TAB>正解) を読み込み、起動時に1回だけ索引化
+- 用語は OCR 混同モデル（1/l/I, 0/O, rn/m, 濁点・半濁点、似た形のカナ）で正規化した
+  「骨格」と、その1文字削除（symmetric delete）で索引化 → 1トークンあたりほぼ定数時間
+- 置換はトライ的な先頭文字+長さ索引で全文1パス（語数を増やしても1回あたりのコストは増えない）
+
+用語ファイルの書式:
+    # コメント
+    PowerShell
+置換ファイルの書式（右辺が空なら削除）:
+    誤認識<TAB>正解
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+# ======== 設定 ========
+LEXICON_DIR = Path(__file__).resolve().parent / "lexicon"
+USER_LEXICON_DIR = Path.home() / ".ocr_lexicon"      # ユーザー辞書（*.txt / *.tsv）
+
+MIN_ASCII_LEN = 5     # これより短い英字トークンは編集距離補正しない
+MIN_KANA_LEN = 4      # カタカナ連続のトークン
+
+# OCR混同モデル（小文字化後の文字 → 代表文字）
+CONFUSION_GROUPS = [
+    ("l", "l1i|!"),
+    ("o", "o0"),
+    ("s", "s5"),
+    ("ン", "ンソ"),
+    ("シ", "シツ"),
+    ("バ", "バパ"), ("ビ", "ビピ"), ("ブ", "ブプ"), ("ベ", "ベペ"), ("ボ", "ボポ"),
+]
+CONFUSION_MULTI = [("rn", "m"), ("vv", "w"), ("cl", "d")]
+NOISE_CHARS = "+"     # トークン内のノイズ（骨格では無視）
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9+|!]*|[ァ-ヶー]+")
+SUSPICIOUS_RE = re.compile(r"[A-Za-z][0-9|!+]|[0-9|!+][A-Za-z]|[a-z][LIO]")
+# カナの1文字差で補正してよいのは OCR で落ち・増えしやすい長音・小書き文字だけ
+# （ア/ル のような置換は別の正しい語のことが多い: ファイア・ファイブ → ファイル にしない）
+KANA_DROPPABLE = "ーッャュョァィゥェォヮ"
+KANA_SMALL = str.maketrans("ッャュョァィゥェォヮヵヶ", "ツヤユヨアイウエオワカケ")
+
+
+def _build_char_map() -> Dict[int, str]:
+    table: Dict[int, str] = {}
+    for canonical, chars in CONFUSION_GROUPS:
+        for c in chars:
+            table.setdefault(ord(c), canonical)
+    for c in NOISE_CHARS:
+        table[ord(c)] = ""
+    return table
+
+
+CHAR_MAP = _build_char_map()
+
+
+def skeleton(token: str) -> str:
+    """混同しやすい文字を代表文字に寄せた正規形"""
+    s = token.lower()
+    for src, dst in CONFUSION_MULTI:
+        s = s.replace(src, dst)
+    return s.translate(CHAR_MAP)
+
+
+def deletes1(s: str) -> Set[str]:
+    return {s[:i] + s[i + 1:] for i in range(len(s))}
+
+
+def _case_like(term: str, token: str) -> str:
+    """先頭文字の大文字・小文字をトークンに合わせる"""
+    if not token[:1].isalpha() or not term[:1].isalpha():
+        return term
+    if token[0].islower() and term[0].isupper():
+        return term.lower()
+    if token[0].isupper() and term[0].islower():
+        return term[0].upper() + term[1:]
+    return term
+
+
+def _kana_slip(token: str, term: str) -> bool:
+    """カナの1文字差が 長音・小書き文字の落ち/増え、小書き/並字 か 濁点・半濁点の付け外し だけか"""
+    if len(token) == len(term):
+        diff = [(a, b) for a, b in zip(token, term) if a != b]
+        if len(diff) != 1:
+            return False
+        a, b = (c.translate(KANA_SMALL) for c in diff[0])
+        return unicodedata.normalize("NFD", a)[0] == unicodedata.normalize("NFD", b)[0]
+    short, long_ = sorted((token, term), key=len)
+    if len(long_) - len(short) != 1:
+        return False
+    for i, c in enumerate(long_):
+        if long_[:i] + long_[i + 1:] == short:
+            return c in KANA_DROPPABLE
+    return False
+
+
+class LexiconCorrector:
+    """用語索引 + 置換索引による1パス補正"""
+
+    def __init__(self):
+        self.terms: Set[str] = set()
+        self.by_skeleton: Dict[str, List[str]] = {}
+        self.by_delete: Dict[str, List[str]] = {}
+        self.replacements: Dict[str, str] = {}
+        self._lengths: Dict[str, List[int]] = {}   # 先頭文字 → 置換キー長（降順）
+
+    # ---- 構築 ----
+    def add_term(self, term: str):
+        term = term.strip()
+        if not term or term in self.terms:
+            return
+        self.terms.add(term)
+        sk = skeleton(term)
+        self.by_skeleton.setdefault(sk, []).append(term)
+        if len(sk) >= MIN_KANA_LEN:
+            for d in deletes1(sk):
+                self.by_delete.setdefault(d, []).append(term)
+
+    def add_replacement(self, wrong: str, right: str):
+        if not wrong:
+            return
+        if wrong not in self.replacements:
+            lengths = self._lengths.setdefault(wrong[0], [])
+            if len(wrong) not in lengths:
+                lengths.append(len(wrong))
+                lengths.sort(reverse=True)
+        self.replacements[wrong] = right
+
+    def load_file(self, path: Path):
+        path = Path(path)
+        for raw in path.read_text(encoding="utf-8-sig").splitlines():
+            if not raw.strip() or raw.lstrip().startswith("#"):
+                continue
+            if path.suffix == ".tsv":
+                wrong, _, right = raw.partition("\t")
+                self.add_replacement(wrong, right)
+            else:
+                self.add_term(raw)
+
+    def load(self, paths: Iterable[Path]) -> "LexiconCorrector":
+        """ファイルまたはディレクトリ（*.txt, *.tsv）を読み込む。存在しないものは無視"""
+        for p in paths:
+            p = Path(p)
+            if p.is_dir():
+                for f in sorted(p.glob("*.txt")) + sorted(p.glob("*.tsv")):
+                    self.load_file(f)
+            elif p.is_file():
+                self.load_file(p)
+        return self
+
+    # ---- 補正 ----
+    def replace_phrases(self, text: str) -> str:
+        """置換を1パスで適用（各位置で最長一致）"""
+        if not self.replacements:
+            return text
+        out = []
+        i, n = 0, len(text)
+        start = 0
+        lengths_for = self._lengths
+        repl = self.replacements
+        while i < n:
+            lengths = lengths_for.get(text[i])
+            if lengths:
+                for length in lengths:
+                    right = repl.get(text[i:i + length])
+                    if right is not None:
+                        out.append(text[start:i])
+                        out.append(right)
+                        i += length
+                        start = i
+                        break
+                else:
+                    i += 1
+            else:
+                i += 1
+        out.append(text[start:])
+        return "".join(out)
+
+    def correct_token(self, token: str) -> str:
+        if token in self.terms:
+            return token
+        is_kana = token[0] >= "ァ"
+        core = token.rstrip("+|!")
+        tail = token[len(core):]
+        if not core or core.isdigit():
+            return token
+        sk = skeleton(core)
+        candidates = self.by_skeleton.get(sk)
+        if not candidates:
+            min_len = MIN_KANA_LEN if is_kana else MIN_ASCII_LEN
+            if len(sk) < min_len or (not is_kana and not SUSPICIOUS_RE.search(token)):
+                return token
+            candidates = self._lookup_distance1(sk)
+            if is_kana and candidates:
+                candidates = [t for t in candidates if _kana_slip(core, t)]
+            if not candidates:
+                return token
+        return self._pick(candidates, core) + tail
+
+    def _lookup_distance1(self, sk: str) -> Optional[List[str]]:
+        # symmetric delete: 欠落 / 余分 / 置換 の1文字差を索引引きだけで判定
+        found = list(self.by_delete.get(sk, []))
+        for d in deletes1(sk):
+            found += self.by_skeleton.get(d, [])
+            found += self.by_delete.get(d, [])
+        if not found:
+            return None
+        unique = list(dict.fromkeys(found))
+        # 骨格が異なる候補が複数あるなら曖昧なので補正しない
+        if len({skeleton(t) for t in unique}) > 1:
+            return None
+        return unique
+
+    @staticmethod
+    def _pick(candidates: List[str], token: str) -> str:
+        # 全部大文字の語（見出し・定数名）は大文字のまま: PYTHON を Python にしない
+        if len(token) > 1 and token.isupper():
+            return candidates[0].upper()
+        # PowerShell / powershell のように大小違いで両方あれば先頭の大小が合う方
+        for term in candidates:
+            if term[:1].isupper() == token[:1].isupper():
+                return term
+        return _case_like(candidates[0], token)
+
+    def correct(self, text: str) -> str:
+        """置換1パス → トークン単位の索引補正"""
+        if not text:
+            return text
+        text = self.replace_phrases(text)
+        if not self.terms:
+            return text
+        return TOKEN_RE.sub(lambda m: self.correct_token(m.group(0)), text)
+
+
+@lru_cache(maxsize=None)
+def load_corrector(*paths: Path) -> LexiconCorrector:
+    """同じ組み合わせは1回だけ索引化してキャッシュ"""
+    return LexiconCorrector().load(paths)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+loadtest.py
+
+OCRパイプラインの同時リクエスト負荷試験
+- コーパス（画像ディレクトリ）から重み付きで画像を選び、ポアソン到着で投入（オープンループ）
+- インプロセス実行、またはローカルの代替サーバー経由（HTTP POST）を選択
+- p50/p95/p99 レイテンシ（到着予定時刻から完了まで＝待ち行列込み）、スループット、
+  CPU使用率、ピークRSS（子プロセスのtesseract込み）を計測
+- ワーカー数をスイープし、スループットが頭打ちになる飽和点を推定
+
+使用方法:
+  python loadtest.py run   --corpus D:\\ocr_corpus --rate 5 --duration 30 --workers 1,2,4,8
+  python loadtest.py run   --corpus ./corpus --mode server --workers 2,4
+  python loadtest.py serve --port 8765 --workers 4
+"""
+
+import argparse
+import fnmatch
+import importlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:          # Windows
+    RESOURCE_AVAILABLE = False
+
+from PIL import Image
+
+# ======== 設定 ========
+DEFAULT_TARGET = "hotkey_ocr:fast_best_ocr"
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff"}
+SAMPLE_INTERVAL = 0.05       # RSS/CPU サンプリング間隔（秒）
+SATURATION_GAIN = 1.05       # スループット増加がこれ未満なら飽和とみなす
+KEEPUP_RATIO = 0.95          # スループットが到着率のこの割合以上なら「追従できている」
+CLIENT_THREADS = 64          # serverモードのクライアント側同時接続数
+
+
+# ======== コーパス ========
+def load_corpus(corpus: Path, mix: Sequence[str] = ()) -> Tuple[List[Path], List[float]]:
+    """画像一覧と重み。mix は "GLOB=WEIGHT"（一致しない画像は重み1）"""
+    paths = sorted(p for p in Path(corpus).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise SystemExit(f"コーパスに画像がありません: {corpus}")
+    rules = []
+    for item in mix:
+        pattern, _, weight = item.partition("=")
+        rules.append((pattern, float(weight or 1)))
+    weights = []
+    for p in paths:
+        w = 1.0
+        for pattern, rule_w in rules:
+            if fnmatch.fnmatch(p.name, pattern):
+                w = rule_w
+                break
+        weights.append(w)
+    return paths, weights
+
+
+def resolve_target(spec: str) -> Callable:
+    """"module:function" 形式。synthetic:<ms> は指定msかかるだけの試験用ターゲット（ハーネス検証用）"""
+    if spec.startswith("synthetic"):
+        wait_ms = float(spec.partition(":")[2] or 50)
+
+        def synthetic(_img):
+            time.sleep(wait_ms / 1000)
+            return ""
+        return synthetic
+    module, _, func = spec.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+
+# ======== 計測 ========
+class ResourceMonitor:
+    """自プロセス＋子プロセスのCPU時間とRSSをサンプリング"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._cpu_start = 0.0
+        self._wall_start = 0.0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def _cpu_now(self) -> float:
+        t = os.times()
+        # children_* は wait 済みの子プロセス分（Windowsでは0）
+        return t.user + t.system + t.children_user + t.children_system
+
+    def _sample(self):
+        proc = psutil.Process()
+        while not self._stop.is_set():
+            try:
+                rss = proc.memory_info().rss
+                for child in proc.children(recursive=True):
+                    try:
+                        rss += child.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak_rss = max(self.peak_rss, rss)
+            except psutil.Error:
+                pass
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._cpu_start = self._cpu_now()
+        self._wall_start = time.perf_counter()
+        if PSUTIL_AVAILABLE:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = self._cpu_now() - self._cpu_start
+        if not PSUTIL_AVAILABLE and RESOURCE_AVAILABLE:
+            # psutil が無い場合は生涯ピーク（自プロセス＋最大の子プロセス）で代用
+            scale = 1 if sys.platform == "darwin" else 1024
+            self.peak_rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+                             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# ======== 実行 ========
+def _poisson_schedule(rate: float, duration: float, rng: random.Random) -> List[float]:
+    t, times = 0.0, []
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            return times
+        times.append(t)
+
+
+def run_load(images: List[Image.Image], weights: List[float], process: Callable[[Image.Image], object],
+             workers: int, rate: float, duration: float, seed: int = 0,
+             client_threads: Optional[int] = None) -> Dict[str, float]:
+    """1構成分の負荷をかけて集計。process はワーカー（またはクライアント）スレッドで呼ばれる"""
+    rng = random.Random(seed)
+    schedule = _poisson_schedule(rate, duration, rng)
+    picks = rng.choices(range(len(images)), weights=weights, k=len(schedule))
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def job(scheduled: float, idx: int, t0: float):
+        nonlocal errors
+        try:
+            process(images[idx])
+            ok = True
+        except Exception:
+            ok = False
+        done = time.perf_counter() - t0
+        with lock:
+            if ok:
+                latencies.append(done - scheduled)
+            else:
+                errors += 1
+
+    with ResourceMonitor() as mon, ThreadPoolExecutor(max_workers=client_threads or workers) as pool:
+        t0 = time.perf_counter()
+        futures = []
+        for scheduled, idx in zip(schedule, picks):
+            delay = t0 + scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(job, scheduled, idx, t0))
+        for f in futures:
+            f.result()
+
+    return {
+        "workers": workers,
+        "requests": len(schedule),
+        "offered": len(schedule) / duration if duration else 0.0,
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "throughput": len(latencies) / mon.wall_seconds if mon.wall_seconds else 0.0,
+        "cpu": mon.cpu_seconds / mon.wall_seconds if mon.wall_seconds else 0.0,
+        "peak_rss_mb": mon.peak_rss / 1e6,
+    }
+
+
+def keeps_up(row: Dict[str, float]) -> bool:
+    return row["throughput"] >= row["offered"] * KEEPUP_RATIO
+
+
+def find_saturation(rows: List[Dict[str, float]]) -> Optional[int]:
+    """過負荷（到着率に追従できない）状態で、スループットの伸びが止まった直前のワーカー数"""
+    for prev, cur in zip(rows, rows[1:]):
+        if not keeps_up(prev) and cur["throughput"] < prev["throughput"] * SATURATION_GAIN:
+            return int(prev["workers"])
+    return None
+
+
+def print_table(rows: List[Dict[str, float]]):
+    print(f"{'workers':>7} {'req':>5} {'err':>4} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'req/s':>7} {'CPU':>6} {'RSS MB':>8}")
+    for r in rows:
+        print(f"{r['workers']:>7} {r['requests']:>5} {r['errors']:>4} {r['p50']:7.2f} {r['p95']:7.2f} "
+              f"{r['p99']:7.2f} {r['throughput']:7.2f} {r['cpu']:6.2f} {r['peak_rss_mb']:8.0f}")
+
+
+# ======== 代替サーバー ========
+def make_server(target: Callable, port: int, workers: int) -> ThreadingHTTPServer:
+    """POST /ocr (画像バイト列) → JSON。同時実行は workers 個に制限"""
+    slots = threading.BoundedSemaphore(workers)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            start = time.perf_counter()
+            try:
+                img = Image.open(io.BytesIO(body))
+                img.load()
+                with slots:
+                    result = target(img)
+                text = result[0] if isinstance(result, tuple) else str(result)
+                payload, status = {"text": text, "ms": (time.perf_counter() - start) * 1000}, 200
+            except Exception as e:
+                payload, status = {"error": str(e)}, 500
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def http_client(port: int) -> Callable[[Image.Image], object]:
+    cache: Dict[int, bytes] = {}
+
+    def post(img: Image.Image):
+        body = cache.get(id(img))
+        if body is None:
+            buf = io.BytesIO()
+            img.save(buf, "PNG")
+            body = cache[id(img)] = buf.getvalue()
+        req = urllib.request.Request(f"http://127.0.0.1:{port}/ocr", data=body,
+                                     headers={"Content-Type": "image/png"})
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            return json.loads(resp.read())
+    return post
+
+
+# ======== CLI ========
+def cmd_run(args):
+    if args.omp:
+        os.environ["OMP_THREAD_LIMIT"] = str(args.omp)
+    paths, weights = load_corpus(Path(args.corpus), args.mix)
+    images = []
+    for p in paths:
+        img = Image.open(p)
+        img.load()
+        images.append(img)
+    target = resolve_target(args.target)
+    worker_counts = [int(w) for w in args.workers.split(",")]
+
+    print(f"corpus={len(images)} images, rate={args.rate}/s, duration={args.duration}s, "
+          f"mode={args.mode}, target={args.target}, OMP_THREAD_LIMIT={os.environ.get('OMP_THREAD_LIMIT', '-')}")
+    if not PSUTIL_AVAILABLE:
+        print("⚠️  psutil が無いため RSS は生涯ピークで代用します")
+
+    # ウォームアップ（バックエンド選択・辞書索引などの初回コストを除外）
+    target(images[0])
+
+    rows = []
+    for n in worker_counts:
+        if args.mode == "server":
+            server = make_server(target, args.port, n)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                row = run_load(images, weights, http_client(args.port), n, args.rate, args.duration,
+                               args.seed, client_threads=CLIENT_THREADS)
+            finally:
+                server.shutdown()
+                server.server_close()
+        else:
+            row = run_load(images, weights, target, n, args.rate, args.duration, args.seed)
+        scheduler = getattr(sys.modules.get(args.target.partition(":")[0]), "SCHEDULER", None)
+        if scheduler is not None:
+            # ターゲットがスケジューラを使う場合は、その時点の配分（workers x OMP_THREAD_LIMIT）も記録
+            row["scheduler"] = scheduler.metrics()
+        rows.append(row)
+        print(f"  workers={n}: p95={row['p95']:.2f}s, {row['throughput']:.2f} req/s, errors={row['errors']}")
+        if scheduler is not None:
+            print("    scheduler: " + ", ".join(f"{shape}={m['workers']}x{m['omp_thread_limit']}({m['source']})"
+                                              for shape, m in row["scheduler"]["shapes"].items()))
+
+    print()
+    print_table(rows)
+    sat = find_saturation(rows)
+    if sat is not None:
+        print(f"\n飽和点: 約 {sat} ワーカー（それ以上はスループットが{(SATURATION_GAIN - 1) * 100:.0f}%未満しか伸びない）")
+    else:
+        enough = next((r for r in rows if keeps_up(r)), None)
+        if enough is rows[0]:
+            print("\n全構成で到着率に追従しています。飽和点を探すには --rate を上げてください")
+        elif enough is not None:
+            print(f"\n{int(enough['workers'])} ワーカー以上で到着率に追従しています（飽和前に負荷を処理しきれる）。"
+                  "飽和点を探すには --rate を上げてください")
+        else:
+            print("\n最大ワーカー数までスループットが伸び続けています。--workers を増やしてください")
+    if args.json:
+        Path(args.json).write_text(json.dumps(rows, indent=2), encoding="utf-8")
+
+
+def cmd_serve(args):
+    server = make_server(resolve_target(args.target), args.port, args.workers)
+    print(f"OCR代替サーバー: http://127.0.0.1:{args.port}/ocr (workers={args.workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCRパイプライン負荷試験")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="負荷をかけてレイテンシ等を計測")
+    run.add_argument("--corpus", required=True, help="画像ディレクトリ")
+    run.add_argument("--mix", action="append", default=[], help="GLOB=WEIGHT（複数指定可）")
+    run.add_argument("--rate", type=float, default=2.0, help="到着率（req/s）")
+    run.add_argument("--duration", type=float, default=30.0, help="1構成あたりの秒数")
+    run.add_argument("--workers", default="1,2,4,8", help="スイープするワーカー数（カンマ区切り）")
+    run.add_argument("--mode", choices=["inprocess", "server"], default="inprocess")
+    run.add_argument("--port", type=int, default=8765)
+    run.add_argument("--target", default=DEFAULT_TARGET, help="module:function または synthetic:<ms>")
+    run.add_argument("--omp", type=int, default=0, help="OMP_THREAD_LIMIT（0=未設定）")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--json", help="結果をJSONで保存")
+    run.set_defaults(func=cmd_run)
+
+    serve = sub.add_parser("serve", help="ローカル代替サーバーを起動")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--workers", type=int, default=4)
+    serve.add_argument("--target", default=DEFAULT_TARGET)
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+ocr_backends.py
+
+OCRエンジンのバックエンド共通インターフェース
+- pytesseract / Tesseractコマンド直接実行 / tesserocr(インプロセス) を同じ形で扱う
+- 結果は OCRResult (text, words, boxes, confs) に統一
+- 起動時の短い自己ベンチマークで最速の動作バックエンドを選び、選択結果を保存
+- 失敗が続くバックエンドは自動で降格（毎回タイムアウトを払わない）
+"""
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageDraw
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+# ======== 設定 ========
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_STATE_FILE = Path(tempfile.gettempdir()) / "ocr_backend_state.json"
+BENCH_MAX_AGE = 7 * 24 * 3600      # 選択結果の有効期間（秒）
+MAX_FAILURES = 3                   # 連続失敗でこの回数に達したら降格
+DEMOTE_COOLDOWN = 300.0            # 降格後、再挑戦までの秒数
+
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+WORD_LEVEL = 5
+
+
+class BackendError(RuntimeError):
+    """バックエンド実行失敗"""
+
+
+# ======== 共通結果型 ========
+@dataclass
+class OCRWord:
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    conf: float
+    block_num: int = 0
+    par_num: int = 0
+    line_num: int = 0
+    word_num: int = 0
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        return (self.left, self.top, self.width, self.height)
+
+    @property
+    def line_key(self) -> Tuple[int, int, int]:
+        return (self.block_num, self.par_num, self.line_num)
+
+
+@dataclass
+class OCRResult:
+    words: List[OCRWord] = field(default_factory=list)
+    backend: str = ""
+    lang: str = ""
+    psm: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def boxes(self) -> List[Tuple[int, int, int, int]]:
+        return [w.box for w in self.words]
+
+    @property
+    def confs(self) -> List[float]:
+        return [w.conf for w in self.words]
+
+    @property
+    def mean_conf(self) -> float:
+        valid = [w.conf for w in self.words if w.conf >= 0]
+        return sum(valid) / len(valid) if valid else 0.0
+
+    @property
+    def text(self) -> str:
+        """image_to_string 相当のテキスト（段落間は空行）"""
+        return self.to_text()
+
+    def lines(self, conf_th: Optional[float] = None) -> List[Tuple[Tuple[int, int, int], List[OCRWord]]]:
+        """(block, par, line) 単位に単語をまとめる（word_num順）"""
+        groups: Dict[Tuple[int, int, int], List[OCRWord]] = {}
+        for w in self.words:
+            if w.conf < 0 or (conf_th is not None and w.conf < conf_th):
+                continue
+            if not w.text.strip():
+                continue
+            groups.setdefault(w.line_key, []).append(w)
+        return [(key, sorted(groups[key], key=lambda w: w.word_num)) for key in sorted(groups)]
+
+    def to_text(self, joiner: str = " ", conf_th: Optional[float] = None,
+                paragraph_break: bool = True) -> str:
+        out = []
+        prev_par = None
+        for (block, par, _), words in self.lines(conf_th):
+            if paragraph_break and prev_par is not None and (block, par) != prev_par:
+                out.append("")
+            out.append(joiner.join(w.text for w in words))
+            prev_par = (block, par)
+        return "\n".join(out)
+
+    def to_dataframe(self):
+        """pytesseract の Output.DATAFRAME と同じ列構成の DataFrame"""
+        import pandas as pd
+        rows = [{
+            "level": WORD_LEVEL, "page_num": 1,
+            "block_num": w.block_num, "par_num": w.par_num,
+            "line_num": w.line_num, "word_num": w.word_num,
+            "left": w.left, "top": w.top, "width": w.width, "height": w.height,
+            "conf": float(w.conf), "text": w.text,
+        } for w in self.words]
+        return pd.DataFrame(rows, columns=TSV_COLUMNS)
+
+    @classmethod
+    def from_data_dict(cls, data: Dict[str, list], **kwargs) -> "OCRResult":
+        """image_to_data(Output.DICT) 形式から生成（単語レベルのみ）"""
+        words = []
+        for i in range(len(data.get("text", []))):
+            if int(data["level"][i]) != WORD_LEVEL:
+                continue
+            words.append(OCRWord(
+                text=str(data["text"][i] or ""),
+                left=int(data["left"][i]), top=int(data["top"][i]),
+                width=int(data["width"][i]), height=int(data["height"][i]),
+                conf=float(data["conf"][i]),
+                block_num=int(data["block_num"][i]), par_num=int(data["par_num"][i]),
+                line_num=int(data["line_num"][i]), word_num=int(data["word_num"][i]),
+            ))
+        return cls(words=words, **kwargs)
+
+    @classmethod
+    def from_tsv(cls, tsv: str, **kwargs) -> "OCRResult":
+        return cls.from_data_dict(parse_tsv(tsv), **kwargs)
+
+
+def parse_tsv(tsv: str) -> Dict[str, list]:
+    """Tesseract TSV出力（ヘッダ有無どちらも可）を列ごとのdictへ"""
+    data: Dict[str, list] = {c: [] for c in TSV_COLUMNS}
+    for line in tsv.splitlines():
+        if not line or line.startswith("level"):
+            continue
+        cols = line.split("\t")
+        if len(cols) < len(TSV_COLUMNS) - 1:
+            continue
+        if len(cols) == len(TSV_COLUMNS) - 1:
+            cols.append("")
+        # text に TAB が含まれることは無いが、念のため末尾を結合
+        cols = cols[:len(TSV_COLUMNS) - 1] + ["\t".join(cols[len(TSV_COLUMNS) - 1:])]
+        try:
+            for name, value in zip(TSV_COLUMNS, cols):
+                data[name].append(value if name == "text" else float(value))
+        except ValueError:
+            continue
+    return data
+
+
+def build_config_args(psm: int, oem: int = 3, variables: Optional[Dict[str, str]] = None,
+                      tessdata_dir: str = "") -> List[str]:
+    """Tesseract CLI 引数（言語・入出力以外）"""
+    args = []
+    if tessdata_dir:
+        args += ["--tessdata-dir", tessdata_dir]
+    args += ["--psm", str(psm), "--oem", str(oem)]
+    for key, value in (variables or {}).items():
+        args += ["-c", f"{key}={value}"]
+    return args
+
+
+def list_languages(tesseract_cmd: str, tessdata_dir: str = "") -> List[str]:
+    """インストール済みの traineddata 一覧（取得できなければ空）"""
+    cmd = [tesseract_cmd]
+    if tessdata_dir:
+        cmd += ["--tessdata-dir", tessdata_dir]
+    try:
+        result = subprocess.run(cmd + ["--list-langs"], capture_output=True, text=True,
+                                encoding="utf-8", timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    # 1行目は "List of available languages in ..." の見出し
+    return [line.strip() for line in result.stdout.splitlines()[1:] if line.strip()]
+
+
+# ======== バックエンド ========
+class OCRBackend:
+    """バックエンド基底クラス"""
+    name = "base"
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+
+    def available(self) -> bool:
+        return False
+
+    def recognize(self, img, lang: str, psm: int, oem: int = 3,
+                  variables: Optional[Dict[str, str]] = None,
+                  tessdata_dir: str = "") -> OCRResult:
+        raise NotImplementedError
+
+
+class PytesseractBackend(OCRBackend):
+    """pytesseract.image_to_data（内部でtesseractを起動）"""
+    name = "pytesseract"
+
+    def __init__(self, tesseract_cmd: str = "", timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        if PYTESSERACT_AVAILABLE and tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def available(self) -> bool:
+        return PYTESSERACT_AVAILABLE and PIL_AVAILABLE
+
+    def recognize(self, img, lang, psm, oem=3, variables=None, tessdata_dir=""):
+        config = " ".join(f'"{a}"' if " " in a else a
+                          for a in build_config_args(psm, oem, variables, tessdata_dir))
+        data = pytesseract.image_to_data(img, lang=lang, config=config,
+                                         output_type=pytesseract.Output.DICT,
+                                         timeout=self.timeout)
+        return OCRResult.from_data_dict(data)
+
+
+class DirectTesseractBackend(OCRBackend):
+    """Tesseractコマンド直接実行（一時PNG + TSV出力）"""
+    name = "direct"
+
+    def __init__(self, tesseract_cmd: str, temp_dir: Optional[Path] = None,
+                 timeout: float = DEFAULT_TIMEOUT, env: Optional[Dict[str, str]] = None):
+        super().__init__(timeout)
+        self.tesseract_cmd = tesseract_cmd
+        self.temp_dir = Path(temp_dir or Path(tempfile.gettempdir()) / "working_ocr")
+        self.env = env
+
+    def available(self) -> bool:
+        return PIL_AVAILABLE and bool(self.tesseract_cmd) and Path(self.tesseract_cmd).exists()
+
+    def recognize(self, img, lang, psm, oem=3, variables=None, tessdata_dir=""):
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        temp_file = self.temp_dir / f"ocr_{timestamp}_{threading.get_ident()}.png"
+        img.save(str(temp_file), "PNG")
+        try:
+            cmd = [self.tesseract_cmd, str(temp_file), "stdout", "-l", lang]
+            cmd += build_config_args(psm, oem, variables, tessdata_dir)
+            cmd.append("tsv")
+            env = dict(os.environ, **self.env) if self.env else None
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8",
+                                        timeout=self.timeout, env=env)
+            except subprocess.TimeoutExpired as e:
+                raise BackendError(f"Tesseractタイムアウト ({self.timeout}s)") from e
+            if result.returncode != 0:
+                raise BackendError(f"Tesseractエラー: {result.stderr.strip()}")
+            return OCRResult.from_tsv(result.stdout)
+        finally:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+
+
+class TesserocrBackend(OCRBackend):
+    """tesserocr（インプロセスのC++ API）。(lang, psm, oem) ごとにAPIを使い回す"""
+    name = "tesserocr"
+
+    def __init__(self, tessdata_dir: str = "", timeout: float = DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.tessdata_dir = tessdata_dir
+        self._apis: Dict[Tuple[str, int, int, str], object] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return TESSEROCR_AVAILABLE and PIL_AVAILABLE
+
+    def _api(self, lang, psm, oem, tessdata_dir):
+        key = (lang, psm, oem, tessdata_dir)
+        api = self._apis.get(key)
+        if api is None:
+            kwargs = {"lang": lang, "psm": psm, "oem": oem}
+            if tessdata_dir:
+                kwargs["path"] = tessdata_dir
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            self._apis[key] = api
+        return api
+
+    def recognize(self, img, lang, psm, oem=3, variables=None, tessdata_dir=""):
+        with self._lock:
+            api = self._api(lang, psm, oem, tessdata_dir or self.tessdata_dir)
+            api.Clear()
+            # SetVariable は API に残り Clear() でも戻らない → 呼び出しごとに元の値へ戻す
+            # （戻さないとプロファイルのホワイトリスト等が同じ (lang, psm) の以降の認識すべてに効く）
+            previous = {}
+            try:
+                for key, value in (variables or {}).items():
+                    prev = api.GetVariableAsString(key)
+                    if prev is not None and key not in previous:
+                        previous[key] = prev
+                    api.SetVariable(key, str(value))
+                api.SetImage(img)
+                if not api.Recognize():
+                    raise BackendError("tesserocr: Recognize失敗")
+                return OCRResult.from_tsv(api.GetTSVText(0))
+            finally:
+                for key, prev in previous.items():
+                    api.SetVariable(key, prev)
+
+    def close(self):
+        with self._lock:
+            for api in self._apis.values():
+                api.End()
+            self._apis.clear()
+
+
+def create_default_backends(tesseract_cmd: str, temp_dir: Optional[Path] = None,
+                            tessdata_dir: str = "") -> List[OCRBackend]:
+    """この環境で候補になるバックエンド一覧（利用不可なものも含む）"""
+    return [
+        TesserocrBackend(tessdata_dir=tessdata_dir),
+        PytesseractBackend(tesseract_cmd),
+        DirectTesseractBackend(tesseract_cmd, temp_dir),
+    ]
+
+
+# ======== 自動選択・降格 ========
+def make_benchmark_image():
+    """自己ベンチマーク用の小さな合成画像"""
+    img = Image.new("L", (480, 96), 255)
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 10), "OCR benchmark 0123456789", fill=0)
+    draw.text((10, 50), "The quick brown fox jumps", fill=0)
+    return img.resize((img.width * 3, img.height * 3))
+
+
+class BackendManager:
+    """優先順位付きでバックエンドを呼び出し、失敗が続くものを降格する"""
+
+    def __init__(self, backends: Iterable[OCRBackend], state_file: Optional[Path] = DEFAULT_STATE_FILE,
+                 max_failures: int = MAX_FAILURES, cooldown: float = DEMOTE_COOLDOWN,
+                 log: Callable[[str], None] = print):
+        self.backends = [b for b in backends if b.available()]
+        self.state_file = Path(state_file) if state_file else None
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.log = log
+        self.failures: Dict[str, int] = {b.name: 0 for b in self.backends}
+        self.demoted_until: Dict[str, float] = {}
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def names(self) -> List[str]:
+        return [b.name for b in self.backends]
+
+    @property
+    def preferred(self) -> Optional[OCRBackend]:
+        order = self.ordered()
+        return order[0] if order else None
+
+    def ordered(self) -> List[OCRBackend]:
+        """降格中のバックエンドを後ろに回した呼び出し順"""
+        now = time.time()
+        active = [b for b in self.backends if self.demoted_until.get(b.name, 0.0) <= now]
+        demoted = [b for b in self.backends if b not in active]
+        return active + demoted
+
+    # ---- 選択 ----
+    def select(self, lang: str = "eng", psm: int = 6, force: bool = False,
+               benchmark: bool = True) -> Optional[str]:
+        """保存済みの選択を読み込むか、無ければ自己ベンチマークで決定
+
+        benchmark=False なら保存済みの選択が無くても計測せず既定の順のまま（ワーカープロセス用）
+        """
+        if not self.backends:
+            self.log("❌ 利用可能なOCRバックエンドがありません")
+            return None
+        if not force and self._load_state():
+            self.log(f"⚡ OCRバックエンド: {self.names[0]} (保存済みの選択)")
+            return self.names[0]
+        if not benchmark:
+            self.log(f"⚡ OCRバックエンド: {self.names[0]} (既定の順)")
+            return self.names[0]
+        self.benchmark(lang=lang, psm=psm)
+        self._save_state()
+        return self.names[0] if self.backends else None
+
+    def benchmark(self, img=None, lang: str = "eng", psm: int = 6, rounds: int = 2) -> Dict[str, float]:
+        """各バックエンドを数回実行し、最速の動作バックエンドを先頭にする"""
+        if img is None:
+            img = make_benchmark_image()
+        timings: Dict[str, float] = {}
+        for backend in self.backends:
+            try:
+                backend.recognize(img, lang, psm)   # ウォームアップ（初期化コストを除外）
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    backend.recognize(img, lang, psm)
+                timings[backend.name] = (time.perf_counter() - start) / rounds
+                self.log(f"  {backend.name}: {timings[backend.name] * 1000:.0f}ms")
+            except Exception as e:
+                self.log(f"  {backend.name}: 失敗 ({e})")
+        working = [b for b in self.backends if b.name in timings]
+        broken = [b for b in self.backends if b.name not in timings]
+        working.sort(key=lambda b: timings[b.name])
+        self.backends = working + broken
+        self.timings = timings
+        if working:
+            self.log(f"⚡ OCRバックエンド: {working[0].name} (自己ベンチマーク)")
+        return timings
+
+    def _state_key(self) -> str:
+        return ",".join(sorted(self.names))
+
+    def _load_state(self) -> bool:
+        if not self.state_file or not self.state_file.exists():
+            return False
+        try:
+            state = json.loads(self.state_file.read_text(encoding="utf-8"))
+            entry = state.get(self._state_key())
+            if not entry or time.time() - entry.get("time", 0) > BENCH_MAX_AGE:
+                return False
+            rank = {name: i for i, name in enumerate(entry["order"])}
+            self.backends.sort(key=lambda b: rank.get(b.name, len(rank)))
+            self.timings = entry.get("timings", {})
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        try:
+            state = {}
+            if self.state_file.exists():
+                state = json.loads(self.state_file.read_text(encoding="utf-8"))
+            state[self._state_key()] = {"order": self.names, "timings": self.timings, "time": time.time()}
+            self.state_file.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        except (OSError, ValueError) as e:
+            self.log(f"バックエンド選択の保存に失敗: {e}")
+
+    # ---- 実行 ----
+    def recognize(self, img, lang: str, psm: int, oem: int = 3,
+                  variables: Optional[Dict[str, str]] = None, tessdata_dir: str = "") -> OCRResult:
+        """優先順に実行。例外・タイムアウトは次のバックエンドへフォールバック"""
+        errors = []
+        for backend in self.ordered():
+            start = time.perf_counter()
+            try:
+                result = backend.recognize(img, lang, psm, oem, variables, tessdata_dir)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+                self._record_failure(backend)
+                continue
+            self._record_success(backend)
+            result.backend, result.lang, result.psm = backend.name, lang, psm
+            result.elapsed = time.perf_counter() - start
+            return result
+        raise BackendError("全バックエンドが失敗しました: " + " / ".join(errors))
+
+    def _record_success(self, backend: OCRBackend):
+        with self._lock:
+            self.failures[backend.name] = 0
+            self.demoted_until.pop(backend.name, None)
+
+    def _record_failure(self, backend: OCRBackend):
+        with self._lock:
+            self.failures[backend.name] = self.failures.get(backend.name, 0) + 1
+            if self.failures[backend.name] >= self.max_failures:
+                # 失敗回数は成功するまで保持（クールダウン明けの1回目の失敗で再降格）
+                self.demoted_until[backend.name] = time.time() + self.cooldown
+                self.log(f"⚠️  {backend.name} が連続で失敗したため降格しました（{self.cooldown:.0f}秒）")
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+ocr_export.py
+
+認識結果（OCRResult）から構造化出力を生成（エンジンの再実行なし）
+- hOCR (HTML)
+- ALTO XML (v4)
+- JSON（行・単語ごとのボックスと conf）
+座標は前処理の拡大率で割り戻し、元のキャプチャ座標で出力する。
+（傾き・向き補正した場合は unmap で補正前の座標に戻し、回転した単語ボックスはそれを囲む矩形にする）
+"""
+
+import json
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from ocr_backends import OCRResult, OCRWord
+
+FORMATS = ("json", "hocr", "alto")
+SUFFIXES = {"json": ".json", "hocr": ".hocr", "alto": ".alto.xml"}
+
+Box = Tuple[int, int, int, int]   # (x0, y0, x1, y1)
+# 前処理後（拡大率で割り戻した後）の座標 → 元のキャプチャ座標（例: DeskewInfo.unmap）
+PointMap = Callable[[float, float], Tuple[float, float]]
+
+
+def _scaled_box(w: OCRWord, scale: float, unmap: Optional[PointMap] = None) -> Box:
+    x0, y0 = w.left / scale, w.top / scale
+    x1, y1 = (w.left + w.width) / scale, (w.top + w.height) / scale
+    if unmap is not None:
+        corners = [unmap(x, y) for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1))]
+        x0, y0 = min(c[0] for c in corners), min(c[1] for c in corners)
+        x1, y1 = max(c[0] for c in corners), max(c[1] for c in corners)
+    return int(round(x0)), int(round(y0)), int(round(x1)), int(round(y1))
+
+
+def _union(boxes: Iterable[Box]) -> Box:
+    boxes = list(boxes)
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def build_layout(result: OCRResult, scale: float = 1.0, unmap: Optional[PointMap] = None) -> List[dict]:
+    """block → par → line → word の入れ子構造（ボックスは元座標 x0,y0,x1,y1）"""
+    blocks: Dict[int, dict] = {}
+    for (block_num, par_num, line_num), words in result.lines():
+        block = blocks.setdefault(block_num, {"id": block_num, "pars": {}})
+        par = block["pars"].setdefault(par_num, {"id": par_num, "lines": []})
+        word_items = [{"text": w.text, "box": _scaled_box(w, scale, unmap), "conf": round(w.conf, 1)}
+                      for w in words]
+        par["lines"].append({
+            "id": line_num,
+            "box": _union(wi["box"] for wi in word_items),
+            "conf": round(sum(w.conf for w in words) / len(words), 1),
+            "words": word_items,
+        })
+    layout = []
+    for block in blocks.values():
+        pars = list(block["pars"].values())
+        for par in pars:
+            par["box"] = _union(line["box"] for line in par["lines"])
+        layout.append({"id": block["id"], "box": _union(p["box"] for p in pars), "pars": pars})
+    return layout
+
+
+# ======== JSON ========
+def to_json(result: OCRResult, scale: float = 1.0, page_size: Optional[Tuple[int, int]] = None,
+            joiner: str = " ", unmap: Optional[PointMap] = None) -> str:
+    """行・単語ボックス付きのコンパクトなJSON（box は [x, y, w, h]）"""
+    def xywh(b: Box) -> List[int]:
+        return [b[0], b[1], b[2] - b[0], b[3] - b[1]]
+
+    lines = []
+    for block in build_layout(result, scale, unmap):
+        for par in block["pars"]:
+            for line in par["lines"]:
+                lines.append({
+                    "block": block["id"], "par": par["id"],
+                    "text": joiner.join(w["text"] for w in line["words"]),
+                    "box": xywh(line["box"]), "conf": line["conf"],
+                    "words": [{"text": w["text"], "box": xywh(w["box"]), "conf": w["conf"]}
+                              for w in line["words"]],
+                })
+    doc = {
+        "width": page_size[0] if page_size else None,
+        "height": page_size[1] if page_size else None,
+        "lang": result.lang, "psm": result.psm, "backend": result.backend,
+        "mean_conf": round(result.mean_conf, 1),
+        "lines": lines,
+    }
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+
+# ======== hOCR ========
+def _bbox(b: Box) -> str:
+    return f"bbox {b[0]} {b[1]} {b[2]} {b[3]}"
+
+
+def to_hocr(result: OCRResult, scale: float = 1.0, page_size: Optional[Tuple[int, int]] = None,
+            image_name: str = "", unmap: Optional[PointMap] = None) -> str:
+    layout = build_layout(result, scale, unmap)
+    if page_size:
+        page_box = (0, 0, page_size[0], page_size[1])
+    else:
+        page_box = _union(b["box"] for b in layout) if layout else (0, 0, 0, 0)
+    lang = escape(result.lang or "")
+
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"',
+        '    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">',
+        f'<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="{lang}" lang="{lang}">',
+        '<head>',
+        '  <title></title>',
+        '  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>',
+        f'  <meta name="ocr-system" content="tesseract ({escape(result.backend)})"/>',
+        '  <meta name="ocr-capabilities" content="ocr_page ocr_carea ocr_par ocr_line ocrx_word ocrp_wconf"/>',
+        '</head>',
+        '<body>',
+        f'  <div class="ocr_page" id="page_1" title={quoteattr(f"image {image_name}; {_bbox(page_box)}; ppageno 0")}>',
+    ]
+    for block in layout:
+        bid = block["id"]
+        out.append(f'   <div class="ocr_carea" id="block_1_{bid}" title="{_bbox(block["box"])}">')
+        for par in block["pars"]:
+            pid = f'{bid}_{par["id"]}'
+            out.append(f'    <p class="ocr_par" id="par_1_{pid}" lang="{lang}" title="{_bbox(par["box"])}">')
+            for line in par["lines"]:
+                lid = f'{pid}_{line["id"]}'
+                out.append(f'     <span class="ocr_line" id="line_1_{lid}" title="{_bbox(line["box"])}">')
+                for i, w in enumerate(line["words"], 1):
+                    out.append(f'      <span class="ocrx_word" id="word_1_{lid}_{i}" '
+                               f'title="{_bbox(w["box"])}; x_wconf {int(w["conf"])}">{escape(w["text"])}</span>')
+                out.append('     </span>')
+            out.append('    </p>')
+        out.append('   </div>')
+    out += ['  </div>', '</body>', '</html>']
+    return "\n".join(out) + "\n"
+
+
+# ======== ALTO ========
+def _alto_pos(b: Box) -> str:
+    return f'HPOS="{b[0]}" VPOS="{b[1]}" WIDTH="{b[2] - b[0]}" HEIGHT="{b[3] - b[1]}"'
+
+
+def to_alto(result: OCRResult, scale: float = 1.0, page_size: Optional[Tuple[int, int]] = None,
+            image_name: str = "", unmap: Optional[PointMap] = None) -> str:
+    layout = build_layout(result, scale, unmap)
+    if page_size:
+        width, height = page_size
+    else:
+        page_box = _union(b["box"] for b in layout) if layout else (0, 0, 0, 0)
+        width, height = page_box[2], page_box[3]
+
+    out = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<alto xmlns="http://www.loc.gov/standards/alto/ns-v4#"'
+        ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+        ' xsi:schemaLocation="http://www.loc.gov/standards/alto/ns-v4# '
+        'http://www.loc.gov/alto/v4/alto-4-2.xsd">',
+        '  <Description>',
+        '    <MeasurementUnit>pixel</MeasurementUnit>',
+        '    <sourceImageInformation>',
+        f'      <fileName>{escape(image_name)}</fileName>',
+        '    </sourceImageInformation>',
+        '    <OCRProcessing ID="OCR_0">',
+        '      <ocrProcessingStep>',
+        '        <processingSoftware>',
+        f'          <softwareName>tesseract ({escape(result.backend)})</softwareName>',
+        '        </processingSoftware>',
+        '      </ocrProcessingStep>',
+        '    </OCRProcessing>',
+        '  </Description>',
+        '  <Layout>',
+        f'    <Page WIDTH="{width}" HEIGHT="{height}" PHYSICAL_IMG_NR="0" ID="page_0">',
+        f'      <PrintSpace HPOS="0" VPOS="0" WIDTH="{width}" HEIGHT="{height}">',
+    ]
+    for block in layout:
+        bid = block["id"]
+        out.append(f'        <TextBlock ID="block_{bid}" {_alto_pos(block["box"])}>')
+        for par in block["pars"]:
+            for line in par["lines"]:
+                lid = f'{bid}_{par["id"]}_{line["id"]}'
+                out.append(f'          <TextLine ID="line_{lid}" {_alto_pos(line["box"])}>')
+                for i, w in enumerate(line["words"]):
+                    if i:
+                        out.append('            <SP/>')
+                    out.append(f'            <String ID="string_{lid}_{i}" {_alto_pos(w["box"])} '
+                               f'WC="{w["conf"] / 100:.2f}" CONTENT={quoteattr(w["text"])}/>')
+                out.append('          </TextLine>')
+        out.append('        </TextBlock>')
+    out += ['      </PrintSpace>', '    </Page>', '  </Layout>', '</alto>']
+    return "\n".join(out) + "\n"
+
+
+# ======== 書き出し ========
+def write_exports(result: OCRResult, base_path: Path, formats: Iterable[str], scale: float = 1.0,
+                  page_size: Optional[Tuple[int, int]] = None, joiner: str = " ",
+                  unmap: Optional[PointMap] = None) -> List[Path]:
+    """テキスト出力と同じ場所・同じ名前で指定形式を書き出す"""
+    base_path = Path(base_path)
+    written = []
+    for fmt in formats:
+        if fmt not in SUFFIXES:
+            raise ValueError(f"未対応の出力形式: {fmt} (対応: {', '.join(FORMATS)})")
+        if fmt == "json":
+            content = to_json(result, scale, page_size, joiner, unmap)
+        elif fmt == "hocr":
+            content = to_hocr(result, scale, page_size, unmap=unmap)
+        else:
+            content = to_alto(result, scale, page_size, unmap=unmap)
+        path = base_path.with_suffix(SUFFIXES[fmt])
+        path.write_text(content, encoding="utf-8")
+        written.append(path)
+    return written
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+ocr_log.py
+
+ノンブロッキングな構造化ログ
+- 記録側は deque への append だけ（ロック・コンソール・ディスクI/Oなし）。OCRのホットパスはログで待たない
+- 直近 RING_SIZE 件はメモリ上のリングバッファに常に保持 → dump() で任意のタイミング / クラッシュ時に書き出し
+- 書き込みスレッドが FLUSH_INTERVAL ごとにまとめて JSON Lines で追記し、MAX_BYTES でローテーション
+- コンソール表示も書き込みスレッドが行う（pythonw・非表示起動で標準出力が無ければファイルのみ）
+- イベント種別と所要時間:
+    log.event("ocr", "認識完了", duration=0.42, backend="direct")
+    with log.span("clean", chars=1234): ...
+"""
+
+import atexit
+import itertools
+import json
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# ======== 設定 ========
+DEFAULT_LOG_FILE = Path(tempfile.gettempdir()) / "ocr_logs" / "ocr.jsonl"
+RING_SIZE = 2000          # メモリに残す直近イベント数（dump の対象）
+PENDING_MAX = 20000       # 書き込み待ちの上限（書き込みが追いつかなければ古いものから捨てて件数を記録）
+FLUSH_INTERVAL = 0.2      # 書き込みスレッドの周期（秒）
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 3               # ocr.jsonl.1 〜 .3 まで残す
+DUMP_EVENTS = 500         # dump() の既定件数
+
+
+def console_available() -> bool:
+    """コンソールに出力できるか（pythonw・非表示起動では標準出力が無い）"""
+    return sys.stdout is not None and not sys.executable.lower().endswith("pythonw.exe")
+
+
+@dataclass
+class LogEvent:
+    seq: int
+    ts: float
+    kind: str                          # "message" / "ocr" / "preprocess" / "clean" / "error" / "crash" など
+    message: str = ""
+    duration: Optional[float] = None   # 秒
+    thread: str = ""
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {"ts": datetime.fromtimestamp(self.ts).isoformat(timespec="milliseconds"),
+             "type": self.kind, "thread": self.thread}
+        if self.message:
+            d["msg"] = self.message
+        if self.duration is not None:
+            d["ms"] = round(self.duration * 1000, 1)
+        d.update(self.fields)
+        return d
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, default=str)
+
+    def format(self) -> str:
+        """コンソール表示用の1行"""
+        line = f"[{datetime.fromtimestamp(self.ts).strftime('%H:%M:%S')}] {self.message or self.kind}"
+        if self.duration is not None and f"{self.duration * 1000:.0f}ms" not in line:
+            line += f" ({self.duration * 1000:.0f}ms)"
+        if "traceback" in self.fields:
+            line += "\n" + str(self.fields["traceback"]).rstrip()
+        return line
+
+
+class RingLogger:
+    """リングバッファ + バックグラウンド一括書き込みの構造化ロガー"""
+
+    def __init__(self, path: Optional[Path] = DEFAULT_LOG_FILE, ring_size: int = RING_SIZE,
+                 max_bytes: int = MAX_BYTES, backups: int = BACKUPS, flush_interval: float = FLUSH_INTERVAL,
+                 echo: Optional[bool] = None):
+        self.path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.echo = console_available() if echo is None else echo
+        self.ring: deque = deque(maxlen=ring_size)
+        self._pending: deque = deque(maxlen=PENDING_MAX)
+        self._seq = itertools.count()
+        self._last_written = -1
+        self.dropped = 0          # 書き込み待ちが溢れて捨てた件数
+        self.write_errors = 0
+        self._write_lock = threading.Lock()   # 書き込みスレッドと flush() の間だけ（記録側は使わない）
+        self._stop = threading.Event()
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="ocr-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- 記録（ホットパス） ----
+    def event(self, kind: str, message: str = "", duration: Optional[float] = None, **fields) -> LogEvent:
+        """イベントを記録（deque への append のみ。CPython の deque.append はスレッドセーフ）"""
+        ev = LogEvent(next(self._seq), time.time(), kind, message, duration,
+                      threading.current_thread().name, fields)
+        self.ring.append(ev)
+        self._pending.append(ev)
+        return ev
+
+    def info(self, message: str, **fields) -> LogEvent:
+        return self.event("message", message, **fields)
+
+    @contextmanager
+    def span(self, kind: str, message: str = "", **fields) -> Iterator[Dict[str, Any]]:
+        """with ブロックの所要時間付きでイベントを記録（yield した dict に項目を追加できる）"""
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = repr(e)
+            raise
+        finally:
+            self.event(kind, message, time.perf_counter() - start, **fields)
+
+    # ---- 参照・書き出し ----
+    def recent(self, n: Optional[int] = None, kind: Optional[str] = None) -> List[LogEvent]:
+        """直近 n 件（kind 指定でその種別のみ）"""
+        while True:
+            try:
+                events = list(self.ring)
+                break
+            except RuntimeError:      # 反復中に追記された → 取り直し
+                continue
+        if kind:
+            events = [e for e in events if e.kind == kind]
+        return events[-n:] if n else events
+
+    def dump(self, n: Optional[int] = DUMP_EVENTS, path: Optional[Path] = None, reason: str = "manual") -> Path:
+        """リングバッファの直近 n 件を別ファイルに書き出す（ローテーションの影響を受けない）"""
+        if path is None:
+            base = self.path or DEFAULT_LOG_FILE
+            path = base.with_name(f"{base.stem}_dump_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{reason}.jsonl")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("".join(e.to_json() + "\n" for e in self.recent(n)), encoding="utf-8")
+        return path
+
+    def install_crash_hooks(self, n: Optional[int] = DUMP_EVENTS):
+        """未捕捉例外（メインスレッド・他スレッド）で crash イベントを記録し、直近 n 件を dump"""
+        prev_hook = sys.excepthook
+        prev_thread_hook = threading.excepthook
+
+        def on_crash(exc_type, exc, tb, thread_name):
+            self.event("crash", f"{exc_type.__name__}: {exc}", thread_name=thread_name,
+                       traceback="".join(traceback.format_exception(exc_type, exc, tb)))
+            try:
+                self.flush()
+                self.dump(n, reason="crash")
+            except OSError:
+                pass
+
+        def excepthook(exc_type, exc, tb):
+            if not issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+                on_crash(exc_type, exc, tb, threading.current_thread().name)
+            prev_hook(exc_type, exc, tb)
+
+        def thread_excepthook(args):
+            if args.exc_type is not SystemExit:
+                on_crash(args.exc_type, args.exc_value, args.exc_traceback,
+                         args.thread.name if args.thread else "")
+            prev_thread_hook(args)
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+
+    # ---- 書き込みスレッド ----
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """書き込み待ちをまとめてコンソール・ファイルへ（書き込みスレッドから周期的に呼ばれる）"""
+        with self._write_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._pending.popleft())
+                except IndexError:
+                    break
+            if not batch:
+                return
+            gap = batch[0].seq - self._last_written - 1
+            self._last_written = batch[-1].seq
+            if gap > 0:
+                self.dropped += gap
+                batch.insert(0, LogEvent(-1, batch[0].ts, "dropped", f"書き込み待ちが溢れて {gap}件を破棄",
+                                         thread=self._thread.name, fields={"count": gap}))
+
+            if self.echo:
+                try:
+                    print("\n".join(e.format() for e in batch), flush=True)
+                except (OSError, ValueError, AttributeError):
+                    self.echo = False
+            if self.path:
+                self._write(batch)
+
+    def _write(self, batch: List[LogEvent]):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(e.to_json() + "\n" for e in batch))
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self.write_errors += 1
+
+    def _rotate(self):
+        """ocr.jsonl → ocr.jsonl.1 → … → ocr.jsonl.{backups}（一番古いものは削除）"""
+        for i in range(self.backups, 0, -1):
+            src = self.path if i == 1 else self.path.with_name(f"{self.path.name}.{i - 1}")
+            if src.exists():
+                src.replace(self.path.with_name(f"{self.path.name}.{i}"))
+
+    def close(self):
+        """残りを書き出して書き込みスレッドを止める"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join(timeout=2.0)
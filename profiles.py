@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+profiles.py
+
+名前付きキャプチャプロファイル（何度も読む同じ画面領域向け）
+- 領域・前処理チェーン・固定 psm/lang・文字ホワイトリスト・クリーニングルールを JSON で保存
+- スニップのサイズ（±SIZE_TOLERANCE px）で自動選択、またはプロファイルごとのホットキーで
+  ImageGrab.grab(bbox) により直接取得（スニッピングツール不要、位置も確定）
+- 一致したキャプチャは psm/lang の候補探索をせず、調整済みの設定でエンジン1回だけ
+- 管理: python profiles.py list / python profiles.py add <名前> <left> <top> <width> <height> [key=value ...]
+  （例: add ticket 120 80 260 32 lang=eng psm=7 whitelist=0123456789ABCDEF- hotkey=ctrl+alt+1）
+"""
+
+import json
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageEnhance, ImageFilter, ImageGrab, ImageOps, ImageStat
+
+from ocr_backends import OCRResult
+
+# ======== 設定 ========
+PROFILES_FILE = Path.home() / ".ocr_profiles.json"
+SIZE_TOLERANCE = 6            # 自動選択でのサイズ誤差（px、スニップの枠のぶれ）
+POSITION_TOLERANCE = 12       # 位置が分かるとき（ホットキー取得など）の誤差
+DEFAULT_PREPROCESS = ["gray", "invert", "upscale:3", "sharpen"]
+CLEANINGS = ("none", "whitespace", "full")   # full = 呼び出し側の通常クリーニング
+
+# エンジン1回分の認識: (画像, lang, psm, variables) → OCRResult
+Recognizer = Callable[[Image.Image, str, int, Dict[str, str]], OCRResult]
+
+
+@dataclass
+class CaptureProfile:
+    name: str
+    region: Optional[List[int]] = None     # [left, top, width, height]（画面座標）
+    hotkey: str = ""                       # 例: "ctrl+alt+1"（空ならサイズでの自動選択のみ）
+    auto_match: bool = True                # スニップのサイズで自動選択するか
+    lang: str = "jpn"
+    psm: int = 7
+    preprocess: List[str] = field(default_factory=lambda: list(DEFAULT_PREPROCESS))
+    whitelist: str = ""                    # tessedit_char_whitelist（空なら制限なし）
+    variables: Dict[str, str] = field(default_factory=dict)
+    cleaning: str = "full"                 # CLEANINGS のいずれか
+    rules: List[List[str]] = field(default_factory=list)   # 追加の置換 [[正規表現, 置換], ...]
+
+    @property
+    def bbox(self) -> Optional[Tuple[int, int, int, int]]:
+        if not self.region:
+            return None
+        left, top, width, height = self.region
+        return left, top, left + width, top + height
+
+    @property
+    def scale(self) -> float:
+        """前処理チェーンの拡大率（構造化出力の座標の割り戻し用）"""
+        s = 1.0
+        for step in self.preprocess:
+            name, _, arg = step.partition(":")
+            if name == "upscale":
+                s *= float(arg or 2)
+        return s
+
+    @property
+    def deskews(self) -> bool:
+        """前処理チェーンに傾き・向き補正を含むか（含むと構造化出力の座標は元のキャプチャに戻せない）"""
+        return any(step.partition(":")[0] == "deskew" for step in self.preprocess)
+
+    def engine_variables(self, base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        v = dict(base or {})
+        if self.whitelist:
+            v["tessedit_char_whitelist"] = self.whitelist
+        v.update(self.variables)
+        return v
+
+    def text_of(self, result: OCRResult) -> str:
+        """認識結果の生テキスト（日本語は単語を空白なしで連結。OCRResult.text は空白区切り）"""
+        return result.to_text(joiner="" if "jpn" in self.lang else " ")
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "CaptureProfile":
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in d.items() if k in known})
+
+
+# ======== 保存・読み込み ========
+def load_profiles(path: Path = PROFILES_FILE) -> List[CaptureProfile]:
+    """プロファイル一覧（ファイルが無い・壊れている場合は空）"""
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    return [CaptureProfile.from_dict(d) for d in data.get("profiles", []) if d.get("name")]
+
+
+def save_profiles(profiles: Sequence[CaptureProfile], path: Path = PROFILES_FILE):
+    data = {"profiles": [asdict(p) for p in profiles]}
+    Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+# ======== 選択・取得 ========
+def match_profile(profiles: Sequence[CaptureProfile], size: Tuple[int, int],
+                  position: Optional[Tuple[int, int]] = None) -> Optional[CaptureProfile]:
+    """キャプチャのサイズ（と分かれば位置）が最も近い自動選択プロファイル"""
+    best, best_dist = None, None
+    for p in profiles:
+        if not p.auto_match or not p.region:
+            continue
+        left, top, width, height = p.region
+        if abs(size[0] - width) > SIZE_TOLERANCE or abs(size[1] - height) > SIZE_TOLERANCE:
+            continue
+        dist = abs(size[0] - width) + abs(size[1] - height)
+        if position is not None:
+            if abs(position[0] - left) > POSITION_TOLERANCE or abs(position[1] - top) > POSITION_TOLERANCE:
+                continue
+            dist += abs(position[0] - left) + abs(position[1] - top)
+        if best_dist is None or dist < best_dist:
+            best, best_dist = p, dist
+    return best
+
+
+def grab_region(profile: CaptureProfile) -> Optional[Image.Image]:
+    """プロファイルの領域を直接キャプチャ（マルチモニタ対応）"""
+    if profile.bbox is None:
+        return None
+    return ImageGrab.grab(bbox=profile.bbox, all_screens=True)
+
+
+# ======== 前処理チェーン ========
+def _upscale(img: Image.Image, arg: str) -> Image.Image:
+    f = float(arg or 2)
+    return img.resize((round(img.width * f), round(img.height * f)), Image.BICUBIC)
+
+
+def _invert(img: Image.Image, arg: str) -> Image.Image:
+    # 引数なし: 暗背景なら反転 / "always": 常に反転
+    if arg == "always" or ImageStat.Stat(img).mean[0] < 128:
+        return ImageOps.invert(img)
+    return img
+
+
+def _deskew(img: Image.Image, arg: str) -> Image.Image:
+    from deskew import deskew_image
+    return deskew_image(img, detect_rotation=arg != "angle")[0]
+
+
+def _binarize(img: Image.Image, arg: str) -> Image.Image:
+    from binarize import binarize_image
+    method, _, bg = (arg or "sauvola").partition("+")
+    return binarize_image(img, method, bg == "bg")
+
+
+PREPROCESS_STEPS: Dict[str, Callable[[Image.Image, str], Image.Image]] = {
+    "gray": lambda img, arg: img.convert("L"),
+    "invert": _invert,
+    "upscale": _upscale,
+    "sharpen": lambda img, arg: img.filter(ImageFilter.UnsharpMask(radius=1, percent=int(arg or 50), threshold=0)),
+    "contrast": lambda img, arg: ImageEnhance.Contrast(img).enhance(float(arg or 1.8)),
+    "deskew": _deskew,
+    "binarize": _binarize,
+}
+
+
+def preprocess(img: Image.Image, chain: Sequence[str]) -> Image.Image:
+    """"名前" または "名前:引数" の並びを順に適用（例: ["gray", "invert", "upscale:3", "binarize:sauvola"]）"""
+    img = img.convert("L")
+    for step in chain:
+        name, _, arg = step.partition(":")
+        if name not in PREPROCESS_STEPS:
+            raise ValueError(f"未対応の前処理: {name} (対応: {', '.join(PREPROCESS_STEPS)})")
+        img = PREPROCESS_STEPS[name](img, arg)
+    return img
+
+
+# ======== クリーニング ========
+def _whitespace(text: str) -> str:
+    lines = [line.strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def clean(profile: CaptureProfile, text: str, full: Callable[[str], str]) -> str:
+    """プロファイルのクリーニング（none / whitespace / full）→ 追加の置換ルール"""
+    if profile.cleaning == "full":
+        text = full(text)
+    elif profile.cleaning == "whitespace":
+        text = _whitespace(text)
+    elif profile.cleaning != "none":
+        raise ValueError(f"未対応のクリーニング: {profile.cleaning} (対応: {', '.join(CLEANINGS)})")
+    for pattern, replacement in profile.rules:
+        text = re.sub(pattern, replacement, text)
+    return text.strip()
+
+
+# ======== 認識 ========
+def recognize(profile: CaptureProfile, img: Image.Image, engine: Recognizer,
+              base_variables: Optional[Dict[str, str]] = None,
+              full_clean: Callable[[str], str] = lambda t: t) -> Tuple[str, OCRResult, float]:
+    """前処理チェーン → 固定 lang/psm でエンジン1回 → プロファイルのクリーニング（テキスト, 結果, 前処理秒）"""
+    start = time.perf_counter()
+    pil = preprocess(img, profile.preprocess)
+    t_pre = time.perf_counter() - start
+    result = engine(pil, profile.lang, profile.psm, profile.engine_variables(base_variables))
+    return clean(profile, profile.text_of(result), full_clean), result, t_pre
+
+
+# ======== 管理CLI ========
+def _parse_value(field_name: str, value: str):
+    if field_name == "psm":
+        return int(value)
+    if field_name == "auto_match":
+        return value.lower() in ("1", "true", "yes")
+    if field_name == "preprocess":
+        return [s for s in value.split(",") if s]
+    return value
+
+
+def _main(argv: List[str]):
+    profiles = load_profiles()
+    if argv[:1] == ["add"] and len(argv) >= 6:
+        name, region = argv[1], [int(v) for v in argv[2:6]]
+        profile = CaptureProfile(name, region)
+        for opt in argv[6:]:
+            key, _, value = opt.partition("=")
+            if key not in {f.name for f in fields(CaptureProfile)}:
+                raise SystemExit(f"未対応の項目: {key}")
+            setattr(profile, key, _parse_value(key, value))
+        preprocess(Image.new("L", (8, 8), 255), profile.preprocess)    # チェーンの書式確認
+        profiles = [p for p in profiles if p.name != name] + [profile]
+        save_profiles(profiles)
+        print(f"保存しました: {name} → {PROFILES_FILE}")
+    elif argv[:1] == ["list"]:
+        for p in profiles:
+            print(f"{p.name:>12}: region={p.region} hotkey={p.hotkey or '-'} lang={p.lang} psm={p.psm} "
+                  f"whitelist={p.whitelist or '-'} preprocess={','.join(p.preprocess)} cleaning={p.cleaning}")
+        if not profiles:
+            print(f"プロファイルなし ({PROFILES_FILE})")
+    else:
+        print("使用方法: python profiles.py list")
+        print("          python profiles.py add <名前> <left> <top> <width> <height> [key=value ...]")
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+scheduler.py
+
+並列ワーカー数 × エンジン1回あたりのスレッド数（OMP_THREAD_LIMIT）の配分を管理
+- Tesseract LSTM は内部で OpenMP を使うため、複数同時実行でスレッド数を絞らないとコアを食い合う
+- ジョブ形状ごとに初期配分を決定
+    interactive: 大きなスニップ1枚 → 1ワーカー × 複数スレッド
+    candidates : 同じ画像を psm/lang 違いで数回 → 候補数ワーカー × 残りのコアを分配
+    batch      : 小さな画像を多数 → 画像数（最大コア数）ワーカー × 1スレッド
+- 実行ごとに画素/秒を計測し、隣接する配分を試して速い方へ移動（山登り）。結果は JSON に保存
+- ワーカーは shm_pool.SharedMemoryPool（OMP_THREAD_LIMIT はワーカー初期化時に固定）
+- 選択中の配分と計測値は metrics() で参照
+- ベンチマーク: python scheduler.py bench <コーパス> [shape] [rounds]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from shm_pool import SharedMemoryPool, init_ocr_worker, ocr_array_task
+
+# ======== 設定 ========
+JOB_SHAPES = ("interactive", "candidates", "batch")
+MAX_THREADS = 4              # LSTM の OpenMP 並列はこの辺りで頭打ち
+TUNE_RUNS = 3                # 1配分あたりこの回数計測してから比較
+TUNE_GAIN = 1.05             # 最良よりこれだけ速ければ乗り換え
+EWMA_ALPHA = 0.3             # 画素/秒の指数移動平均
+MAX_POOLS = 2                # 同時に保持するワーカープール（配分ごと）
+DEFAULT_STATE_FILE = Path(tempfile.gettempdir()) / "ocr_scheduler_state.json"
+
+Combo = Tuple[str, int]      # (lang, psm)
+
+
+@dataclass(frozen=True)
+class Split:
+    workers: int
+    threads: int             # OMP_THREAD_LIMIT
+
+    @property
+    def key(self) -> str:
+        return f"{self.workers}x{self.threads}"
+
+    @classmethod
+    def parse(cls, key: str) -> "Split":
+        w, _, t = key.partition("x")
+        return cls(int(w), int(t))
+
+
+def max_workers_for(shape: str, cores: int, jobs: int = 1) -> int:
+    if shape == "interactive":
+        return 1
+    return max(1, min(jobs, cores))
+
+
+def default_split(shape: str, cores: int, jobs: int = 1) -> Split:
+    """コア数とジョブ形状からの初期配分（workers × threads ≦ cores）"""
+    workers = max_workers_for(shape, cores, jobs)
+    if shape == "batch":
+        return Split(workers, 1)
+    return Split(workers, max(1, min(cores // workers, MAX_THREADS)))
+
+
+def _valid(split: Split, cores: int, max_workers: int) -> bool:
+    return (1 <= split.workers <= max_workers and 1 <= split.threads <= MAX_THREADS
+            and split.workers * split.threads <= cores)
+
+
+def neighbours(split: Split, cores: int, max_workers: int) -> List[Split]:
+    """スレッド ±1、ワーカー ±1（スレッドは残りのコアに合わせる）"""
+    out = [Split(split.workers, split.threads + 1), Split(split.workers, split.threads - 1)]
+    for w in (split.workers + 1, split.workers - 1):
+        if w >= 1:
+            out.append(Split(w, max(1, min(split.threads, cores // w))))
+    return [s for s in out if _valid(s, cores, max_workers)]
+
+
+class ShapeTuner:
+    """1つのジョブ形状の配分探索（計測 → 隣接配分を試す → 改善が無ければ確定）"""
+
+    def __init__(self, shape: str, cores: int):
+        self.shape = shape
+        self.cores = cores
+        self.current = default_split(shape, cores)
+        self.rates: Dict[str, float] = {}     # 配分 → 画素/秒（EWMA）
+        self.runs: Dict[str, int] = {}
+        self.settled = False
+        self.max_jobs = 1
+        self.jobs = 1                          # 直近の実行のジョブ数（探索するワーカー数の上限）
+
+    @property
+    def best(self) -> Split:
+        measured = [k for k, n in self.runs.items() if n >= TUNE_RUNS]
+        if not measured:
+            return self.current
+        return Split.parse(max(measured, key=lambda k: self.rates[k]))
+
+    @property
+    def source(self) -> str:
+        if self.settled:
+            return "tuned"
+        return "tuning" if self.runs else "default"
+
+    def choose(self, jobs: int) -> Split:
+        """次の実行に使う配分（ワーカー数は実際のジョブ数を超えない）"""
+        self.jobs = max(jobs, 1)
+        if jobs > self.max_jobs:
+            self.max_jobs = jobs
+            if not self.runs:
+                self.current = default_split(self.shape, self.cores, jobs)
+        split = self.current
+        return Split(min(split.workers, max(jobs, 1)), split.threads)
+
+    def record(self, split: Split, pixels: int, elapsed: float) -> bool:
+        """計測を実際に走った配分で反映。配分を変えたら True（保存のきっかけ）"""
+        if elapsed <= 0:
+            return False
+        key = split.key
+        rate = pixels / elapsed
+        prev = self.rates.get(key)
+        self.rates[key] = rate if prev is None else prev + EWMA_ALPHA * (rate - prev)
+        self.runs[key] = self.runs.get(key, 0) + 1
+        if self.settled:
+            return False
+        moved = False
+        if split != self.current:
+            if split.threads != self.current.threads or split.workers > self.current.workers:
+                return False          # 以前の配分の計測（値だけ残す）
+            # ジョブ数で切り詰められた配分 → 実際に走った配分から探索を続ける（大きなバッチの後も止まらない）
+            self.current, moved = split, True
+        if self.runs[key] < TUNE_RUNS:
+            return moved
+
+        best = self.best
+        max_workers = max_workers_for(self.shape, self.cores, self.jobs)
+        if self.rates[key] < self.rates[best.key] * TUNE_GAIN and best != split:
+            self.current = best       # 試した配分は最良に及ばなかった
+        for cand in neighbours(self.current, self.cores, max_workers):
+            if self.runs.get(cand.key, 0) < TUNE_RUNS:
+                self.current = cand
+                return True
+        self.settled = True
+        return True
+
+    def to_dict(self) -> dict:
+        return {"current": self.current.key, "settled": self.settled, "max_jobs": self.max_jobs,
+                "rates": self.rates, "runs": self.runs}
+
+    def load(self, entry: dict):
+        self.current = Split.parse(entry["current"])
+        self.settled = bool(entry.get("settled"))
+        self.max_jobs = int(entry.get("max_jobs", 1))
+        self.rates = {k: float(v) for k, v in entry.get("rates", {}).items()}
+        self.runs = {k: int(v) for k, v in entry.get("runs", {}).items()}
+
+
+class OCRScheduler:
+    """ジョブ形状に応じた配分でOCRを実行し、計測から配分を自動調整"""
+
+    def __init__(self, tesseract_cmd: str, tessdata_dir: str = "", cores: Optional[int] = None,
+                 state_file: Optional[Path] = DEFAULT_STATE_FILE, log: Callable[[str], None] = print,
+                 task: Callable = ocr_array_task, initializer: Callable = init_ocr_worker):
+        self.tesseract_cmd = tesseract_cmd
+        self.tessdata_dir = tessdata_dir
+        self.cores = cores or os.cpu_count() or 1
+        self.state_file = Path(state_file) if state_file else None
+        self.log = log
+        self.task = task
+        self.initializer = initializer
+        self.tuners = {shape: ShapeTuner(shape, self.cores) for shape in JOB_SHAPES}
+        self._pools: "OrderedDict[Split, SharedMemoryPool]" = OrderedDict()
+        self._busy: Dict[Split, int] = {}
+        self._lock = threading.Lock()
+        self._load_state()
+
+    # ---- 実行 ----
+    def recognize(self, img, lang: str, psm: int, variables: Optional[Dict[str, str]] = None):
+        """interactive: 1枚を1回"""
+        return self.run("interactive", [img], [(0, lang, psm)], variables)[0]
+
+    def recognize_candidates(self, img, combos: Sequence[Combo], variables: Optional[Dict[str, str]] = None):
+        """candidates: 同じ画像を (lang, psm) の組ごとに同時実行（結果は combos の順）"""
+        return self.run("candidates", [img], [(0, lang, psm) for lang, psm in combos], variables)
+
+    def recognize_batch(self, imgs: Sequence, lang: str, psm: int, variables: Optional[Dict[str, str]] = None):
+        """batch: 複数画像を同じ設定で"""
+        return self.run("batch", imgs, [(i, lang, psm) for i in range(len(imgs))], variables)
+
+    def run(self, shape: str, imgs: Sequence, tasks: Sequence[Tuple[int, str, int]],
+            variables: Optional[Dict[str, str]] = None) -> list:
+        """tasks は (画像番号, lang, psm)。同じ画像は共有メモリに1回だけ置く"""
+        arrays = [np.asarray(img) for img in imgs]
+        tuner = self.tuners[shape]
+        with self._lock:
+            split = tuner.choose(len(tasks))
+        pool = self._acquire_pool(split)
+        try:
+            uses = [sum(1 for i, _, _ in tasks if i == n) for n in range(len(arrays))]
+            start = time.perf_counter()
+            descs = [pool.put(a, refs=u) if u else None for a, u in zip(arrays, uses)]
+            futures = [pool.submit_desc(self.task, descs[i], lang, psm, variables, self.tessdata_dir)
+                       for i, lang, psm in tasks]
+            results = [f.result() for f in futures]
+            elapsed = time.perf_counter() - start
+        finally:
+            self._release_pool(split)
+
+        pixels = sum(arrays[i].size for i, _, _ in tasks)
+        with self._lock:
+            changed = tuner.record(split, pixels, elapsed)
+        if changed:
+            if tuner.settled:
+                self.log(f"⚙️  {shape}: {tuner.current.key} (workers x OMP_THREAD_LIMIT) に確定")
+            self._save_state()
+        return results
+
+    # ---- ワーカープール ----
+    def _acquire_pool(self, split: Split) -> SharedMemoryPool:
+        with self._lock:
+            pool = self._pools.get(split)
+            if pool is None:
+                pool = SharedMemoryPool(max_workers=split.workers, initializer=self.initializer,
+                                        initargs=(self.tesseract_cmd, self.tessdata_dir, split.threads))
+                self._pools[split] = pool
+            self._pools.move_to_end(split)
+            self._busy[split] = self._busy.get(split, 0) + 1
+            return pool
+
+    def _release_pool(self, split: Split):
+        evicted = []
+        with self._lock:
+            self._busy[split] -= 1
+            # 使われていない古い配分のプールから閉じる（同時に保持するのは MAX_POOLS まで）
+            idle = [key for key in self._pools if not self._busy.get(key)]
+            while len(self._pools) > MAX_POOLS and idle:
+                evicted.append(self._pools.pop(idle.pop(0)))
+        for pool in evicted:
+            pool.shutdown(wait=False)
+
+    def shutdown(self):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    # ---- 指標 ----
+    def metrics(self) -> dict:
+        """形状ごとの選択中の配分・計測値（Mpx/s）"""
+        with self._lock:
+            shapes = {}
+            for shape, tuner in self.tuners.items():
+                split = tuner.current
+                shapes[shape] = {
+                    "workers": split.workers,
+                    "omp_thread_limit": split.threads,
+                    "source": tuner.source,
+                    "mpx_per_s": round(tuner.rates.get(split.key, 0.0) / 1e6, 2),
+                    "runs": sum(tuner.runs.values()),
+                    "measured": {k: round(v / 1e6, 2) for k, v in tuner.rates.items()},
+                }
+            return {"cores": self.cores, "pools": [s.key for s in self._pools], "shapes": shapes}
+
+    # ---- 保存 ----
+    def _load_state(self):
+        if not self.state_file or not self.state_file.exists():
+            return
+        try:
+            state = json.loads(self.state_file.read_text(encoding="utf-8"))
+            for shape, entry in state.get(str(self.cores), {}).items():
+                if shape in self.tuners:
+                    self.tuners[shape].load(entry)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        try:
+            state = {}
+            if self.state_file.exists():
+                state = json.loads(self.state_file.read_text(encoding="utf-8"))
+            with self._lock:
+                state[str(self.cores)] = {s: t.to_dict() for s, t in self.tuners.items()}
+            self.state_file.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        except (OSError, ValueError) as e:
+            self.log(f"スケジューラ状態の保存に失敗: {e}")
+
+
+# ======== ベンチマーク ========
+def benchmark(corpus: Path, shape: str = "batch", rounds: int = 20, lang: str = "jpn+eng", psm: int = 6,
+              tesseract_cmd: Optional[str] = None):
+    """コーパスを繰り返し流して配分の探索過程と最終的な指標を表示（保存状態は使わない）"""
+    import shutil
+    from PIL import Image
+
+    tesseract_cmd = (tesseract_cmd or os.environ.get("TESSERACT")
+                     or shutil.which("tesseract") or r"C:\Program Files\Tesseract-OCR\tesseract.exe")
+    paths = sorted(p for p in Path(corpus).iterdir()
+                   if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".bmp"))
+    imgs = [Image.open(p).convert("L") for p in paths]
+    if not imgs:
+        raise SystemExit(f"コーパスに画像がありません: {corpus}")
+
+    with OCRScheduler(tesseract_cmd, state_file=None) as sched:
+        print(f"cores={sched.cores}, shape={shape}, images={len(imgs)}")
+        for r in range(rounds):
+            split = sched.tuners[shape].current
+            start = time.perf_counter()
+            if shape == "batch":
+                sched.recognize_batch(imgs, lang, psm)
+            else:
+                for img in imgs:
+                    if shape == "candidates":
+                        sched.recognize_candidates(img, [(lang, 6), (lang, 7)])
+                    else:
+                        sched.recognize(img, lang, psm)
+            print(f"  round {r + 1:>2}: {split.key:>5} {(time.perf_counter() - start) * 1000:7.0f}ms")
+        print(json.dumps(sched.metrics(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "bench":
+        benchmark(Path(sys.argv[2]), *(sys.argv[3:4] or []),
+                  **({"rounds": int(sys.argv[4])} if len(sys.argv) > 4 else {}))
+    else:
+        print("使用方法: python scheduler.py bench <コーパス> [interactive|candidates|batch] [rounds]")
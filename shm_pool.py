@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+shm_pool.py
+
+マルチプロセスOCRワーカー用の共有メモリ画像受け渡し
+- 前処理済み画像は multiprocessing.shared_memory に置き、ワーカーへは
+  記述子 (name, shape, dtype, offset) だけを渡す（数MBの配列をpickleしない）
+- 固定サイズスロットのリングバッファを再利用し、収まらない画像だけ専用セグメントを確保
+- 参照カウントは親プロセス側で管理。ワーカーがクラッシュしても Future 完了時に解放
+- ベンチマーク: python shm_pool.py bench （pickle渡しとの比較）
+
+ワーカー関数は func(arr, *args) の形で、arr は共有メモリ上のビュー。
+タスク終了後に無効になるため、arr のビューを戻り値に含めないこと。
+"""
+
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Deque, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# ======== 設定 ========
+SLOT_BYTES = 16 * 1024 * 1024     # 1スロット = 3倍拡大した一般的なスニップが入る大きさ
+RING_SLOTS = 8
+ALIGN = 64
+
+BENCH_SIZES = {
+    "1x": (600, 800),             # 通常のスニップ（グレースケール）
+    "3x": (1800, 2400),           # light_preprocess 後（3倍拡大）
+    "4K": (2160, 3840),           # 4K全画面キャプチャ
+}
+BENCH_TASKS = 20
+
+
+class ImageDescriptor(NamedTuple):
+    """ワーカーへ渡す共有メモリ上の画像の位置"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+    offset: int = 0
+    slot: int = -1                # リングのスロット番号（-1 = 専用セグメント）
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _unlink_all(segments):
+    """プロセス終了時・GC時の後始末（weakref.finalize から呼ばれる）"""
+    for shm in list(segments):
+        try:
+            shm.close()
+            shm.unlink()
+        except (FileNotFoundError, BufferError, OSError):
+            pass
+    segments.clear()
+
+
+# ======== 親プロセス側 ========
+class SharedImageStore:
+    """共有メモリ上の画像置き場（リングバッファ + 専用セグメント、参照カウント付き）"""
+
+    def __init__(self, slot_bytes: int = SLOT_BYTES, slots: int = RING_SLOTS):
+        self.slot_bytes = _align(slot_bytes)
+        self._lock = threading.Lock()
+        self._segments = []        # finalize 用に全セグメントを保持
+        self._ring = None
+        self._free_slots: Deque[int] = deque(range(slots))
+        if slots:
+            self._ring = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slots)
+            self._segments.append(self._ring)
+        self._dedicated: Dict[str, shared_memory.SharedMemory] = {}
+        self._refs: Dict[Tuple[str, int], int] = {}
+        self._finalizer = weakref.finalize(self, _unlink_all, self._segments)
+
+    def put(self, arr: np.ndarray, refs: int = 1) -> ImageDescriptor:
+        """配列を共有メモリへコピーし記述子を返す（参照数 refs で登録）"""
+        arr = np.ascontiguousarray(arr)
+        with self._lock:
+            if arr.nbytes <= self.slot_bytes and self._free_slots:
+                slot = self._free_slots.popleft()
+                shm, offset = self._ring, slot * self.slot_bytes
+            else:
+                slot, offset = -1, 0
+                shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+                self._dedicated[shm.name] = shm
+                self._segments.append(shm)
+            desc = ImageDescriptor(shm.name, arr.shape, arr.dtype.str, offset, slot)
+            self._refs[(desc.name, desc.offset)] = refs
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=offset)
+        view[...] = arr
+        del view
+        return desc
+
+    def acquire(self, desc: ImageDescriptor):
+        with self._lock:
+            self._refs[(desc.name, desc.offset)] += 1
+
+    def release(self, desc: ImageDescriptor):
+        """参照数を1減らし、0になったらスロット返却 / セグメント破棄"""
+        with self._lock:
+            key = (desc.name, desc.offset)
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+                return
+            self._refs.pop(key, None)
+            if desc.slot >= 0:
+                self._free_slots.append(desc.slot)
+                return
+            shm = self._dedicated.pop(desc.name, None)
+            if shm is not None:
+                self._segments.remove(shm)
+        if shm is not None:
+            _unlink_all([shm])
+
+    def view(self, desc: ImageDescriptor) -> np.ndarray:
+        """親プロセス側で中身を参照（デバッグ用）"""
+        shm = self._ring if desc.slot >= 0 else self._dedicated[desc.name]
+        return np.ndarray(desc.shape, dtype=np.dtype(desc.dtype), buffer=shm.buf, offset=desc.offset)
+
+    @property
+    def in_use(self) -> int:
+        with self._lock:
+            return len(self._refs)
+
+    def close(self):
+        self._finalizer()
+
+
+# ======== ワーカー側 ========
+_ATTACHED: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # プールのワーカーは親と同じ resource_tracker を共有するので登録解除は不要
+    # （解除すると親側の unlink 時に tracker の登録が見つからなくなる）
+    return shared_memory.SharedMemory(name=name)
+
+
+def _worker_call(func: Callable, desc: ImageDescriptor, args: tuple, kwargs: dict):
+    """ワーカー内で記述子から配列ビューを作り func を呼ぶ"""
+    if desc.slot >= 0:
+        shm = _ATTACHED.get(desc.name)
+        if shm is None:
+            shm = _ATTACHED[desc.name] = _attach(desc.name)
+    else:
+        shm = _attach(desc.name)
+    arr = np.ndarray(desc.shape, dtype=np.dtype(desc.dtype), buffer=shm.buf, offset=desc.offset)
+    try:
+        return func(arr, *args, **kwargs)
+    finally:
+        del arr
+        if desc.slot < 0:
+            shm.close()
+
+
+class SharedMemoryPool:
+    """ProcessPoolExecutor + SharedImageStore。submit には配列を渡し、ワーカーへは記述子のみ送る"""
+
+    def __init__(self, max_workers: Optional[int] = None, slot_bytes: int = SLOT_BYTES,
+                 slots: int = RING_SLOTS, initializer: Optional[Callable] = None, initargs: tuple = ()):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.store = SharedImageStore(slot_bytes, slots)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers,
+                                   initializer=self._initializer, initargs=self._initargs)
+
+    def put(self, arr: np.ndarray, refs: int = 1) -> ImageDescriptor:
+        """同じ画像を複数タスクで使う場合は先に put し submit_desc を使う"""
+        return self.store.put(arr, refs)
+
+    def submit(self, func: Callable, arr: np.ndarray, *args, **kwargs) -> Future:
+        return self.submit_desc(func, self.store.put(arr), *args, **kwargs)
+
+    def submit_desc(self, func: Callable, desc: ImageDescriptor, *args, **kwargs) -> Future:
+        """記述子でタスク投入。成功・失敗・ワーカークラッシュのいずれでも参照を1つ解放"""
+        try:
+            future = self._executor.submit(_worker_call, func, desc, args, kwargs)
+        except BrokenProcessPool:
+            # 前回のワーカークラッシュでプールが壊れている → 作り直して再投入
+            self._executor.shutdown(wait=False)
+            self._executor = self._new_executor()
+            future = self._executor.submit(_worker_call, func, desc, args, kwargs)
+        future.add_done_callback(lambda _f: self.store.release(desc))
+        return future
+
+    def map(self, func: Callable, arrays, *args, **kwargs):
+        futures = [self.submit(func, a, *args, **kwargs) for a in arrays]
+        return [f.result() for f in futures]
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+# ======== OCRタスク ========
+_WORKER_BACKENDS = None
+
+
+def init_ocr_worker(tesseract_cmd: str, tessdata_dir: str = "", omp_threads: int = 0):
+    """ワーカー初期化：プロセスごとにバックエンドを1回だけ用意
+
+    omp_threads > 0 なら OMP_THREAD_LIMIT を固定（子プロセスの tesseract と tesserocr の両方に効く）
+    バックエンドの順は親プロセスが保存した選択を読むだけ（ワーカーごとの自己ベンチマークはしない:
+    N ワーカーが同時に計測すると起動が遅れ、CPU を奪い合った計測値も当てにならない）
+    """
+    global _WORKER_BACKENDS
+    if omp_threads:
+        os.environ["OMP_THREAD_LIMIT"] = str(omp_threads)
+    from ocr_backends import BackendManager, create_default_backends
+    _WORKER_BACKENDS = BackendManager(create_default_backends(tesseract_cmd, tessdata_dir=tessdata_dir),
+                                      log=lambda _m: None)
+    _WORKER_BACKENDS.select(benchmark=False)
+
+
+def ocr_array_task(arr: np.ndarray, lang: str, psm: int, variables: Optional[dict] = None,
+                   tessdata_dir: str = ""):
+    """前処理済みグレースケール配列をOCRし OCRResult を返す（init_ocr_worker 済みワーカー用）"""
+    from PIL import Image
+    img = Image.fromarray(arr)
+    return _WORKER_BACKENDS.recognize(img, lang, psm, variables=variables, tessdata_dir=tessdata_dir)
+
+
+# ======== ベンチマーク ========
+def _touch(arr: np.ndarray) -> int:
+    # 転送コストだけを測るため、計算は最小限（全ページを一度読む）
+    return int(arr[::64, ::64].sum())
+
+
+def _timed(submit: Callable[[], Future], tasks: int, wave: int) -> float:
+    """wave 件ずつ投入して待つ（1タスクあたりの秒）
+
+    result() はスロット解放のコールバックより先に戻ることがあるため、後から登録した
+    コールバック（＝解放の後に呼ばれる）で完了を数える。次の波は必ず空いたリングに入る。
+    """
+    finished = threading.Semaphore(0)
+    start = time.perf_counter()
+    for done in range(0, tasks, wave):
+        futures = [submit() for _ in range(min(wave, tasks - done))]
+        for f in futures:
+            f.add_done_callback(lambda _f: finished.release())
+        for f in futures:
+            finished.acquire()
+            f.result()
+    return (time.perf_counter() - start) / tasks
+
+
+def benchmark(sizes=None, tasks: int = BENCH_TASKS, workers: int = 2, slots: int = RING_SLOTS):
+    """pickle渡し vs 共有メモリ記述子渡し（1タスクあたりの往復時間）
+
+    ring はリングのスロットだけ、dedicated は専用セグメントだけを使う（slots=0 のプール）。
+    リングが埋まると専用セグメントに落ちて混ざるため、どの方式も slots 件ずつの波で投入する。
+    """
+    sizes = sizes or BENCH_SIZES
+    slot_bytes = max(h * w for h, w in sizes.values())
+    rng = np.random.default_rng(0)
+    print(f"workers={workers}, tasks={tasks}, wave={slots}")
+    print(f"{'size':>6} {'MB':>7} {'pickle ms':>10} {'ring ms':>8} {'ded ms':>8} {'ring x':>7} {'ded x':>7}")
+    with ProcessPoolExecutor(max_workers=workers) as plain, \
+            SharedMemoryPool(max_workers=workers, slot_bytes=slot_bytes, slots=slots) as ring, \
+            SharedMemoryPool(max_workers=workers, slots=0) as dedicated:
+        # ワーカー起動コストを除外
+        list(plain.map(_touch, [np.zeros((8, 8), np.uint8)] * workers))
+        ring.map(_touch, [np.zeros((8, 8), np.uint8)] * workers)
+        dedicated.map(_touch, [np.zeros((8, 8), np.uint8)] * workers)
+
+        for label, shape in sizes.items():
+            img = rng.integers(0, 256, size=shape, dtype=np.uint8)
+            t_pickle = _timed(lambda: plain.submit(_touch, img), tasks, slots)
+            t_ring = _timed(lambda: ring.submit(_touch, img), tasks, slots)
+            t_ded = _timed(lambda: dedicated.submit(_touch, img), tasks, slots)
+            print(f"{label:>6} {img.nbytes / 1e6:7.1f} {t_pickle * 1000:10.2f} {t_ring * 1000:8.2f} "
+                  f"{t_ded * 1000:8.2f} {t_pickle / t_ring if t_ring else 0:6.1f}x "
+                  f"{t_pickle / t_ded if t_ded else 0:6.1f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(workers=int(sys.argv[2]) if len(sys.argv) > 2 else 2)
+    else:
+        print("使用方法: python shm_pool.py bench [workers]")
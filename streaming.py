@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+streaming.py
+
+大きなキャプチャの段階的（帯ごとの）認識
+- 前処理済み画像を行間の空白で横帯に分割（行の途中では切らない）
+- 最初の帯は小さくして最初の結果を早く出し、以降は目安の高さでまとめて認識
+- 帯ごとにクリーニング済みテキストを StreamChunk として yield（クリップボード・ファイルを逐次更新できる）
+- 最後に consolidate() で全帯の生テキストをまとめてクリーニングし直し、認識結果も1つに結合
+  （帯の境界をまたぐ段落結合などは最終結果で正しくなる）
+- clean_lang を渡すと帯の lang ごとにクリーニングを切り替える（コードモードの帯は日本語向けの補正を通さない）
+"""
+
+import time
+from itertools import groupby
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from deskew import ink_mask
+from ocr_backends import OCRResult, OCRWord
+
+# ======== 設定 ========
+FIRST_BAND_HEIGHT = 450      # 最初の帯の目安高さ（前処理後の画素。3倍拡大で元150px ≒ 数行）
+BAND_HEIGHT = 1200           # 2つ目以降の帯の目安高さ
+SEARCH_RATIO = 0.5           # 目安高さの ±この割合の範囲で切れ目（空白行）を探す
+MIN_GAP = 3                  # 行間とみなす空白行の最小連続数
+
+# 帯1つ分の認識: 画像 → (生テキスト, conf, 認識結果)
+BandRecognizer = Callable[[Image.Image], Tuple[str, float, Optional[OCRResult]]]
+# 言語ごとのクリーニング: (生テキスト, lang) → テキスト（コードの帯に日本語向けの補正をかけない）
+LangCleaner = Callable[[str, str], str]
+
+
+@dataclass
+class StreamChunk:
+    index: int
+    total: int
+    top: int
+    bottom: int
+    raw: str                 # 認識結果の生テキスト
+    text: str                # この帯だけでクリーニングしたテキスト
+    conf: float
+    result: Optional[OCRResult]
+    elapsed: float           # 開始からの経過秒
+
+    @property
+    def final(self) -> bool:
+        return self.index == self.total - 1
+
+    @property
+    def lang(self) -> str:
+        return self.result.lang if self.result is not None else ""
+
+
+def _gaps(blank: np.ndarray, min_gap: int) -> List[Tuple[int, int]]:
+    """空白行の連続区間 (start, end)"""
+    edges = np.diff(np.concatenate(([0], blank.astype(np.int8), [0])))
+    return [(s, e) for s, e in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+            if e - s >= min_gap]
+
+
+def split_bands(gray: np.ndarray, first_height: int = FIRST_BAND_HEIGHT, band_height: int = BAND_HEIGHT,
+                min_gap: int = MIN_GAP) -> List[Tuple[int, int]]:
+    """行間の空白で切った (top, bottom) の一覧。インクの無い帯は含めない"""
+    h = gray.shape[0]
+    ink_rows = ink_mask(gray).any(axis=1)
+    if not ink_rows.any():
+        return []
+    cuts = [int(s + e) // 2 for s, e in _gaps(~ink_rows, min_gap)]
+
+    bands = []
+    top, target = 0, first_height
+    while top < h:
+        lo, hi = top + target * (1 - SEARCH_RATIO), top + target * (1 + SEARCH_RATIO)
+        if hi >= h:
+            bottom = h       # 残りが目安の範囲内なら最後の帯にまとめる（小さな端切れを作らない）
+        else:
+            near = [c for c in cuts if lo <= c <= hi]
+            later = [c for c in cuts if c > hi]
+            if near:
+                bottom = min(near, key=lambda c: abs(c - (top + target)))
+            else:
+                # 目安の範囲に行間が無い（行が高い・詰まっている）→ 次の行間まで伸ばす
+                bottom = later[0] if later else h
+        if ink_rows[top:bottom].any():
+            bands.append((top, bottom))
+        top, target = bottom, band_height
+    return bands
+
+
+def iter_bands(img: Image.Image, recognize: BandRecognizer, clean: Callable[[str], str] = lambda t: t,
+               first_height: int = FIRST_BAND_HEIGHT, band_height: int = BAND_HEIGHT,
+               clean_lang: Optional[LangCleaner] = None) -> Iterator[StreamChunk]:
+    """前処理済み画像を帯ごとに認識し、認識できた順に yield（clean_lang があれば帯の lang で clean の代わりに使う）"""
+    start = time.perf_counter()
+    bands = split_bands(np.array(img.convert("L")), first_height, band_height)
+    for i, (top, bottom) in enumerate(bands):
+        raw, conf, result = recognize(img.crop((0, top, img.width, bottom)))
+        chunk = StreamChunk(i, len(bands), top, bottom, raw, "", conf, result, 0.0)
+        if raw.strip():
+            chunk.text = clean_lang(raw, chunk.lang) if clean_lang else clean(raw)
+        chunk.elapsed = time.perf_counter() - start
+        yield chunk
+
+
+def partial_text(chunks: Sequence[StreamChunk]) -> str:
+    """途中経過（帯ごとのクリーニング結果を連結）"""
+    return "\n".join(c.text for c in chunks if c.text)
+
+
+def merge_results(chunks: Sequence[StreamChunk]) -> Optional[OCRResult]:
+    """帯ごとの認識結果を元画像の座標に戻して1つに結合（block 番号は通し番号に振り直す）"""
+    parts = [c for c in chunks if c.result is not None]
+    if not parts:
+        return None
+    words: List[OCRWord] = []
+    block_base = 0
+    for c in parts:
+        for w in c.result.words:
+            words.append(OCRWord(w.text, w.left, w.top + c.top, w.width, w.height, w.conf,
+                                 w.block_num + block_base, w.par_num, w.line_num, w.word_num))
+        block_base += max((w.block_num for w in c.result.words), default=0)
+    first = parts[0].result
+    return OCRResult(words, backend=first.backend, lang=first.lang, psm=first.psm,
+                     elapsed=sum(c.result.elapsed for c in parts))
+
+
+def consolidate(chunks: Sequence[StreamChunk], clean: Callable[[str], str] = lambda t: t,
+                clean_lang: Optional[LangCleaner] = None) -> Tuple[str, float, Optional[OCRResult]]:
+    """最終結果: 全帯の生テキストをまとめてクリーニング（帯の境界をまたぐ補正のため）
+    clean_lang があれば、続いている同じ lang の帯ごとにまとめてその lang でクリーニング"""
+    filled = [c for c in chunks if c.raw.strip()]
+    confs = [c.conf for c in filled]
+    conf = sum(confs) / len(confs) if confs else 0.0
+    if clean_lang is None:
+        raw = "\n".join(c.raw.strip("\n") for c in filled)
+        return (clean(raw) if raw else ""), conf, merge_results(chunks)
+    parts = [clean_lang("\n".join(c.raw.strip("\n") for c in group), lang)
+             for lang, group in groupby(filled, key=lambda c: c.lang)]
+    return "\n".join(p for p in parts if p), conf, merge_results(chunks)
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+text_cleaning.py
+
+OCR結果の超強化テキストクリーニング（WorkingOCRService.advanced_text_cleaning の本体）
+- 全パターンを入力長に対して線形時間に（入れ子の量指定子・重なる量指定子のバックトラックを排除）
+  - 空白・数字・英単語の連続は「連続ごと1回で読み、後ろの条件はオプショングループ + コールバックで判定」
+  - 「…」の対応が取れない場合も、開き括弧ごとに文末まで読み直さない
+- 大きな入力は、どのパターンもまたがらない行境界で分割してプロセス並列
+  （境界の条件は下の SPLIT_* と各パターンの対応を保つこと。bench で逐次版との一致を確認）
+- ベンチマーク: python text_cleaning.py bench [最大サイズ]
+  （最悪ケース入力で旧パターンとの時間比較・サイズ倍増時の伸び、ランダム入力で並列版の一致確認）
+"""
+
+import bisect
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from lexicon import LEXICON_DIR, USER_LEXICON_DIR, LexiconCorrector, load_corrector
+
+# ======== 設定 ========
+PARALLEL_MIN_CHARS = 200_000   # これ以上の長さのときだけプロセス並列（対話的な通常サイズは逐次のまま）
+CHUNK_CHARS = 50_000           # 並列時の1タスクあたりの目安文字数
+LEXICON_PATHS = (LEXICON_DIR, USER_LEXICON_DIR)   # ワーカーはこの組み合わせで辞書を読み込む
+
+PARTICLES = ['を', 'が', 'に', 'へ', 'と', 'で', 'の', 'も', 'は', 'から', 'まで', 'より', 'こそ', 'ばかり',
+             'だけ', 'でも', 'など', 'として', 'について', 'に対して']
+
+SECTION_TITLES = [
+    '仮想環境の入り方',
+    'ディレクトリ移動',
+    '仮想環境をアクティベート',
+    'プアクティベート',
+    '成功確認',
+    'OCRサービス実行',
+    'トラブルシューティング',
+    '仮想環境が見つからない場合'
+]
+
+# 分割してよい境界: 改行を含む空白の連続（空行・文末の改行）。空白をまたいで読むパターンがあるので
+# 境界の前後の文字で判定する（split_points）。辞書置換で消える・記号になる文字も同様
+# - 空白ごと読む記号（コロン等の整形、矢印、括弧・区切り、コマンド・パスの修正）は前後に来てはいけない
+# - 前後が同じ文字種（和文同士・英字同士・数字同士）なら空白除去で連結される
+# - 直後が助詞そのもの（助詞の前の空白除去）。助詞の先頭文字だけ（これ・なお・まず）なら分割してよい
+# - 直前が「.」なら、直後が英数字（拡張子・小数）か「.」の前が数字（番号付きリスト）のとき連結される
+SPLIT_NOT_AFTER = set("（［｛「『:;#|｜\\*→>—–−-")
+SPLIT_NOT_BEFORE = set("、。！？）］｝」』:;#→>—–−-・.,*\\")
+SPLIT_RE = re.compile(r'\s+')     # 空白の連続ごと1回（改行を含むものだけ境界の候補）
+RE_JP_CHAR = re.compile(r'[あ-んア-ヶーァィゥェォャュョッ一-龥々〆ヵヶ]')
+RE_ALPHA_CHAR = re.compile(r'[A-Za-z]')
+RE_DIGIT_CHAR = re.compile(r'[0-9]')
+
+WS = r'[\s\u3000]'
+
+
+def _keep_unless(group: int, repl):
+    """オプショングループ group が一致したときだけ置換し、それ以外は一致範囲をそのまま返す"""
+    def sub(m):
+        if m.group(group) is None:
+            return m.group(0)
+        return repl(m) if callable(repl) else m.expand(repl)
+    return sub
+
+
+def _around(symbol: str, ws: str = WS) -> re.Pattern:
+    """「空白* 記号 空白*」の線形版: 記号が続かない空白の連続は1回で読み飛ばす"""
+    return re.compile(rf'{ws}*{symbol}{ws}*|{ws}+')
+
+
+def _replace_around(pattern: re.Pattern, symbol: str, replacement: str, text: str) -> str:
+    return pattern.sub(lambda m: replacement if symbol in m.group(0) else m.group(0), text)
+
+
+# ======== パターン ========
+# 空白の連続 + 後続文字（元: [\s]+X。空白の途中の各位置から読み直すと連続の長さの2乗）
+RE_SPACE_BEFORE_CLOSE = re.compile(rf'{WS}+([、。！？）］｝」』])?')
+RE_SPACE_BEFORE_PARTICLE = re.compile(rf"{WS}+({'|'.join(PARTICLES)})?")
+RE_COLON = _around(':')
+RE_SEMICOLON = _around(';')
+RE_HASH = _around('#')
+RE_ARROW = _around('→', r'[\s]')
+
+# 数字・英単語の連続 + 後続（元: (\d+)\s*\. 。連続の途中の各位置から読み直すと2乗）
+RE_NUMBER_DOT = re.compile(rf'(\d+)({WS}*\.{WS}*)?')
+RE_NUMBER_DASH = re.compile(rf'(\d+)({WS}*-{WS}*)?')
+RE_FILENAME = re.compile(rf'([a-zA-Z0-9_]+)(?:{WS}*\.{WS}*([a-zA-Z]+))?')
+
+# クォート・括弧（元の [|｜]\s*['"]*([^'"\n]+)['"]*\s*:… はキー部分が空白・コロンと重なり、
+# 区切り「|」ごとに行末まで2重に読み直していた → キーは空白で始まらず空白で終わらない、
+# コロン・区切りを含まない文字列に限定）
+DICT_KEY = r'[^\'"\s:|｜](?:[^\'"\n:|｜]*[^\'"\s:|｜])?'
+RE_PIPE_DICT = re.compile(rf'[|｜][\s]*[\'"]*({DICT_KEY})[\'"]*[\s]*:[\s]*[\'"]*([^\'"\n]+)[\'"]*')
+RE_BRACKET_DICT = re.compile(r'「(?:([^」]+)(?:」[\s]*:[\s]*「([^」]+)」)?)?')
+RE_BRACKET_ITEM = re.compile(r'「(?:([^」]+)(」[\s]*,)?)?')
+RE_BRACKET = re.compile(r'「(?:([^」]+)(」)?)?')
+RE_DOUBLE_BRACKET = re.compile(r'『(?:([^』]+)(』)?)?')
+# 引用符の連続の途中から始めても結果は同じなので、連続の先頭からだけ試す
+RE_QUOTE_DICT = re.compile(r'(?<![\'"])[\'"]+([^\'"\n]+)[\'"]+[\s]*:[\s]*[\'"]+([^\'"\n]+)[\'"]+')
+
+SECTION_PATTERNS = [(re.compile(rf'([。！？])({re.escape(t)})'),
+                     re.compile(rf'({re.escape(t)})([あ-んア-ヶー一-龥々A-Za-z])')) for t in SECTION_TITLES]
+
+
+def clean_text(text: str, lexicon: Optional[LexiconCorrector] = None) -> str:
+    """超強化テキストクリーニング（改行修正強化版）。全ステップ入力長に対して線形"""
+    if not text:
+        return text
+
+    # 0. 特殊文字の前処理
+    text = text.replace('・:', ': ')  # ・: → :
+    text = text.replace('、。', '。')   # 、。 → 。
+
+    # 1. 日本語文字間スペース除去（強化版）
+    # ひらがな間（全角・半角スペース両対応）
+    text = re.sub(r'([あ-ん])[\s\u3000]+([あ-ん])', r'\1\2', text)
+
+    # カタカナ間（長音記号・小文字含む）
+    text = re.sub(r'([ア-ヶーァィゥェォャュョッ])[\s\u3000]+([ア-ヶーァィゥェォャュョッ])', r'\1\2', text)
+
+    # 漢字間
+    text = re.sub(r'([一-龥々〆ヵヶ])[\s\u3000]+([一-龥々〆ヵヶ])', r'\1\2', text)
+
+    # 2. 文字種混在間のスペース除去（強化版）
+    # あらゆる日本語文字間
+    text = re.sub(r'([あ-んア-ヶーァィゥェォャュョッ一-龥々〆ヵヶ])[\s\u3000]+([あ-んア-ヶーァィゥェォャュョッ一-龥々〆ヵヶ])', r'\1\2', text)
+
+    # 3. 英数字の調整（超強化版）
+    # 英字間のスペース除去（ただし単語境界は保持）
+    text = re.sub(r'([A-Za-z])[\s\u3000]+([A-Za-z])', r'\1\2', text)
+
+    # 数字間のスペース除去
+    text = re.sub(r'([0-9])[\s\u3000]+([0-9])', r'\1\2', text)
+
+    # ピリオド・ドットまわり
+    text = re.sub(r'([A-Za-z0-9])[\s\u3000]*\.[\s\u3000]*([A-Za-z0-9])', r'\1.\2', text)
+
+    # 4. プログラミング関連の修正
+    # コマンドライン系
+    text = re.sub(r'python[\s\u3000]+\.[\s\u3000]*\\', r'python .\\', text)
+    text = re.sub(r'dir[\s\u3000]*\*[\s\u3000]*\.[\s\u3000]*py', r'dir *.py', text)
+    text = re.sub(r'ls[\s\u3000]*\*[\s\u3000]*\.[\s\u3000]*py', r'ls *.py', text)
+    text = re.sub(r'bash[\s\u3000]*#', r'bash\n#', text)
+    text = re.sub(r'#[\s\u3000]*([A-Za-z])', r'# \1', text)
+
+    # ファイルパス修正
+    text = re.sub(r'C[\s\u3000]*:[\s\u3000]*\\[\s\u3000]*python[\s\u3000]*\\', r'C:\\python\\', text)
+
+    # 5. 記号まわり（超強化版）
+    # 句読点前のスペース除去
+    text = RE_SPACE_BEFORE_CLOSE.sub(_keep_unless(1, r'\1'), text)
+
+    # 開始記号後のスペース除去
+    text = re.sub(r'([（［｛「『])[\s\u3000]+', r'\1', text)
+
+    # コロン・セミコロンまわり
+    text = _replace_around(RE_COLON, ':', ': ', text)
+    text = _replace_around(RE_SEMICOLON, ';', '; ', text)
+
+    # ハッシュ（#）まわり
+    text = _replace_around(RE_HASH, '#', '# ', text)
+
+    # 6. 助詞・語尾の修正（強化版）。全助詞を1パスで
+    text = RE_SPACE_BEFORE_PARTICLE.sub(_keep_unless(1, r'\1'), text)
+
+    # 7. 数字・記号組み合わせ
+    text = RE_NUMBER_DOT.sub(_keep_unless(2, r'\1. '), text)  # 1. → 1.
+    text = RE_NUMBER_DASH.sub(_keep_unless(2, r'\1-'), text)  # 1 - → 1-
+
+    # 8. 英語特有のパターン
+    # ファイル名・拡張子
+    text = RE_FILENAME.sub(_keep_unless(2, r'\1.\2'), text)
+
+    # 9. ★★ 改行修正（強化版）★★
+    # 見出し・セクション境界の改行追加
+    text = re.sub(r'([。！？])([1-9]\.|仮想環境|トラブルシューティング|PowerShell|OCR|手順)', r'\1\n\n\2', text)
+
+    # 番号付きリストの改行
+    text = re.sub(r'([。！？])([1-9]\.[^0-9])', r'\1\n\n\2', text)
+
+    # PowerShellコードブロックの改行
+    text = re.sub(r'powershell([a-zA-Z])', r'powershell\n\1', text)
+    text = re.sub(r'([^:\n])powershell', r'\1\n\npowershell', text)
+
+    # コマンド間の改行
+    text = re.sub(r'(\.py)([a-zA-Z#])', r'\1\n\2', text)
+    text = re.sub(r'(activate)([a-zA-Z])', r'\1\n\n\2', text)
+
+    # bash/cmd行の修正（[\s]*\n?[\s]* は [\s]* と同じ。重なる量指定子を1つに）
+    text = re.sub(r'bash[\s\u3000]*#', r'bash\n#', text)
+
+    # セクションタイトルの前後改行
+    for before, after in SECTION_PATTERNS:
+        text = before.sub(r'\1\n\n\2', text)
+        text = after.sub(r'\1\n\2', text)
+
+    # 10. 特殊ケースの修正（超強化版）
+
+    # A/B. 英数字・日本語の誤認識修正（辞書索引による1パス補正）
+    # 用語・置換ルールは lexicon/ と ~/.ocr_lexicon/ のファイルで管理
+    if lexicon is not None:
+        text = lexicon.correct(text)
+
+    # C. プログラミング特化修正（正規表現）
+    programming_fixes = [
+        # Pythonコマンド修正
+        (r'python[\s]*\.[\s]*py', r'python *.py'),
+        (r'python[\s]*\.[\s]*\\', r'python .\\'),
+        (r'python[\s]*\.[\s]*working_ocr_service[\s]*\.[\s]*py', r'python .\\working_ocr_service.py'),
+
+        # ファイルパス修正
+        (r'C[\s]*:[\s]*\\[\s]*python', r'C:\\python'),
+        (r'ocr_env[\s]*\\[\s]*Scripts[\s]*\\[\s]*activate', r'ocr_env\\Scripts\\activate'),
+
+        # bash/powershell修正
+        (r'bash[\s]*#', r'bash\n#'),
+        (r'bash[\s]*python', r'bash\npython'),
+        (r'powershell[\s]*([a-zA-Z])', r'powershell\n\1'),
+
+        # 拡張子・ファイル名修正
+        (r'\.[\s]*py[\s]*>', r'.py →'),
+        (r'\.[\s]*py', r'.py'),
+        (r'\.[\s]*txt', r'.txt'),
+        (r'\.[\s]*exe', r'.exe'),
+
+        # コマンド区切り修正
+        (r'(\.py)([a-zA-Z])', r'\1\n\2'),
+        (r'(activate)([a-zA-Z])', r'\1\n\n\2'),
+    ]
+
+    for pattern, replacement in programming_fixes:
+        text = re.sub(pattern, replacement, text)
+
+    # D. クォート・括弧内の文字列修正
+    # Python辞書形式の修正
+    text = RE_PIPE_DICT.sub(r"'\1': '\2'", text)
+    text = RE_BRACKET_DICT.sub(_keep_unless(2, r"'\1': '\2'"), text)
+    text = RE_BRACKET_ITEM.sub(_keep_unless(2, r"'\1',"), text)
+
+    # 一般的なクォート修正
+    text = RE_BRACKET.sub(_keep_unless(2, r'\1'), text)
+    text = RE_DOUBLE_BRACKET.sub(_keep_unless(2, r'\1'), text)
+    text = RE_QUOTE_DICT.sub(r"'\1': '\2'", text)
+
+    # E. 矢印・記号の統一
+    text = re.sub(r'[—–−]', r'→', text)
+    text = text.replace('>', '→')
+    text = _replace_around(RE_ARROW, '→', ' → ', text)
+    text = re.sub(r'\.py[\s]*→[\s]*py', r'.py → .py', text)
+
+    # 11. 行単位清掃（強化版）
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line:  # 空行でない場合のみ
+            # 行内の重複スペース除去
+            line = re.sub(r'[\s\u3000]{2,}', ' ', line)
+            lines.append(line)
+
+    text = '\n'.join(lines)
+
+    # 12. 最終的な改行構造の整理
+    # 重複改行の整理（ただし構造的改行は保持）
+    text = re.sub(r'\n{4,}', '\n\n\n', text)  # 4個以上の改行を3個に
+    text = re.sub(r'\n{3}', '\n\n', text)     # 3個の改行を2個に
+
+    # 13. 最終調整
+    # 全角スペースを半角に統一
+    text = text.replace('\u3000', ' ')
+
+    # 行頭・行末の空白除去
+    text = '\n'.join(line.strip() for line in text.splitlines())
+
+    # 文全体の前後空白除去
+    return text.strip()
+
+
+# ======== 分割・並列 ========
+def _lexicon_blocked(lexicon: Optional[LexiconCorrector]) -> Tuple[set, set]:
+    """辞書置換で境界の条件が崩れる文字: (境界の直後に来てはいけない文字, 直前に来てはいけない文字)"""
+    before, after = set(), set()
+    if lexicon is None:
+        return before, after
+    for wrong, right in lexicon.replacements.items():
+        if not right or right[0] in SPLIT_NOT_BEFORE or right[0].isspace():
+            before.add(wrong[0])
+        if not right or right[-1] in SPLIT_NOT_AFTER or right[-1].isspace() or any(
+                c == "." or c.isdecimal() for c in right):
+            after.add(wrong[-1])
+        # 空白を含む誤り（"py >" など）は境界をまたいで一致しうる
+        for i, c in enumerate(wrong):
+            if c.isspace():
+                if i > 0:
+                    after.add(wrong[i - 1])
+                if i + 1 < len(wrong):
+                    before.add(wrong[i + 1])
+    return before, after
+
+
+def _symbol_joined(text: str, start: int, end: int) -> bool:
+    """text[start - 1] と text[end] の間の空白を、記号まわりのパターンが読むか"""
+    a, b = text[start - 1], text[end]
+    if a in SPLIT_NOT_AFTER or b in SPLIT_NOT_BEFORE:
+        return True
+    if a == ".":
+        if b.isalnum():
+            return True
+        i = start - 2
+        while i >= 0 and text[i].isspace():
+            i -= 1
+        if i >= 0 and text[i].isdecimal():
+            return True
+    return False
+
+
+def _joined_across(text: str, start: int, end: int) -> bool:
+    """空白 text[start:end] をまたいでどれかのパターンが一致するか（境界の前後の文字だけで判定）"""
+    a, b = text[start - 1], text[end]
+    for char_class in (RE_JP_CHAR, RE_ALPHA_CHAR, RE_DIGIT_CHAR):
+        if char_class.match(a) and char_class.match(b):
+            return True
+    if any(text.startswith(p, end) for p in PARTICLES):
+        return True
+    if _symbol_joined(text, start, end):
+        return True
+    # 「」『』は後段で外れることがあり、中身の先頭・末尾が境界に接する → 括弧と空白を飛ばした文字でも判定
+    while start > 0 and (text[start - 1].isspace() or text[start - 1] in "」』"):
+        start -= 1
+    while end < len(text) and (text[end].isspace() or text[end] in "「『"):
+        end += 1
+    return start > 0 and end < len(text) and _symbol_joined(text, start, end)
+
+
+def _bracket_events(text: str) -> List[Tuple[int, bool]]:
+    """括弧の位置ごとに (位置, その直後で分割すると危険か)。「」『』がそれぞれ交互に現れて閉じていれば安全"""
+    events = []
+    state = {"「": False, "『": False}
+    pair = {"」": "「", "』": "『"}
+    broken = False
+    for m in re.finditer(r"[「」『』]", text):
+        c = m.group(0)
+        if c in state:
+            broken = broken or state[c]      # 閉じる前に次の開き括弧 → 以降は分割しない
+            state[c] = True
+        else:
+            state[pair[c]] = False
+        events.append((m.start(), broken or any(state.values())))
+    return events
+
+
+def split_points(text: str, lexicon: Optional[LexiconCorrector] = None) -> List[int]:
+    """どのパターンもまたがらない分割位置（境界の空白中の最後の改行の直後）"""
+    blocked_before, blocked_after = _lexicon_blocked(lexicon)
+    events = _bracket_events(text)
+    positions = [pos for pos, _ in events]
+
+    points = []
+    for m in SPLIT_RE.finditer(text):
+        if "\n" not in m.group(0) or m.start() == 0 or m.end() == len(text):
+            continue
+        if text[m.start() - 1] in blocked_after or text[m.end()] in blocked_before:
+            continue
+        if _joined_across(text, m.start(), m.end()):
+            continue
+        i = bisect.bisect_left(positions, m.start())
+        if i > 0 and events[i - 1][1]:
+            continue
+        points.append(m.start() + m.group(0).rindex("\n") + 1)
+    return points
+
+
+def split_chunks(text: str, chunk_chars: int = CHUNK_CHARS,
+                 lexicon: Optional[LexiconCorrector] = None) -> List[str]:
+    """分割位置で区切り、目安の長さごとにまとめたチャンク"""
+    chunks, start = [], 0
+    for p in split_points(text, lexicon):
+        if p - start >= chunk_chars:
+            chunks.append(text[start:p])
+            start = p
+    chunks.append(text[start:])
+    return chunks
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_key = None
+
+
+def _init_worker(lexicon_paths: Tuple[Path, ...]):
+    load_corrector(*lexicon_paths)
+
+
+def _clean_chunk(chunk: str, lexicon_paths: Tuple[Path, ...]) -> str:
+    return clean_text(chunk, load_corrector(*lexicon_paths) if lexicon_paths else None)
+
+
+def _get_pool(workers: int, lexicon_paths: Tuple[Path, ...]) -> ProcessPoolExecutor:
+    global _pool, _pool_key
+    if _pool is None or _pool_key != (workers, lexicon_paths):
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(lexicon_paths,))
+        _pool_key = (workers, lexicon_paths)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_key
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool, _pool_key = None, None
+
+
+def clean_text_parallel(text: str, lexicon_paths: Sequence[Path] = LEXICON_PATHS, workers: Optional[int] = None,
+                        min_chars: int = PARALLEL_MIN_CHARS, chunk_chars: int = CHUNK_CHARS) -> str:
+    """大きな入力は段落境界で分割してプロセス並列（結果は clean_text と同一）。小さな入力は逐次"""
+    lexicon_paths = tuple(lexicon_paths)
+    workers = workers or os.cpu_count() or 1
+    if len(text) < min_chars or workers <= 1:
+        return _clean_chunk(text, lexicon_paths)
+    chunks = split_chunks(text, chunk_chars, load_corrector(*lexicon_paths) if lexicon_paths else None)
+    if len(chunks) == 1:
+        return _clean_chunk(text, lexicon_paths)
+    pool = _get_pool(min(workers, len(chunks)), lexicon_paths)
+    cleaned = pool.map(_clean_chunk, chunks, [lexicon_paths] * len(chunks))
+    return "\n".join(c for c in cleaned if c)
+
+
+# ======== ベンチマーク ========
+# 書き換え前のパターン（比較用）
+LEGACY_PATTERNS = {
+    "pipe_dict": (r'[|｜][\s]*[\'\"]*([^\'\"\n]+)[\'\"]*[\s]*[:\:][\s]*[\'\"]*([^\'\"\n]+)[\'\"]*', r"'\1': '\2'"),
+    "quote_dict": (r'[\'\"]+([^\'\"\n]+)[\'\"]+[\s]*:[\s]*[\'\"]+([^\'\"\n]+)[\'\"]+', r"'\1': '\2'"),
+    "bracket_item": (r'「([^」]+)」[\s]*,', r"'\1',"),
+    "space_colon": (r'[\s\u3000]*:[\s\u3000]*', ': '),
+    "number_dot": (r'(\d+)[\s\u3000]*\.[\s\u3000]*', r'\1. '),
+    "bash": (r'bash[\s]*\n?[\s]*#', r'bash\n#'),
+}
+
+# 最悪ケース入力（n 文字前後）: 各パターンのバックトラックを誘発する形
+WORST_CASES = {
+    "pipe_dict": lambda n: "| " + " " * (n // 2) + "x" * (n // 2),
+    "quote_dict": lambda n: "'" * (n // 2) + "a" * (n // 2),
+    "bracket_item": lambda n: "「" * (n - 1) + "」",
+    "space_colon": lambda n: " " * n + "x",
+    "number_dot": lambda n: "1" * n + "x",
+    "bash": lambda n: "bash" + " " * n + "x",
+}
+
+
+def fuzz_text(rng: random.Random, n: int, stray_brackets: bool = True) -> str:
+    """記号・空白・改行・日本語が多いランダム入力（並列版の一致確認用）。
+    stray_brackets=False なら括弧は対になったものだけ（対応の取れない括弧以降は分割されないため）"""
+    symbols = " \u3000\n\t|｜'\":;#.,-—>→、。！？!?()（）0123456789"
+    alphabet = (list(symbols) + list("abcxyzpythonbash") + list("あいをがにのはアイウ漢字") + PARTICLES
+                + SECTION_TITLES + ["。\n\n", "。\n", "\n\n", " \n ", "これ", "なお", "powershell", ".py", "| 'k': 'v'", "「a」: 「b」", "「c」", "『d』"])
+    if stray_brackets:
+        alphabet += list("「」『』")
+    out, size = [], 0
+    while size < n:
+        s = rng.choice(alphabet)
+        out.append(s)
+        size += len(s)
+    return "".join(out)
+
+
+def _timed(fn: Callable[[], object], limit: float) -> Optional[float]:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return elapsed if elapsed <= limit else None
+
+
+def benchmark(max_chars: int = 64_000, limit: float = 2.0):
+    """最悪ケースの旧/新パターン時間（サイズ倍増ごと）と、ランダム入力での全体時間・並列一致"""
+    sizes = []
+    n = 1000
+    while n <= max_chars:
+        sizes.append(n)
+        n *= 2
+
+    print(f"{'case':>14} {'n':>7} {'legacy ms':>10} {'new ms':>8}")
+    for name, make in WORST_CASES.items():
+        pattern, repl = LEGACY_PATTERNS[name]
+        legacy_done = False
+        for n in sizes:
+            text = make(n)
+            legacy = None if legacy_done else _timed(lambda: re.sub(pattern, repl, text), limit)
+            legacy_done = legacy is None
+            new = _timed(lambda: clean_text(text), float("inf"))
+            legacy_ms = f"{legacy * 1000:.1f}" if legacy is not None else f">{limit * 1000:.0f}"
+            print(f"{name:>14} {n:>7} {legacy_ms:>10} {new * 1000:8.1f}")
+
+    rng = random.Random(0)
+    lexicon = load_corrector(*LEXICON_PATHS)
+    print(f"\n{'fuzz chars':>10} {'seq ms':>8} {'par ms':>8} {'chunks':>6} {'same':>5}")
+    for n in (10_000, 100_000, 1_000_000):
+        text = fuzz_text(rng, n, stray_brackets=False)
+        start = time.perf_counter()
+        seq = clean_text(text, lexicon)
+        t_seq = time.perf_counter() - start
+        start = time.perf_counter()
+        par = clean_text_parallel(text, workers=max(os.cpu_count() or 1, 2), min_chars=0,
+                                  chunk_chars=max(n // 8, 1000))
+        t_par = time.perf_counter() - start
+        print(f"{n:>10} {t_seq * 1000:8.0f} {t_par * 1000:8.0f} "
+              f"{len(split_chunks(text, max(n // 8, 1000), lexicon)):>6} {str(seq == par):>5}")
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        benchmark(*(int(a) for a in sys.argv[2:3]))
+    else:
+        print("使用方法: python text_cleaning.py bench [最大サイズ]")
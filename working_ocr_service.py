@@ -12,27 +12,29 @@ import os
 import sys
 import time
 import subprocess
+from dataclasses import asdict
 from datetime import datetime
 from pathlib import Path
-import re
 import tempfile
 
 print("📚 基本ライブラリインポート中...")
 
-# 基本ライブラリ
+# 基本ライブラリ（corpus.py の replay など headless での import では無くてもよい）
 try:
     import keyboard
     print("✅ keyboard: OK")
 except ImportError as e:
     print(f"❌ keyboard: {e}")
-    sys.exit(1)
+    if __name__ == "__main__":
+        sys.exit(1)
 
 try:
     import pyperclip
     print("✅ pyperclip: OK")
 except ImportError as e:
     print(f"❌ pyperclip: {e}")
-    sys.exit(1)
+    if __name__ == "__main__":
+        sys.exit(1)
 
 # PIL関連
 try:
@@ -70,6 +72,49 @@ except ImportError as e:
     print(f"⚠️  OpenCV: {e} (オプション)")
     CV2_AVAILABLE = False
 
+from ocr_backends import BackendError, BackendManager, create_default_backends, list_languages
+from ocr_export import write_exports
+from lexicon import LEXICON_DIR, USER_LEXICON_DIR, load_corrector
+from ocr_log import RingLogger
+from corpus import CorpusRecorder
+from text_cleaning import LEXICON_PATHS, PARALLEL_MIN_CHARS, clean_text, clean_text_parallel, shutdown_pool
+
+# 傾き補正（NumPy必須）
+try:
+    from deskew import deskew_image, detect_vertical
+    DESKEW_AVAILABLE = True
+except ImportError:
+    DESKEW_AVAILABLE = False
+
+# 適応的二値化（NumPy必須）
+try:
+    from binarize import binarize_image
+    BINARIZE_AVAILABLE = True
+except ImportError:
+    BINARIZE_AVAILABLE = False
+
+# 帯ごとの段階的認識（NumPy必須）
+try:
+    from streaming import FIRST_BAND_HEIGHT, consolidate, iter_bands, partial_text
+    STREAMING_AVAILABLE = True
+except ImportError:
+    STREAMING_AVAILABLE = False
+
+# コード・数値モード（NumPy必須）
+try:
+    from code_mode import CODE_LANG, CODE_PSM, code_clean, detect_code, looks_like_code, recognize_code
+    CODE_MODE_AVAILABLE = True
+except ImportError:
+    CODE_MODE_AVAILABLE = False
+
+# キャプチャプロファイル（PIL必須）
+try:
+    from profiles import grab_region, load_profiles, match_profile
+    from profiles import recognize as recognize_profile
+    PROFILES_AVAILABLE = True
+except ImportError:
+    PROFILES_AVAILABLE = False
+
 print("🔧 ライブラリチェック完了\n")
 
 # ======== 設定 ========
@@ -79,15 +124,53 @@ OUT_DIR = Path(r"D:\Python\OCR\Hotkey_ocr")
 # OCR設定
 LANG = "jpn+eng"
 PSM = 6
+VERTICAL_DETECT = True       # 縦書き判定（数ms）→ 縦書きなら下の設定で認識
+LANG_VERTICAL = "jpn_vert"
+PSM_VERTICAL = 5
+TESS_VARIABLES = {"user_defined_dpi": "300"}
+UPSCALE = 3
+DESKEW = True     # 傾き・90°/180°向き補正
+BINARIZE = "none"     # "none" / "otsu" / "niblack" / "sauvola"（1bit画像でエンジンへ渡す）
+BG_NORMALIZE = False  # 二値化前に背景ムラ・色付き背景を除去
+CODE_MODE = True         # 端末出力・パス・16進ID・数値は eng のみ・文字制限・psm 6 で1回（等幅の字送り or 1回目の結果で判定）
+STREAMING = True         # 大きな画像は帯ごとに認識し、途中結果をクリップボード・ファイルへ
+STREAM_MIN_HEIGHT = 400  # これ以上の高さ（元画像px）のときだけ帯分割
+
+# 構造化出力（例: ("json", "hocr", "alto")）。テキストと同じ場所に同名で保存
+EXPORT_FORMATS = ()
+
+# キャプチャプロファイル（~/.ocr_profiles.json、python profiles.py add で登録）
+# スニップのサイズが一致するか専用ホットキーなら、候補探索なしの固定設定でエンジン1回
+USE_PROFILES = True
+
+# 実キャプチャの記録（python corpus.py replay でオフラインの回帰チェックに使う）
+RECORD_CORPUS = False
+CORPUS_DIR = OUT_DIR / "corpus"
 
-# ======== 初期化 ========
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+# ログ（JSON Lines、サイズでローテーション。pythonw・非表示起動でもファイルに残る）
+LOG_FILE = OUT_DIR / "logs" / "working_ocr.jsonl"
+LOG_DUMP_EVENTS = 500    # Ctrl+Alt+L・クラッシュ時に書き出す直近イベント数
 
 class WorkingOCRService:
     def __init__(self):
         self.running = True
+        self.logger = RingLogger(LOG_FILE)
+        self.logger.install_crash_hooks(LOG_DUMP_EVENTS)
         self.temp_dir = Path(tempfile.gettempdir()) / "working_ocr"
         self.temp_dir.mkdir(exist_ok=True)
+        self.last_result = None
+        self.last_deskew = None      # 直近の前処理の傾き・向き補正（構造化出力の座標を元に戻す）
+        self.vertical_available = False
+        self.code_mode = CODE_MODE and CODE_MODE_AVAILABLE
+        self.profiles = load_profiles() if USE_PROFILES and PROFILES_AVAILABLE else []
+        self.recorder = CorpusRecorder(CORPUS_DIR) if RECORD_CORPUS else None
+        
+        # 後補正用の辞書索引（起動時に1回だけ構築）
+        self.lexicon = load_corrector(LEXICON_DIR, USER_LEXICON_DIR)
+        
+        # OCRバックエンド（pytesseract / 直接実行 / tesserocr）
+        self.backends = BackendManager(create_default_backends(TESSERACT, self.temp_dir),
+                                       log=self.log)
         
         # Tesseract確認
         if not Path(TESSERACT).exists():
@@ -97,7 +180,10 @@ class WorkingOCRService:
             return
         
         print("✅ Tesseract確認完了")
+        self.vertical_available = VERTICAL_DETECT and DESKEW_AVAILABLE and all(
+            lang in list_languages(TESSERACT) for lang in LANG_VERTICAL.split("+"))
         self.log_capabilities()
+        self.backends.select(lang=LANG, psm=PSM)
         
     def log_capabilities(self):
         """利用可能機能をログ出力"""
@@ -106,6 +192,13 @@ class WorkingOCRService:
         print(f"  NumPy配列: {'✅' if NUMPY_AVAILABLE else '❌'}")
         print(f"  pytesseract: {'✅' if PYTESSERACT_AVAILABLE else '❌'}")
         print(f"  OpenCV: {'✅' if CV2_AVAILABLE else '❌'}")
+        print(f"  傾き補正: {'✅' if DESKEW and DESKEW_AVAILABLE else '❌'}")
+        print(f"  縦書き判定: {'✅ ' + LANG_VERTICAL if self.vertical_available else '❌'}")
+        print(f"  二値化: {BINARIZE if BINARIZE_AVAILABLE else '❌'}{' + 背景正規化' if BG_NORMALIZE else ''}")
+        print(f"  OCRバックエンド: {', '.join(self.backends.names) or '❌'}")
+        print(f"  コード・数値モード: {CODE_LANG + ' psm=' + str(CODE_PSM) if self.code_mode else '❌'}")
+        print(f"  プロファイル: {', '.join(p.name for p in self.profiles) or '-'}")
+        print(f"  コーパス記録: {CORPUS_DIR if self.recorder else '-'}")
         print()
         
     def launch_snipping_tool(self):
@@ -158,15 +251,23 @@ class WorkingOCRService:
             
         try:
             self.log("🖼️  画像前処理中...")
+            start_total = time.perf_counter()
             
             # グレースケール変換
             if img.mode != 'L':
                 img = img.convert('L')
             
+            # 傾き・向き補正（拡大前の縮小コピーで推定）
+            if DESKEW and DESKEW_AVAILABLE:
+                img, info = deskew_image(img)
+                self.last_deskew = info
+                if info.changed:
+                    self.log(f"📐 傾き補正: {info.angle}°, 回転 {info.rotation}° ({info.elapsed * 1000:.0f}ms)",
+                             "deskew", info.elapsed, angle=info.angle, rotation=info.rotation)
+            
             # サイズ拡大
             w, h = img.size
-            scale = 3
-            img = img.resize((w * scale, h * scale), Image.LANCZOS)
+            img = img.resize((w * UPSCALE, h * UPSCALE), Image.LANCZOS)
             
             # コントラスト強化
             enhancer = ImageEnhance.Contrast(img)
@@ -176,354 +277,162 @@ class WorkingOCRService:
             enhancer = ImageEnhance.Sharpness(img)
             img = enhancer.enhance(2.0)
             
-            self.log("✅ 画像前処理完了")
+            # 適応的二値化（局所閾値 → 1bit画像）
+            if (BINARIZE != "none" or BG_NORMALIZE) and BINARIZE_AVAILABLE:
+                start = time.perf_counter()
+                img = binarize_image(img, BINARIZE, BG_NORMALIZE)
+                elapsed = time.perf_counter() - start
+                self.log(f"⬛ 二値化: {BINARIZE} ({elapsed * 1000:.0f}ms)", "binarize", elapsed, method=BINARIZE)
+            
+            self.log("✅ 画像前処理完了", "preprocess", time.perf_counter() - start_total, size=list(img.size))
             return img
             
         except Exception as e:
-            self.log(f"画像前処理エラー: {e}")
+            self.log(f"画像前処理エラー: {e}", "error", stage="preprocess")
             return img
 
-    def ocr_with_pytesseract(self, img):
-        """pytesseractを使用したOCR"""
+    def is_vertical(self, img):
+        """縦書き判定（投影プロファイルと字形の縦横比のみ、OCR試行なし）"""
+        if not self.vertical_available:
+            return False
+        info = detect_vertical(np.array(img.convert('L')))
+        if info.vertical:
+            self.log(f"📜 縦書きと判定: {LANG_VERTICAL} psm={PSM_VERTICAL} "
+                     f"(列 {info.columns}, {info.elapsed * 1000:.1f}ms)", "vertical", info.elapsed, columns=info.columns)
+        return info.vertical
+
+    def is_code(self, img):
+        """コード・数値判定（等幅の半角字送りの投影のみ、OCR試行なし）"""
+        if not self.code_mode:
+            return False
+        info = detect_code(np.array(img.convert('L')))
+        if info.code:
+            self.log(f"⌨️  コード・数値と判定: {CODE_LANG} psm={CODE_PSM} "
+                     f"(ピッチ {info.pitch:.1f}px, {info.elapsed * 1000:.1f}ms)", "code", info.elapsed,
+                     pitch=round(info.pitch, 1), regularity=round(info.regularity, 2))
+        return info.code
+
+    def run_ocr(self, img):
+        """最適なバックエンドでOCR実行（自動選択・失敗時は次のバックエンドへ）"""
+        enhanced_img = self.enhance_image(img)
+        lang, psm = (LANG_VERTICAL, PSM_VERTICAL) if self.is_vertical(enhanced_img) else (LANG, PSM)
+        
+        preferred = self.backends.preferred
+        self.log(f"🔍 {preferred.name if preferred else '-'} でOCR実行中...")
         try:
-            config = f"--psm {PSM} --oem 3 -c user_defined_dpi=300"
-            text = pytesseract.image_to_string(img, lang=LANG, config=config)
-            return text.strip()
-        except Exception as e:
-            self.log(f"pytesseract OCRエラー: {e}")
+            result = self.backends.recognize(enhanced_img, lang, psm, variables=TESS_VARIABLES)
+        except BackendError as e:
+            self.log(f"OCRエラー: {e}", "error", stage="ocr")
+            self.last_result = None
             return ""
+        
+        self.last_result = result
+        self.log(f"⏱️  {result.backend}: {result.elapsed * 1000:.0f}ms", "ocr", result.elapsed,
+                 backend=result.backend, lang=lang, psm=psm, conf=round(result.mean_conf, 1))
+        return result.text.strip()
+
+    def iter_ocr(self, img):
+        """帯ごとに認識し、認識できた順に StreamChunk を返す（前処理は全体で1回）"""
+        enhanced_img = self.enhance_image(img)
+        vertical = self.is_vertical(enhanced_img)
+        lang, psm = (LANG_VERTICAL, PSM_VERTICAL) if vertical else (LANG, PSM)
+        
+        def recognize_band(band):
+            result = self.backends.recognize(band, lang, psm, variables=TESS_VARIABLES)
+            return result.text, result.mean_conf, result
+        
+        # 縦書きは横帯に切ると列が分断されるので全体を1帯で
+        first_height = enhanced_img.height if vertical else FIRST_BAND_HEIGHT
+        return iter_bands(enhanced_img, recognize_band, self.advanced_text_cleaning, first_height=first_height)
 
-    def ocr_with_direct_tesseract(self, img):
-        """Tesseractコマンド直接実行"""
+    def run_streaming_ocr(self, img, out_file):
+        """帯ごとにクリップボード・ファイルを更新し、最後に全体をクリーニングし直す（生テキスト, 最終テキスト）"""
+        chunks = []
         try:
-            # 一時ファイル保存
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            temp_file = self.temp_dir / f"ocr_{timestamp}.png"
-            img.save(str(temp_file), "PNG")
-            
-            # Tesseractコマンド実行
-            cmd = [
-                TESSERACT,
-                str(temp_file),
-                "stdout",
-                "-l", LANG,
-                "--psm", str(PSM),
-                "--oem", "3",
-                "-c", "user_defined_dpi=300"
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                timeout=30
-            )
-            
-            # 一時ファイル削除
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-            
-            if result.returncode == 0:
-                return result.stdout.strip()
-            else:
-                self.log(f"Tesseractエラー: {result.stderr}")
-                return ""
-                
-        except Exception as e:
-            self.log(f"直接Tesseract OCRエラー: {e}")
-            return ""
+            for chunk in self.iter_ocr(img):
+                chunks.append(chunk)
+                partial = partial_text(chunks)
+                if partial:
+                    pyperclip.copy(partial)
+                    out_file.write_text(partial, encoding="utf-8-sig")
+                self.log(f"📝 帯 {chunk.index + 1}/{chunk.total}: +{len(chunk.text)}文字 ({chunk.elapsed:.2f}s)",
+                         "band", chunk.result.elapsed if chunk.result else None, index=chunk.index, total=chunk.total,
+                         chars=len(chunk.text), since_start=round(chunk.elapsed, 3))
+        except BackendError as e:
+            # 認識済みの帯までは結果として残す
+            self.log(f"OCRエラー: {e}", "error", stage="ocr")
+        
+        cleaned_text, _, self.last_result = consolidate(chunks, self.advanced_text_cleaning)
+        raw_text = "\n".join(c.raw for c in chunks if c.raw.strip())
+        return raw_text.strip(), cleaned_text
 
-    def run_ocr(self, img):
-        """最適な方法でOCR実行"""
+    def run_profile_ocr(self, img, profile):
+        """プロファイル一致: 固定の前処理・lang/psm・ホワイトリストでエンジン1回（生テキスト, 最終テキスト）"""
+        def engine(pil, lang, psm, variables):
+            return self.backends.recognize(pil, lang, psm, variables=variables)
+        
+        self.log(f"🎯 プロファイル: {profile.name} (lang={profile.lang}, psm={profile.psm})")
+        try:
+            cleaned_text, result, t_pre = recognize_profile(profile, img, engine, TESS_VARIABLES,
+                                                            self.advanced_text_cleaning)
+        except BackendError as e:
+            self.log(f"OCRエラー: {e}", "error", stage="ocr", profile=profile.name)
+            self.last_result = None
+            return "", ""
+        
+        self.last_result = result
+        self.log(f"⏱️  {result.backend}: {result.elapsed * 1000:.0f}ms", "ocr", result.elapsed,
+                 backend=result.backend, lang=result.lang, psm=result.psm, conf=round(result.mean_conf, 1),
+                 profile=profile.name, preprocess_ms=round(t_pre * 1000, 1))
+        return profile.text_of(result).strip(), cleaned_text
+
+    def run_code_ocr(self, img):
+        """コード・数値モード: eng のみ・文字制限・psm 6 で1回 → コードを壊さない最小限の整形（生テキスト, 最終テキスト）"""
         enhanced_img = self.enhance_image(img)
         
-        # pytesseractが利用可能な場合は優先使用
-        if PYTESSERACT_AVAILABLE:
-            self.log("🔍 pytesseractでOCR実行中...")
-            text = self.ocr_with_pytesseract(enhanced_img)
-            if text:
-                return text
+        def engine(pil, lang, psm, variables):
+            return self.backends.recognize(pil, lang, psm, variables=variables)
         
-        # フォールバック：直接Tesseract実行
-        self.log("🔍 直接TesseractでOCR実行中...")
-        return self.ocr_with_direct_tesseract(enhanced_img)
+        try:
+            raw_text, result = recognize_code(enhanced_img, engine, TESS_VARIABLES)
+        except BackendError as e:
+            self.log(f"OCRエラー: {e}", "error", stage="ocr", mode="code")
+            self.last_result = None
+            return "", ""
+        
+        self.last_result = result
+        self.log(f"⏱️  {result.backend}: {result.elapsed * 1000:.0f}ms", "ocr", result.elapsed,
+                 backend=result.backend, lang=result.lang, psm=result.psm, conf=round(result.mean_conf, 1), mode="code")
+        
+        start = time.perf_counter()
+        cleaned_text = code_clean(raw_text)
+        self.log("✅ コード用整形完了", "clean", time.perf_counter() - start, chars=len(raw_text), mode="code")
+        return raw_text.strip("\n"), cleaned_text
 
     def advanced_text_cleaning(self, text):
-        """超強化テキストクリーニング（改行修正強化版）"""
+        """超強化テキストクリーニング（改行修正強化版）。本体は text_cleaning.clean_text（線形時間）"""
         if not text:
             return text
         
         original_length = len(text)
         self.log("📝 超強化テキストクリーニング中...")
+        start = time.perf_counter()
         
-        # 0. 特殊文字の前処理
-        text = text.replace('・:', ': ')  # ・: → : 
-        text = text.replace('、。', '。')   # 、。 → 。
-        
-        # 1. 日本語文字間スペース除去（強化版）
-        # ひらがな間（全角・半角スペース両対応）
-        text = re.sub(r'([あ-ん])[\s\u3000]+([あ-ん])', r'\1\2', text)
-        
-        # カタカナ間（長音記号・小文字含む）
-        text = re.sub(r'([ア-ヶーァィゥェォャュョッ])[\s\u3000]+([ア-ヶーァィゥェォャュョッ])', r'\1\2', text)
-        
-        # 漢字間
-        text = re.sub(r'([一-龥々〆ヵヶ])[\s\u3000]+([一-龥々〆ヵヶ])', r'\1\2', text)
-        
-        # 2. 文字種混在間のスペース除去（強化版）
-        # あらゆる日本語文字間
-        text = re.sub(r'([あ-んア-ヶーァィゥェォャュョッ一-龥々〆ヵヶ])[\s\u3000]+([あ-んア-ヶーァィゥェォャュョッ一-龥々〆ヵヶ])', r'\1\2', text)
-        
-        # 3. 英数字の調整（超強化版）
-        # 英字間のスペース除去（ただし単語境界は保持）
-        text = re.sub(r'([A-Za-z])[\s\u3000]+([A-Za-z])', r'\1\2', text)
-        
-        # 数字間のスペース除去
-        text = re.sub(r'([0-9])[\s\u3000]+([0-9])', r'\1\2', text)
-        
-        # ピリオド・ドットまわり
-        text = re.sub(r'([A-Za-z0-9])[\s\u3000]*\.[\s\u3000]*([A-Za-z0-9])', r'\1.\2', text)
-        
-        # 4. プログラミング関連の修正
-        # コマンドライン系
-        text = re.sub(r'python[\s\u3000]+\.[\s\u3000]*\\', r'python .\\', text)
-        text = re.sub(r'dir[\s\u3000]*\*[\s\u3000]*\.[\s\u3000]*py', r'dir *.py', text)
-        text = re.sub(r'ls[\s\u3000]*\*[\s\u3000]*\.[\s\u3000]*py', r'ls *.py', text)
-        text = re.sub(r'bash[\s\u3000]*#', r'bash\n#', text)
-        text = re.sub(r'#[\s\u3000]*([A-Za-z])', r'# \1', text)
-        
-        # ファイルパス修正
-        text = re.sub(r'C[\s\u3000]*:[\s\u3000]*\\[\s\u3000]*python[\s\u3000]*\\', r'C:\\python\\', text)
-        
-        # 5. 記号まわり（超強化版）
-        # 句読点前のスペース除去
-        text = re.sub(r'[\s\u3000]+([、。！？）］｝」』])', r'\1', text)
-        
-        # 開始記号後のスペース除去
-        text = re.sub(r'([（［｛「『])[\s\u3000]+', r'\1', text)
-        
-        # コロン・セミコロンまわり
-        text = re.sub(r'[\s\u3000]*:[\s\u3000]*', ': ', text)
-        text = re.sub(r'[\s\u3000]*;[\s\u3000]*', '; ', text)
-        
-        # ハッシュ（#）まわり
-        text = re.sub(r'[\s\u3000]*#[\s\u3000]*', '# ', text)
-        
-        # 6. 助詞・語尾の修正（強化版）
-        particles = ['を', 'が', 'に', 'へ', 'と', 'で', 'の', 'も', 'は', 'から', 'まで', 'より', 'こそ', 'ばかり', 'だけ', 'でも', 'など', 'として', 'について', 'に対して']
-        for particle in particles:
-            text = re.sub(rf'[\s\u3000]+{particle}', particle, text)
-        
-        # 7. 数字・記号組み合わせ
-        text = re.sub(r'(\d+)[\s\u3000]*\.[\s\u3000]*', r'\1. ', text)  # 1. → 1. 
-        text = re.sub(r'(\d+)[\s\u3000]*-[\s\u3000]*', r'\1-', text)    # 1 - → 1-
-        
-        # 8. 英語特有のパターン
-        # ファイル名・拡張子
-        text = re.sub(r'([a-zA-Z0-9_]+)[\s\u3000]*\.[\s\u3000]*([a-zA-Z]+)', r'\1.\2', text)
-        
-        # 9. ★★ 改行修正（強化版）★★
-        # 見出し・セクション境界の改行追加
-        text = re.sub(r'([。！？])([1-9]\.|仮想環境|トラブルシューティング|PowerShell|OCR|手順)', r'\1\n\n\2', text)
-        
-        # 番号付きリストの改行
-        text = re.sub(r'([。！？])([1-9]\.[^0-9])', r'\1\n\n\2', text)
-        
-        # PowerShellコードブロックの改行
-        text = re.sub(r'powershell([a-zA-Z])', r'powershell\n\1', text)
-        text = re.sub(r'([^:\n])powershell', r'\1\n\npowershell', text)
-        
-        # コマンド間の改行
-        text = re.sub(r'(\.py)([a-zA-Z#])', r'\1\n\2', text)
-        text = re.sub(r'(activate)([a-zA-Z])', r'\1\n\n\2', text)
-        
-        # bash/cmd行の修正
-        text = re.sub(r'bash[\s\u3000]*\n?[\s\u3000]*#', r'bash\n#', text)
-        
-        # セクションタイトルの前後改行
-        section_titles = [
-            '仮想環境の入り方',
-            'ディレクトリ移動', 
-            '仮想環境をアクティベート',
-            'プアクティベート',
-            '成功確認',
-            'OCRサービス実行',
-            'トラブルシューティング',
-            '仮想環境が見つからない場合'
-        ]
-        
-        for title in section_titles:
-            text = re.sub(rf'([。！？])({re.escape(title)})', r'\1\n\n\2', text)
-            text = re.sub(rf'({re.escape(title)})([あ-んア-ヶー一-龥々A-Za-z])', r'\1\n\2', text)
-        
-        # 10. 特殊ケースの修正（超強化版）
-        
-        # A. 英数字誤認識の段階的修正
-        # 数字とアルファベットの誤認識（パターンマッチング）
-        text = re.sub(r'PowerShe[1l][1l]*[+L]*', 'PowerShell', text)
-        text = re.sub(r'PowerShet[1l]*L+', 'PowerShell', text)
-        text = re.sub(r'PowerShe[1l]+L*', 'PowerShell', text)
-        text = re.sub(r'cop[1l]*[iI][1l]*[Ll]ot', 'copilot', text)
-        text = re.sub(r'cop[1l]*[Ll]ot', 'copilot', text)
-        text = re.sub(r'copli[Ll]ot', 'copilot', text)
-        text = re.sub(r'copilote?', 'copilot', text)
-        
-        # B. 具体的な文字置換
-        char_misrecognition_fixes = {
-            # PowerShell系
-            'PowerShe1+L': 'PowerShell',
-            'PowerShe11L': 'PowerShell', 
-            'PowerSheLl': 'PowerShell',
-            'PowerSheLLL': 'PowerShell',
-            'PowerShetLL': 'PowerShell',
-            'powersheLl': 'powershell',
-            'powershe11': 'powershell',
-            
-            # copilot系  
-            'cop1iLot': 'copilot',
-            'cop11Lot': 'copilot',
-            'cop1Lot': 'copilot',
-            'copliLot': 'copilot',
-            'copilote': 'copilot',
-            'Copilot': 'Copilot',
-            
-            # コマンド系
-            'cdC:': 'cd C:',
-            'cd C:': 'cd C:',
-            'python': 'python',
-            '.py': '.py',
-            'py >': '.py →',
-            '.py >': '.py →',
-            
-            # パス系
-            'C:\\python': 'C:\\python',
-            'C:\python': 'C:\\python',
-            '\\python': '\\python',
-            'ocr_env': 'ocr_env',
-            'Scripts': 'Scripts', 
-            'activate': 'activate',
-            
-            # 記号系
-            '—': '→',
-            '©': '・',
-            'OS': '→',
-            '|': '',
-            
-            # よくある誤認識
-            'ユコードブロック': 'コードブロック',
-            'ププロンプト': 'プロンプト',
-            'アクテンーファ': 'アクティベート',
-            'アクティベート': 'アクティベート',
-            '成功確認': '成功確認',
-            'CKITIZLESEICAREИТ': '改行修正強化版を実行',
-            'IE L UID P INECH T': '正しいファイル名で実行してください',
-            '武存の': '現在の',
-            'ディルクムソ': 'ディレクトリ',
-            'たは': 'または',
-            'もるし': 'もしくは',
-            'プアクティベート': 'アクティベート',
-            'WOES': '成功確認',
-            'プブロンプト': 'プロンプト',
-            'ELLAOBAReSIT': '修正済みの高精度版を実行',
-            'F7z=IMBON-LDay': 'または他のバージョン',
-        }
-        
-        # 文字単位の修正を実行
-        for wrong, correct in char_misrecognition_fixes.items():
-            text = text.replace(wrong, correct)
-        
-        # C. プログラミング特化修正（正規表現）
-        programming_fixes = [
-            # Pythonコマンド修正
-            (r'python[\s]*\.[\s]*py', r'python *.py'),
-            (r'python[\s]*\.[\s]*\\', r'python .\\'),
-            (r'python[\s]*\.[\s]*working_ocr_service[\s]*\.[\s]*py', r'python .\\working_ocr_service.py'),
-            
-            # ファイルパス修正
-            (r'C[\s]*:[\s]*\\[\s]*python', r'C:\\python'),
-            (r'ocr_env[\s]*\\[\s]*Scripts[\s]*\\[\s]*activate', r'ocr_env\\Scripts\\activate'),
-            
-            # bash/powershell修正
-            (r'bash[\s]*\n?[\s]*#', r'bash\n#'),
-            (r'bash[\s]*python', r'bash\npython'),
-            (r'powershell[\s]*\n?[\s]*([a-zA-Z])', r'powershell\n\1'),
-            
-            # 拡張子・ファイル名修正
-            (r'\.[\s]*py[\s]*>', r'.py →'),
-            (r'\.[\s]*py', r'.py'),
-            (r'\.[\s]*txt', r'.txt'),
-            (r'\.[\s]*exe', r'.exe'),
-            
-            # コマンド区切り修正
-            (r'(\.py)([a-zA-Z])', r'\1\n\2'),
-            (r'(activate)([a-zA-Z])', r'\1\n\n\2'),
-        ]
-        
-        for pattern, replacement in programming_fixes:
-            text = re.sub(pattern, replacement, text)
-        
-        # D. クォート・括弧内の文字列修正
-        quote_fixes = [
-            # Python辞書形式の修正
-            (r'[|｜][\s]*[\'\"]*([^\'\"\n]+)[\'\"]*[\s]*[:\:][\s]*[\'\"]*([^\'\"\n]+)[\'\"]*', r"'\1': '\2'"),
-            (r'「([^」]+)」[\s]*:[\s]*「([^」]+)」', r"'\1': '\2'"),
-            (r'「([^」]+)」[\s]*,', r"'\1',"),
-            
-            # 一般的なクォート修正
-            (r'「([^」]+)」', r'\1'),
-            (r'『([^』]+)』', r'\1'),
-            (r'[\'\"]+([^\'\"\n]+)[\'\"]+[\s]*:[\s]*[\'\"]+([^\'\"\n]+)[\'\"]+', r"'\1': '\2'"),
-        ]
-        
-        for pattern, replacement in quote_fixes:
-            text = re.sub(pattern, replacement, text)
-        
-        # E. 矢印・記号の統一
-        arrow_fixes = [
-            (r'[—–−]', r'→'),
-            (r'>', r'→'),
-            (r'[\s]*→[\s]*', r' → '),
-            (r'\.py[\s]*→[\s]*py', r'.py → .py'),
-        ]
-        
-        for pattern, replacement in arrow_fixes:
-            text = re.sub(pattern, replacement, text)
-        
-        # 11. 行単位清掃（強化版）
-        lines = []
-        for line in text.splitlines():
-            line = line.strip()
-            if line:  # 空行でない場合のみ
-                # 行内の重複スペース除去
-                line = re.sub(r'[\s\u3000]{2,}', ' ', line)
-                lines.append(line)
-        
-        text = '\n'.join(lines)
-        
-        # 12. 最終的な改行構造の整理
-        # 重複改行の整理（ただし構造的改行は保持）
-        text = re.sub(r'\n{4,}', '\n\n\n', text)  # 4個以上の改行を3個に
-        text = re.sub(r'\n{3}', '\n\n', text)     # 3個の改行を2個に
-        
-        # 13. 最終調整
-        # 全角スペースを半角に統一
-        text = text.replace('\u3000', ' ')
-        
-        # 行頭・行末の空白除去
-        text = '\n'.join(line.strip() for line in text.splitlines())
-        
-        # 文全体の前後空白除去
-        text = text.strip()
+        # 大きな入力は段落境界で分割してプロセス並列（結果は逐次と同じ）
+        parallel = len(text) >= PARALLEL_MIN_CHARS
+        if parallel:
+            text = clean_text_parallel(text, LEXICON_PATHS)
+        else:
+            text = clean_text(text, self.lexicon)
+        elapsed = time.perf_counter() - start
         
         # クリーニング結果
         cleaned_chars = original_length - len(text)
         if cleaned_chars > 0:
-            self.log(f"✅ 超強化クリーニング完了: {cleaned_chars}文字削除")
+            self.log(f"✅ 超強化クリーニング完了: {cleaned_chars}文字削除", "clean", elapsed,
+                     chars=original_length, removed=cleaned_chars, parallel=parallel)
         else:
-            self.log("ℹ️  クリーニング: 変更なし")
+            self.log("ℹ️  クリーニング: 変更なし", "clean", elapsed, chars=original_length, parallel=parallel)
         
         return text
 
@@ -540,37 +449,111 @@ class WorkingOCRService:
             self.log("❌ 画像取得に失敗しました")
             return
         
-        # 3. OCR実行
-        raw_text = self.run_ocr(img)
+        self.process_image(img)
+
+    def profile_flow(self, profile):
+        """プロファイルの領域を直接キャプチャしてOCR（スニッピングツールなし）"""
+        img = grab_region(profile)
+        if img is None:
+            self.log(f"❌ プロファイル {profile.name} に領域がありません")
+            return
+        self.process_image(img, profile)
+
+    def process_image(self, img, profile=None):
+        """取得した画像のOCR → クリーニング → クリップボード・ファイル出力"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_file = OUT_DIR / f"working_ocr_{timestamp}.txt"
+        flow_start = time.perf_counter()
+        self.last_deskew = None
+        
+        if profile is None and self.profiles:
+            profile = match_profile(self.profiles, img.size)
+        
+        # 3. OCR実行 + 4. テキストクリーニング（大きな画像は帯ごとに途中結果を出す）
+        # コードは eng の1回で速いので帯分割しない
+        code = profile is None and self.is_code(img)
+        streamed = profile is None and not code and STREAMING and STREAMING_AVAILABLE and img.height >= STREAM_MIN_HEIGHT
+        if profile is not None:
+            raw_text, cleaned_text = self.run_profile_ocr(img, profile)
+        elif code:
+            raw_text, cleaned_text = self.run_code_ocr(img)
+        elif streamed:
+            raw_text, cleaned_text = self.run_streaming_ocr(img, out_file)
+        else:
+            raw_text = self.run_ocr(img)
+            if raw_text and self.code_mode and looks_like_code(raw_text):
+                # 1回目の結果がコード・パス・数値らしい → 日本語向けの補正ルールで壊さないようコードモードで読み直す
+                self.log("⌨️  1回目の結果がコード・数値らしいためコードモードで再認識", "code")
+                first_text, first_result = raw_text, self.last_result
+                raw_text, cleaned_text = self.run_code_ocr(img)
+                code = bool(raw_text) and (first_result is None or self.last_result.mean_conf >= first_result.mean_conf)
+                if not code:
+                    # 読み直しが失敗・低信頼なら1回目の結果を使う
+                    self.log("⌨️  コードモードの結果を採用せず1回目の結果を使用", "code")
+                    raw_text, self.last_result = first_text, first_result
+                    cleaned_text = self.advanced_text_cleaning(raw_text)
+            else:
+                cleaned_text = self.advanced_text_cleaning(raw_text) if raw_text else ""
         if not raw_text:
-            self.log("❌ OCRでテキストを取得できませんでした")
+            self.log("❌ OCRでテキストを取得できませんでした", "flow", time.perf_counter() - flow_start,
+                     size=list(img.size), chars=0)
             return
         
-        # 4. テキストクリーニング
-        cleaned_text = self.advanced_text_cleaning(raw_text)
-        
         # 5. クリップボードにコピー
         pyperclip.copy(cleaned_text)
         self.log("📋 クリップボードにコピーしました")
         
         # 6. ファイル保存
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_file = OUT_DIR / f"working_ocr_{timestamp}.txt"
         
         # メタデータ付きで保存
         metadata = f"# 確実動作OCR結果 - {timestamp}\n"
         metadata += f"# 原文字数: {len(raw_text)}\n"
         metadata += f"# クリーニング後: {len(cleaned_text)}\n"
-        metadata += f"# 使用機能: PIL={PIL_AVAILABLE}, NumPy={NUMPY_AVAILABLE}, pytesseract={PYTESSERACT_AVAILABLE}\n\n"
+        metadata += f"# 使用機能: PIL={PIL_AVAILABLE}, NumPy={NUMPY_AVAILABLE}, pytesseract={PYTESSERACT_AVAILABLE}\n"
+        if profile is not None:
+            metadata += f"# プロファイル: {profile.name}\n"
+        if self.last_result is not None:
+            metadata += f"# バックエンド: {self.last_result.backend} ({self.last_result.elapsed * 1000:.0f}ms)\n"
+        metadata += "\n"
         
         content = metadata + cleaned_text
         out_file.write_text(content, encoding="utf-8-sig")
         
+        # 構造化出力（認識済みの結果から生成、エンジン再実行なし）
+        # 傾き・向き補正した場合は座標を補正前に戻す（プロファイルの deskew は戻せないので省略）
+        if EXPORT_FORMATS and self.last_result is not None and profile is not None and profile.deskews:
+            self.log("🗂️  構造化出力: プロファイルの前処理に deskew があるため座標を戻せず省略")
+        elif EXPORT_FORMATS and self.last_result is not None:
+            deskew = self.last_deskew
+            try:
+                written = write_exports(self.last_result, out_file, EXPORT_FORMATS,
+                                        scale=profile.scale if profile else UPSCALE, page_size=img.size,
+                                        unmap=deskew.unmap if deskew is not None and deskew.changed else None)
+                self.log(f"🗂️  構造化出力: {', '.join(p.name for p in written)}")
+            except (OSError, ValueError) as e:
+                self.log(f"構造化出力エラー: {e}", "error", stage="export")
+        
         # 7. メモ帳で開く
         self.open_notepad(out_file)
         
-        self.log(f"✅ OCR完了！ 文字数: {len(cleaned_text)}")
+        self.log(f"✅ OCR完了！ 文字数: {len(cleaned_text)}", "flow", time.perf_counter() - flow_start,
+                 size=list(img.size), chars=len(cleaned_text), file=out_file.name,
+                 profile=profile.name if profile else None, mode="code" if code else "text")
         self.log(f"📁 ファイル: {out_file.name}")
+        
+        if self.recorder is not None:
+            self.record_capture(img, profile, streamed, code, raw_text, cleaned_text, time.perf_counter() - flow_start)
+
+    def record_capture(self, img, profile, streamed, code, raw_text, cleaned_text, elapsed):
+        """元画像・設定・結果をコーパスに記録（圧縮・書き込みは別スレッド）"""
+        config = {"lang": LANG, "psm": PSM, "upscale": UPSCALE, "deskew": DESKEW, "binarize": BINARIZE,
+                  "bg_normalize": BG_NORMALIZE, "variables": TESS_VARIABLES, "streaming": streamed, "code": code,
+                  "profile": asdict(profile) if profile else None,
+                  "backend": self.last_result.backend if self.last_result else None}
+        try:
+            self.recorder.record(img, "service", config, raw_text, cleaned_text, elapsed)
+        except RuntimeError as e:
+            self.log(f"コーパス記録エラー: {e}", "error", stage="corpus")
 
     def open_notepad(self, file_path):
         """メモ帳で開く"""
@@ -579,11 +562,17 @@ class WorkingOCRService:
         except Exception as e:
             self.log(f"メモ帳起動エラー: {e}")
 
-    def log(self, message):
-        """ログ出力"""
-        if not sys.executable.endswith('pythonw.exe'):
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            print(f"[{timestamp}] {message}")
+    def log(self, message, event="message", duration=None, **fields):
+        """ログ出力（リングバッファに積むだけ。コンソール・ファイルへは書き込みスレッドが出力）"""
+        self.logger.event(event, message, duration, **fields)
+
+    def dump_log(self):
+        """直近のログイベントをファイルに書き出す"""
+        try:
+            path = self.logger.dump(LOG_DUMP_EVENTS)
+            self.log(f"🧾 直近 {LOG_DUMP_EVENTS} 件のログを書き出しました: {path}")
+        except OSError as e:
+            self.log(f"ログ書き出しエラー: {e}", "error")
 
     def cleanup_temp_files(self):
         """一時ファイル削除"""
@@ -598,6 +587,10 @@ class WorkingOCRService:
         self.log("🛑 確実動作OCRサービスを終了しています...")
         self.running = False
         self.cleanup_temp_files()
+        shutdown_pool()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.logger.close()
         
         try:
             keyboard.unhook_all()
@@ -610,11 +603,19 @@ class WorkingOCRService:
         """サービス実行"""
         print("🚀 確実動作OCRサービス開始")
         print("⌨️  ホットキー: Ctrl+Alt+S でOCR実行")
+        print("🧾 直近ログ書き出し: Ctrl+Alt+L")
         print("🛑 終了: Ctrl+Alt+Q または Ctrl+C")
+        print(f"📒 ログ: {LOG_FILE}")
         print()
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
         
         # ホットキー登録
         keyboard.add_hotkey("ctrl+alt+s", self.ocr_flow)
+        keyboard.add_hotkey("ctrl+alt+l", self.dump_log)
+        for profile in self.profiles:
+            if profile.hotkey:
+                keyboard.add_hotkey(profile.hotkey, self.profile_flow, args=(profile,))
+                print(f"🎯 {profile.hotkey}: プロファイル {profile.name}")
         keyboard.add_hotkey("ctrl+alt+q", self.quit_service)
         
         try: